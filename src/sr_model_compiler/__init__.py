@@ -6,6 +6,8 @@ from .sr_model_compiler import sr_model_compiler
 from .sr_model_compiler import sr_check_model
 from .sr_model_compiler import sr_get_compile_log
 from .sr100_model_optimizer import sr100_model_optimizer
+from .preflight import sr_preflight_check
+from .arena_planner import sr_plan_arena
 
 __all__ = [
     "call_shell_cmd",
@@ -14,4 +16,6 @@ __all__ = [
     "sr_check_model",
     "sr_default_config",
     "sr100_model_optimizer",
+    "sr_preflight_check",
+    "sr_plan_arena",
 ]
@@ -0,0 +1,220 @@
+"""Offline tensor arena planning from the model's execution order"""
+
+import argparse
+from .model_info import load_model_index, read_model_info
+
+# TFLM aligns every arena buffer to 16 bytes
+ARENA_ALIGNMENT = 16
+
+
+def align(value, alignment=ARENA_ALIGNMENT):
+    """Rounds a value up to the alignment"""
+
+    return (value + alignment - 1) // alignment * alignment
+
+
+def get_live_ranges(subgraph):
+    """
+    Gets the first and last operator index each arena tensor is live for.
+
+    Graph inputs are live from the first operator, graph outputs until the
+    last one. Constant tensors live in the model and are not planned.
+    """
+
+    tensors = subgraph["tensors"]
+    num_operators = len(subgraph["operators"])
+    live_ranges = {}
+
+    def use(index, step):
+        if index < 0 or tensors[index]["is_constant"]:
+            return
+        first, last = live_ranges.get(index, (step, step))
+        live_ranges[index] = (min(first, step), max(last, step))
+
+    for index in subgraph["inputs"]:
+        use(index, 0)
+    for step, operator in enumerate(subgraph["operators"]):
+        for index in operator["inputs"] + operator["outputs"]:
+            use(index, step)
+    for index in subgraph["outputs"]:
+        use(index, max(num_operators - 1, 0))
+
+    return live_ranges
+
+
+def plan_arena(subgraph):  # pylint: disable=R0914
+    """
+    Places the arena tensors with a greedy by size planner, the same
+    strategy as the TFLM GreedyMemoryPlanner: tensors with an offline offset
+    from vela are fixed first, then the largest remaining tensors, each at
+    the lowest aligned offset that does not overlap a tensor whose live
+    range intersects its own.
+
+    Returns:
+        list: One dict per tensor with its index, name, size, offset and
+            first/last operator.
+    """
+
+    tensors = subgraph["tensors"]
+    live_ranges = get_live_ranges(subgraph)
+    offline_offsets = subgraph.get("offline_offsets") or []
+
+    def placement(index, offset):
+        first, last = live_ranges[index]
+        return {
+            "index": index,
+            "name": tensors[index]["name"],
+            "size": tensors[index]["size"],
+            "offset": offset,
+            "first": first,
+            "last": last,
+        }
+
+    # Vela already placed its scratch areas and the tensors inside them
+    placed = [
+        placement(index, offline_offsets[index])
+        for index in live_ranges
+        if index < len(offline_offsets) and offline_offsets[index] >= 0
+    ]
+    offline = {p["index"] for p in placed}
+
+    order = sorted(
+        (i for i in live_ranges if i not in offline),
+        key=lambda i: (-tensors[i]["size"], i),
+    )
+    for index in order:
+        first, last = live_ranges[index]
+        size = align(tensors[index]["size"])
+
+        # Buffers live at the same time, sorted by offset
+        conflicts = sorted(
+            (p["offset"], p["offset"] + align(p["size"]))
+            for p in placed
+            if p["first"] <= last and first <= p["last"]
+        )
+        offset = 0
+        for start, end in conflicts:
+            if offset + size <= start:
+                break
+            offset = max(offset, end)
+
+        placed.append(placement(index, offset))
+
+    return sorted(placed, key=lambda p: (p["offset"], p["index"]))
+
+
+def get_covered_bytes(placements):
+    """Gets the arena bytes covered by placements, counting aliases once"""
+
+    covered = 0
+    end = 0
+    for p in sorted(placements, key=lambda p: p["offset"]):
+        start = max(p["offset"], end)
+        end = max(end, p["offset"] + p["size"])
+        covered += max(end - start, 0)
+    return covered
+
+
+def get_arena_timeline(subgraph, plan):
+    """Gets the live bytes and arena high water mark at each operator"""
+
+    timeline = []
+    for step, operator in enumerate(subgraph["operators"]):
+        live = [p for p in plan if p["first"] <= step <= p["last"]]
+        timeline.append(
+            {
+                "operator": step,
+                "opcode": operator["opcode"],
+                "live_tensors": len(live),
+                "live_bytes": get_covered_bytes(live),
+                "high_water": max(
+                    (p["offset"] + align(p["size"]) for p in live), default=0
+                ),
+            }
+        )
+    return timeline
+
+
+def sr_plan_arena(model_file, model_info=None):
+    """
+    Plans the tensor arena of the main subgraph of a model, either the
+    original model or the vela output with its custom operator.
+
+    Returns:
+        dict: The peak arena size, the tensor placements and the per
+            operator memory timeline.
+    """
+
+    if model_info is None:
+        model_info = read_model_info(model_file)
+    subgraph = model_info["subgraphs"][0]
+
+    plan = plan_arena(subgraph)
+    timeline = get_arena_timeline(subgraph, plan)
+    return {
+        "arena_size": max((p["offset"] + align(p["size"]) for p in plan), default=0),
+        "peak_live_bytes": max((t["live_bytes"] for t in timeline), default=0),
+        "tensors": plan,
+        "timeline": timeline,
+    }
+
+
+def print_arena_report(arena, timeline=False):
+    """Prints the arena size and optionally the per operator timeline"""
+
+    print(
+        f"++ Tensor arena: {arena['arena_size']} bytes planned,"
+        f" {arena['peak_live_bytes']} bytes peak live,"
+        f" {len(arena['tensors'])} tensors"
+    )
+    if timeline:
+        print(f"{'op':>5} {'opcode':<24} {'tensors':>7} {'live':>10} {'high':>10}")
+        for t in arena["timeline"]:
+            print(
+                f"{t['operator']:>5} {t['opcode']:<24} {t['live_tensors']:>7}"
+                f" {t['live_bytes']:>10} {t['high_water']:>10}"
+            )
+        print(f"{'offset':>10} {'size':>10} {'ops':>11} name")
+        for p in arena["tensors"]:
+            print(
+                f"{p['offset']:>10} {p['size']:>10}"
+                f" {p['first']:>5}-{p['last']:<5} {p['name']}"
+            )
+
+
+def get_arena_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Plan the TFLM tensor arena of a TFLite model offline."
+    )
+    parser.add_argument(
+        "-m", "--model-file", type=str, help="Path to TFLite model file", required=True
+    )
+    parser.add_argument(
+        "--timeline",
+        action="store_true",
+        help="Print the per operator memory timeline and tensor placements",
+    )
+    parser.add_argument(
+        "--vmem-size-limit", type=int, default=1536000, help="Set vmem size limit"
+    )
+    return parser
+
+
+def main():
+    """Main for the command line arena planner"""
+    parser = get_arena_argparser()
+    args = parser.parse_args()
+
+    arena = sr_plan_arena(args.model_file, load_model_index(args.model_file))
+    print_arena_report(arena, args.timeline)
+
+    if arena["arena_size"] > args.vmem_size_limit:
+        print(f"ERROR:: Tensor arena does not fit in {args.vmem_size_limit} bytes")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    main()
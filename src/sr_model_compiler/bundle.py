@@ -0,0 +1,387 @@
+"""Compiles every enabled use case into one firmware bundle"""
+
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from jinja2 import Environment, FileSystemLoader
+from .generate_micro_mutable_op_resolver_from_model import (
+    generate_micro_mutable_ops_resolver_header,
+)
+from .metrics import add_metrics_arguments, set_queue_depth
+from .model_info import load_model_index
+from .results_db import record_compile_results
+from .sr_model_compiler import (
+    sr_model_compiler,
+    sr_check_model,
+    get_args_from_call,
+    get_compiler_argparser,
+    get_model_types,
+)
+from .utils import write_file_if_changed
+
+BUNDLE_MANIFEST_FILE = "bundle_manifest.json"
+
+# Placements tried in order when no system config is given, fastest first
+PLACEMENT_ORDER = [
+    "sr100_npu_400MHz_all_vmem",
+    "sr100_npu_400MHz_tensor_vmem_weights_lpmem",
+    "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz",
+]
+
+
+def get_kconfig_symbol(kconfig_file):
+    """Gets the first config symbol a use case kconfig defines"""
+
+    with open(kconfig_file, "r", encoding="utf-8") as fp:
+        for line in fp:
+            match = re.match(r"\s*config\s+(\w+)", line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def load_enabled_symbols(config_file):
+    """Gets the symbols set to y in a Kconfig .config or defconfig file"""
+
+    enabled = set()
+    with open(config_file, "r", encoding="utf-8") as fp:
+        for line in fp:
+            match = re.match(r"\s*(?:CONFIG_)?(\w+)=y\s*$", line)
+            if match:
+                enabled.add(match.group(1))
+    return enabled
+
+
+def find_use_cases(models_dir, enabled=None):
+    """
+    Finds the use case directories, the ones with a kconfig, and their models.
+
+    Args:
+        models_dir (str): Directory holding one directory per use case.
+        enabled (set): The enabled config symbols, all use cases when None.
+
+    Returns:
+        list: One dict per use case with its name, symbol and models.
+    """
+
+    use_cases = []
+    for kconfig_file in sorted(glob.glob(f"{models_dir}/*/kconfig")):
+        symbol = get_kconfig_symbol(kconfig_file)
+        if enabled is not None and symbol not in enabled:
+            continue
+        use_case_dir = os.path.dirname(kconfig_file)
+        use_cases.append(
+            {
+                "name": os.path.basename(use_case_dir),
+                "symbol": symbol,
+                "models": sorted(glob.glob(f"{use_case_dir}/*.tflite")),
+            }
+        )
+    return use_cases
+
+
+def compile_bundle_model(kwargs):
+    """
+    Compiles one bundle model, runs in a worker process. Without a system
+    config the first placement in PLACEMENT_ORDER that fits is used, only
+    the chosen placement goes into the results db and metrics.
+    """
+
+    if kwargs["system_config"]:
+        return sr_check_model(sr_model_compiler(**kwargs))
+
+    for system_config in PLACEMENT_ORDER:
+        placement = dict(
+            kwargs, system_config=system_config, results_db=None, metrics_file=None
+        )
+        results = sr_model_compiler(**placement)
+        check = sr_check_model(results)
+        if check[0]:
+            break
+    if results is not None:
+        record_compile_results(
+            get_args_from_call(
+                parser=get_compiler_argparser(),
+                **dict(kwargs, system_config=system_config),
+            ),
+            results,
+            check,
+        )
+    return check
+
+
+def gen_bundle_resolver(args, model_files, license_header):
+    """
+    Generates one resolver with the union of the operators of all models.
+
+    Returns:
+        tuple: (resolver file, sorted operator list)
+    """
+
+    generate_micro_mutable_ops_resolver_header(
+        args.output_dir,
+        [os.path.relpath(f, args.output_dir) for f in model_files],
+        args.output_dir,
+        args.namespace,
+        license_header,
+    )
+
+    # Turn the resolver into a standalone source file
+    hpp_file = f"{args.output_dir}/{args.namespace}_micro_mutable_op_resolver.hpp"
+    with open(hpp_file, "r", encoding="utf-8") as fp:
+        resolver_code = fp.read()
+    os.remove(hpp_file)
+
+    resolver_file = f"{args.output_dir}/{args.namespace}_resolver.cc"
+    write_file_if_changed(
+        resolver_file,
+        license_header
+        + "\n\n"
+        + '#include "tensorflow/lite/micro/micro_mutable_op_resolver.h"\n\n'
+        + resolver_code,
+    )
+
+    operators = set()
+    for model_file in model_files:
+        operators.update(load_model_index(model_file)["operator_codes"])
+
+    return resolver_file, sorted(operators)
+
+
+def get_bundle_entry(use_case, model_file, output_dir, check):
+    """Gets the manifest entry of a compiled model"""
+
+    success, perf_data = check
+    stem = Path(model_file).stem
+    entry = {
+        "use_case": use_case["name"],
+        "symbol": use_case["symbol"],
+        "model": os.path.abspath(model_file),
+        "namespace": stem,
+        "success": success,
+        "files": [
+            f"{output_dir}/{stem}.cc",
+            f"{output_dir}/{stem}_metadata.hpp",
+            f"{output_dir}/{stem}.bin",
+        ],
+    }
+    if perf_data and perf_data["cycles_npu"]:
+        entry["placement"] = {
+            key: perf_data.get(key)
+            for key in [
+                "system_config",
+                "model_loc",
+                "weights_size",
+                "arena_cache_size",
+                "tensor_arena_size",
+                "vmem_size",
+                "lpmem_size",
+                "flash_size",
+            ]
+        }
+        entry["cycles_npu"] = perf_data["cycles_npu"]
+        entry["inference_time"] = perf_data["inference_time"]
+    return entry
+
+
+def bundle_main(args):  # pylint: disable=R0914
+    """Compiles the bundle, returns the bundle manifest"""
+
+    enabled = load_enabled_symbols(args.config) if args.config else None
+    use_cases = find_use_cases(args.models_dir, enabled)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Every model gets its own output dir and namespace
+    jobs = []
+    for use_case in use_cases:
+        for model_file in use_case["models"]:
+            stem = Path(model_file).stem
+            jobs.append(
+                (
+                    use_case,
+                    model_file,
+                    f"{args.output_dir}/{stem}",
+                    {
+                        "model_file": model_file,
+                        "output_dir": f"{args.output_dir}/{stem}",
+                        "model_namespace": stem,
+                        "model_file_out": stem,
+                        "system_config": args.system_config,
+                        "arena_cache_size": args.arena_cache_size,
+                        "vmem_size_limit": args.vmem_size_limit,
+                        "lpmem_size_limit": args.lpmem_size_limit,
+                        "script": ["model"],
+                        "shared_resolver": True,
+                        "force": args.force,
+                        "results_db": args.results_db,
+                        "results_tag": args.results_tag,
+                        "metrics_file": args.metrics_file,
+                    },
+                )
+            )
+
+    print(f"++ Bundling {len(jobs)} models from {len(use_cases)} use cases")
+    if args.metrics_file:
+        set_queue_depth(args.metrics_file, len(jobs))
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(compile_bundle_model, job[3]) for job in jobs]
+
+        # The compiles still waiting or running, for the metrics
+        for done, _ in enumerate(as_completed(futures), 1):
+            if args.metrics_file:
+                set_queue_depth(args.metrics_file, len(jobs) - done)
+        checks = [future.result() for future in futures]
+
+    models = [
+        get_bundle_entry(use_case, model_file, output_dir, check)
+        for (use_case, model_file, output_dir, _), check in zip(jobs, checks)
+    ]
+
+    # One resolver for every model that compiled
+    script_dir = Path(__file__).parent
+    env = Environment(
+        loader=FileSystemLoader(script_dir / "templates"),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    # No timestamp, the resolver only changes with its operators
+    license_header = env.get_template("header_template.txt").render(
+        file_name=BUNDLE_MANIFEST_FILE
+    )
+    vela_files = [
+        f"{output_dir}/{Path(model_file).stem}_vela.tflite"
+        for (_, model_file, output_dir, _), entry in zip(jobs, models)
+        if entry["success"]
+    ]
+    resolver_file, operators = None, []
+    if vela_files:
+        resolver_file, operators = gen_bundle_resolver(args, vela_files, license_header)
+
+    manifest = {
+        "namespace": args.namespace,
+        "use_cases": [u["name"] for u in use_cases],
+        "resolver": {"file": resolver_file, "operators": operators},
+        "models": models,
+        "totals": {
+            key: sum(m["placement"][key] for m in models if m["success"])
+            for key in ["vmem_size", "lpmem_size", "flash_size"]
+        },
+    }
+    write_file_if_changed(
+        f"{args.output_dir}/{BUNDLE_MANIFEST_FILE}", json.dumps(manifest, indent=2)
+    )
+    return manifest
+
+
+def sr_model_bundle(**kwargs):
+    """Python entry functions for the call"""
+
+    parser = get_bundle_argparser()
+    args = get_args_from_call(parser=parser, **kwargs)
+    return bundle_main(args)
+
+
+def get_bundle_argparser():
+    """Parse command line arguments"""
+
+    model_types, _ = get_model_types()
+
+    parser = argparse.ArgumentParser(
+        description="Compile all enabled use cases into one firmware bundle."
+    )
+    parser.add_argument(
+        "-d",
+        "--models-dir",
+        type=str,
+        required=True,
+        help="Directory with one directory and kconfig per use case",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="Kconfig .config file selecting the enabled use cases, default all",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        default="bundle",
+        help="Directory to output generated files",
+    )
+    parser.add_argument(
+        "--namespace",
+        type=str,
+        default="bundle",
+        help="Sets the namespace of the shared resolver",
+    )
+    parser.add_argument(
+        "--system-config",
+        type=str,
+        choices=list(model_types.keys()),
+        help="Sets the system config of every model, default the fastest that fits",
+    )
+    parser.add_argument(
+        "--arena-cache-size",
+        type=int,
+        default=1024000,
+        help="Sets the model arena cache size in bytes",
+    )
+    parser.add_argument(
+        "--vmem-size-limit", type=int, default=1536000, help="Sets limit for vmem"
+    )
+    parser.add_argument(
+        "--lpmem-size-limit", type=int, default=1536000, help="Sets limit for lpmem"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of models compiled in parallel",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun every stage even when its inputs are unchanged",
+    )
+    parser.add_argument(
+        "--results-db",
+        type=str,
+        help="Append the results of every compile to this SQLite database",
+    )
+    parser.add_argument(
+        "--results-tag",
+        type=str,
+        help="Label stored with the results, such as a commit or build name",
+    )
+    add_metrics_arguments(parser)
+    return parser
+
+
+def main():
+    """Main for the command line bundler"""
+    parser = get_bundle_argparser()
+    args = parser.parse_args()
+
+    manifest = bundle_main(args)
+
+    print(f"++ Resolver {manifest['resolver']['file']}")
+    print(f"   {', '.join(manifest['resolver']['operators'])}")
+    failed = [m for m in manifest["models"] if not m["success"]]
+    for model in manifest["models"]:
+        status = "ok" if model["success"] else "FAILED"
+        loc = model.get("placement", {}).get("model_loc")
+        print(f"   {status:<6} {model['use_case']:<28} {model['namespace']} ({loc})")
+    if failed:
+        print(f"ERROR:: {len(failed)} models did not fit")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""Calibrates the vela latency estimates against measured latencies"""
+
+import os
+import csv
+import sys
+import json
+import glob
+import argparse
+from .layer_diff import get_summary
+from .perf_baseline import get_per_layer_report
+from .utils import write_file_if_changed
+
+CALIBRATION_VERSION = 1
+
+# Operators with the same cost behaviour share a correction factor
+OP_CLASSES = {
+    "CONV_2D": "conv",
+    "TRANSPOSE_CONV": "conv",
+    "DEPTHWISE_CONV_2D": "depthwise",
+    "FULLY_CONNECTED": "fully_connected",
+    "AVERAGE_POOL_2D": "pool",
+    "MAX_POOL_2D": "pool",
+    "ADD": "elementwise",
+    "SUB": "elementwise",
+    "MUL": "elementwise",
+    "MAXIMUM": "elementwise",
+    "MINIMUM": "elementwise",
+}
+
+
+def get_op_class(operator):
+    """Gets the class of a TFLite operator"""
+
+    return OP_CLASSES.get(operator, "other")
+
+
+def load_measurements(measured_file):
+    """
+    Reads measured latencies, a CSV with model, system_config and measured_us
+    columns, and an optional layer column for per layer measurements.
+
+    Returns:
+        list: One dict per row.
+    """
+
+    with open(measured_file, "r", newline="", encoding="utf-8") as fp:
+        return [
+            {
+                "model": row["model"],
+                "system_config": row["system_config"],
+                "layer": row.get("layer") or None,
+                "measured_us": float(row["measured_us"]),
+            }
+            for row in csv.DictReader(fp)
+        ]
+
+
+def find_estimates(compile_outputs):
+    """
+    Finds the vela summaries and per layer reports under compile output
+    directories.
+
+    Returns:
+        dict: (model, system config) to the estimated time in us, the core
+            clock and the per layer report when there is one.
+    """
+
+    estimates = {}
+    for compile_output in compile_outputs:
+        pattern = f"{compile_output}/**/*_summary_*.csv"
+        for summary_file in sorted(glob.glob(pattern, recursive=True)):
+            summary = get_summary(summary_file)
+            per_layer_file = os.path.join(
+                os.path.dirname(summary_file), f"{summary['network']}_per-layer.csv"
+            )
+            estimates[(summary["network"], summary["system_config"])] = {
+                "estimated_us": float(summary["inference_time"]) * 1e6,
+                "core_clock": float(summary["core_clock"]),
+                "per_layer": (
+                    get_per_layer_report(per_layer_file)
+                    if os.path.exists(per_layer_file)
+                    else None
+                ),
+            }
+    return estimates
+
+
+def fit_calibration(measurements, estimates):
+    """
+    Fits one correction factor per system config from the whole model
+    latencies, and one per system config and operator class from the per
+    layer latencies. Factors are ratios of summed measured over summed
+    estimated time, so long layers and models weigh the most.
+
+    Returns:
+        dict: The calibration, with the samples behind every factor.
+    """
+
+    totals = {}
+    classes = {}
+    for m in measurements:
+        estimate = estimates.get((m["model"], m["system_config"]))
+        if estimate is None:
+            print(f"ERROR:: No vela estimate for {m['model']} {m['system_config']}")
+            continue
+
+        if m["layer"] is None:
+            total = totals.setdefault(m["system_config"], [0.0, 0.0, 0])
+            total[0] += m["measured_us"]
+            total[1] += estimate["estimated_us"]
+            total[2] += 1
+            continue
+
+        layers = [l for l in estimate["per_layer"] or [] if l["name"] == m["layer"]]
+        if not layers:
+            print(f"ERROR:: No vela layer {m['layer']} in {m['model']}")
+            continue
+        config_classes = classes.setdefault(m["system_config"], {})
+        total = config_classes.setdefault(
+            get_op_class(layers[0]["operator"]), [0.0, 0.0, 0]
+        )
+        total[0] += m["measured_us"]
+        total[1] += layers[0]["cycles"] / estimate["core_clock"] * 1e6
+        total[2] += 1
+
+    def get_factor(total):
+        return {"factor": total[0] / total[1] if total[1] else 1.0, "samples": total[2]}
+
+    return {
+        "version": CALIBRATION_VERSION,
+        "system_configs": {c: get_factor(t) for c, t in sorted(totals.items())},
+        "op_classes": {
+            c: {k: get_factor(t) for k, t in sorted(config_classes.items())}
+            for c, config_classes in sorted(classes.items())
+        },
+    }
+
+
+def write_calibration(calibration_file, calibration):
+    """Stores the calibration"""
+
+    write_file_if_changed(calibration_file, json.dumps(calibration, indent=2))
+
+
+def load_calibration(calibration_file):
+    """Loads a stored calibration"""
+
+    with open(calibration_file, "r", encoding="utf-8") as fp:
+        calibration = json.load(fp)
+    if calibration.get("version") != CALIBRATION_VERSION:
+        raise ValueError(
+            f"{calibration_file} is not a version {CALIBRATION_VERSION} calibration"
+        )
+    return calibration
+
+
+def get_calibrated_time(calibration, system_config, inference_time, per_layer=None):
+    """
+    Gets the calibrated inference time in seconds. Layers are corrected by
+    their operator class factor when the config has them, the rest by the
+    system config factor.
+
+    Returns:
+        tuple: (calibrated time or None without a factor, effective factor)
+    """
+
+    config = calibration["system_configs"].get(system_config)
+    op_classes = calibration["op_classes"].get(system_config, {})
+    config_factor = config["factor"] if config else None
+
+    if per_layer and op_classes:
+        cycles = sum(layer["cycles"] for layer in per_layer)
+        calibrated_cycles = 0.0
+        for layer in per_layer:
+            op_class = op_classes.get(get_op_class(layer["operator"]))
+            factor = op_class["factor"] if op_class else config_factor or 1.0
+            calibrated_cycles += layer["cycles"] * factor
+        factor = calibrated_cycles / cycles if cycles else 1.0
+    elif config_factor is not None:
+        factor = config_factor
+    else:
+        return None, None
+    return inference_time * factor, factor
+
+
+def apply_calibration(perf_data, calibration, per_layer=None):
+    """Adds the calibrated inference time next to the vela estimate"""
+
+    calibrated, factor = get_calibrated_time(
+        calibration,
+        perf_data.get("system_config"),
+        perf_data.get("inference_time") or 0,
+        per_layer,
+    )
+    perf_data["calibrated_inference_time"] = calibrated
+    perf_data["calibration_factor"] = factor
+    if calibrated:
+        perf_data["calibrated_inferences_per_sec"] = 1 / calibrated
+    return perf_data
+
+
+def get_calibration_report(measurements, estimates, calibration):
+    """Compares the raw and calibrated estimates with the model measurements"""
+
+    report = []
+    for m in measurements:
+        estimate = estimates.get((m["model"], m["system_config"]))
+        if m["layer"] is not None or estimate is None:
+            continue
+        calibrated, _ = get_calibrated_time(
+            calibration,
+            m["system_config"],
+            estimate["estimated_us"],
+            estimate["per_layer"],
+        )
+        report.append(
+            {
+                "model": m["model"],
+                "system_config": m["system_config"],
+                "measured_us": m["measured_us"],
+                "estimated_us": estimate["estimated_us"],
+                "calibrated_us": calibrated,
+                "raw_error": (estimate["estimated_us"] / m["measured_us"] - 1) * 100,
+                "calibrated_error": (
+                    None
+                    if calibrated is None
+                    else (calibrated / m["measured_us"] - 1) * 100
+                ),
+            }
+        )
+    return report
+
+
+def print_calibration(calibration):
+    """Prints the fitted factors"""
+
+    for config, entry in calibration["system_configs"].items():
+        print(f"++ {config}: x{entry['factor']:.3f} ({entry['samples']} models)")
+        for op_class, op_entry in calibration["op_classes"].get(config, {}).items():
+            print(
+                f"     {op_class}: x{op_entry['factor']:.3f}"
+                f" ({op_entry['samples']} layers)"
+            )
+
+
+def get_calibration_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate vela latency estimates against measured latencies."
+    )
+    parser.add_argument(
+        "command",
+        choices=["fit", "report"],
+        help="Fit and store the factors, or report the errors of stored factors",
+    )
+    parser.add_argument(
+        "measured_file",
+        type=str,
+        help="CSV with model, system_config, measured_us and an optional layer",
+    )
+    parser.add_argument(
+        "--compile-output",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Compiler output directories holding the vela summaries",
+    )
+    parser.add_argument(
+        "-c",
+        "--calibration",
+        type=str,
+        default="calibration.json",
+        help="Calibration file written by fit and read by report",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line calibration"""
+    parser = get_calibration_argparser()
+    args = parser.parse_args()
+
+    measurements = load_measurements(args.measured_file)
+    estimates = find_estimates(args.compile_output)
+    if args.command == "fit":
+        calibration = fit_calibration(measurements, estimates)
+        write_calibration(args.calibration, calibration)
+        print(f"++ Wrote calibration {args.calibration}")
+    else:
+        calibration = load_calibration(args.calibration)
+    print_calibration(calibration)
+
+    report = get_calibration_report(measurements, estimates, calibration)
+    print(
+        f"{'measured us':>12} {'vela us':>10} {'error':>8} {'calib us':>10} {'error':>8}"
+    )
+    for r in report:
+        calibrated = "-" if r["calibrated_us"] is None else f"{r['calibrated_us']:.1f}"
+        error = (
+            "-" if r["calibrated_error"] is None else f"{r['calibrated_error']:+.1f}%"
+        )
+        print(
+            f"{r['measured_us']:>12.1f} {r['estimated_us']:>10.1f}"
+            f" {r['raw_error']:>+7.1f}% {calibrated:>10} {error:>8}"
+            f"  {r['model']} {r['system_config']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
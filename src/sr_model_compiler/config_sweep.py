@@ -0,0 +1,352 @@
+"""System config sensitivity sweep over synthesized vela INI sections"""
+
+import os
+import csv
+import sys
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from .latency_estimator import load_system_configs, sr_estimate_schedule_latency
+from .sr_model_compiler import sr_model_compiler, get_args_from_call, get_model_types
+from .utils import write_file_if_changed
+
+SWEEP_INI_FILE = "sweep_system_config.ini"
+SWEEP_CSV_FILE = "sweep.csv"
+
+# Parameters that belong to the Memory_Mode section instead of System_Config
+MEMORY_MODE_KEYS = ["const_mem_area", "arena_mem_area", "cache_mem_area"]
+
+
+def parse_sweep(values):
+    """Parses parameter=value,value,... sweep ranges"""
+
+    sweep = {}
+    for value in values or []:
+        name, settings = value.split("=", 1)
+        sweep[name.strip()] = [s.strip() for s in settings.split(",") if s.strip()]
+    return sweep
+
+
+def get_sweep_variants(sweep, grid=False):
+    """
+    Gets the parameter overrides to compile. By default each parameter is
+    varied on its own around the base config, with grid every combination.
+
+    Returns:
+        list: Override dicts, the base config first as an empty dict.
+    """
+
+    variants = [{}]
+    if grid:
+        names = list(sweep)
+        for values in itertools.product(*(sweep[n] for n in names)):
+            variants.append(dict(zip(names, values)))
+    else:
+        for name, values in sweep.items():
+            variants.extend({name: value} for value in values)
+    return variants
+
+
+def write_sweep_ini(ini_file, base_config, memory_mode, variants, output_file):
+    """
+    Writes a copy of the INI with one System_Config and Memory_Mode section
+    per variant, inheriting the base sections.
+
+    Returns:
+        list: (system config, memory mode) names per variant.
+    """
+
+    with open(ini_file, "r", encoding="utf-8") as fp:
+        lines = [fp.read().rstrip("\n"), "", "; Sweep variants"]
+
+    names = []
+    for i, overrides in enumerate(variants):
+        if not overrides:
+            names.append((base_config, memory_mode))
+            continue
+
+        system_config = f"sweep_{i}"
+        lines += ["", f"[System_Config.{system_config}]"]
+        lines.append(f"inherit=System_Config.{base_config}")
+        lines += [f"{k}={v}" for k, v in overrides.items() if k not in MEMORY_MODE_KEYS]
+
+        variant_memory_mode = memory_mode
+        if any(k in MEMORY_MODE_KEYS for k in overrides):
+            variant_memory_mode = f"sweep_{i}"
+            lines += ["", f"[Memory_Mode.{variant_memory_mode}]"]
+            lines.append(f"inherit=Memory_Mode.{memory_mode}")
+            lines += [f"{k}={v}" for k, v in overrides.items() if k in MEMORY_MODE_KEYS]
+        names.append((system_config, variant_memory_mode))
+
+    write_file_if_changed(output_file, "\n".join(lines) + "\n")
+    return names
+
+
+def compile_sweep_variant(kwargs):
+    """Compiles one variant, runs in a worker process"""
+
+    results = sr_model_compiler(**kwargs) or {}
+    return {
+        "cycles": float(results.get("cycles_total", 0)),
+        "inference_time": float(results.get("inference_time", 0)),
+    }
+
+
+def get_sensitivity(rows, base_params):
+    """
+    Gets the elasticity of the cycles per swept parameter at the base config,
+    the percent change in cycles per percent change of the parameter towards
+    the nearest swept value. Failed variants are left out.
+    """
+
+    base_cycles = rows[0]["cycles"]
+    sensitivity = {}
+    for name in dict.fromkeys(r["parameter"] for r in rows if r["parameter"]):
+        sensitivity[name] = None
+        try:
+            base_value = float(base_params[name])
+            points = [
+                (float(r["value"]), r["cycles"])
+                for r in rows
+                if r["parameter"] == name
+                and r["source"] != "failed"
+                and float(r["value"]) != base_value
+            ]
+        except (KeyError, ValueError):
+            continue
+        if points and base_value and base_cycles:
+            _, value, cycles = min((abs(v - base_value), v, c) for v, c in points)
+            sensitivity[name] = ((cycles - base_cycles) / base_cycles) / (
+                (value - base_value) / base_value
+            )
+    return sensitivity
+
+
+def get_sweep_estimates(  # pylint: disable=R0913,R0917
+    args, sweep_ini, memory_mode, variants, names
+):
+    """
+    Estimates every variant from one vela schedule of the base config.
+    Variants changing the memory mode place the tensors elsewhere, so they
+    are not estimated.
+
+    Returns:
+        list: The estimate per variant, in the variant order.
+    """
+
+    estimates = sr_estimate_schedule_latency(
+        args.model_file,
+        sweep_ini,
+        args.system_config,
+        [name for name, _ in names],
+        memory_mode=memory_mode,
+        arena_cache_size=args.arena_cache_size,
+        optimize=args.optimize,
+    )
+    estimates = {e["system_config"]: e for e in estimates}
+    for overrides, (name, _) in zip(variants, names):
+        estimates[name]["not_estimated"] += [
+            k for k in overrides if k in MEMORY_MODE_KEYS
+        ]
+    return [estimates[name] for name, _ in names]
+
+
+def sweep_main(args):  # pylint: disable=R0914
+    """Compiles every variant and builds the sensitivity table"""
+
+    model_types, _ = get_model_types(args.system_config_ini_file)
+    ini_file, memory_modes = model_types[args.system_config]
+    memory_mode = args.memory_mode or memory_modes[-1]
+    base_params = load_system_configs(ini_file)[args.system_config]
+
+    sweep = parse_sweep(args.vary)
+    variants = get_sweep_variants(sweep, args.grid)
+    os.makedirs(args.output_dir, exist_ok=True)
+    sweep_ini = os.path.join(args.output_dir, SWEEP_INI_FILE)
+    names = write_sweep_ini(
+        ini_file, args.system_config, memory_mode, variants, sweep_ini
+    )
+
+    def get_job(i):
+        return {
+            "model_file": args.model_file,
+            "output_dir": os.path.join(args.output_dir, names[i][0]),
+            "system_config": names[i][0],
+            "memory_mode": names[i][1],
+            "system_config_ini_file": sweep_ini,
+            "arena_cache_size": args.arena_cache_size,
+            "optimize": args.optimize,
+            "script": ["model"],
+        }
+
+    # The variants are estimated on the schedule of the base config
+    base = compile_sweep_variant(get_job(0))
+    to_compile = list(range(1, len(variants)))
+    if args.prune_margin is not None and base["cycles"]:
+        estimates = get_sweep_estimates(args, sweep_ini, memory_mode, variants, names)
+
+        # Variants changing what the estimator cannot follow are always compiled
+        fastest = min(e["cycles"] for e in estimates if not e["not_estimated"])
+        to_compile = [
+            i
+            for i in to_compile
+            if estimates[i]["not_estimated"]
+            or estimates[i]["cycles"] <= fastest * (1 + args.prune_margin)
+        ]
+
+    print(f"++ Compiling {len(to_compile)} of {len(variants) - 1} sweep variants")
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        compiled = dict(
+            zip(to_compile, pool.map(compile_sweep_variant, map(get_job, to_compile)))
+        )
+    compiled[0] = base
+    if not base["cycles"]:
+        print(f"ERROR:: The base config {args.system_config} failed to compile")
+
+    # A failed compile has no cycles, it is not a change against the base
+    rows = []
+    for i, overrides in enumerate(variants):
+        result = compiled.get(i)
+        if result:
+            cycles = result["cycles"]
+            source = "vela" if cycles else "failed"
+        else:
+            cycles = estimates[i]["cycles"]
+            source = "estimate"
+        change = None
+        if cycles and base["cycles"]:
+            change = (cycles - base["cycles"]) / base["cycles"] * 100
+        rows.append(
+            {
+                "system_config": names[i][0],
+                "parameter": ",".join(overrides),
+                "value": ",".join(overrides.values()),
+                "cycles": cycles,
+                "change": change,
+                "source": source,
+            }
+        )
+
+    with open(
+        os.path.join(args.output_dir, SWEEP_CSV_FILE), "w", newline="", encoding="utf-8"
+    ) as fp:
+        writer = csv.DictWriter(fp, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return {
+        "base_config": args.system_config,
+        "rows": rows,
+        "sensitivity": get_sensitivity(rows, base_params) if not args.grid else {},
+    }
+
+
+def print_sweep(sweep):
+    """Prints the cycles per variant and the sensitivity per parameter"""
+
+    print(f"++ Sweep around {sweep['base_config']}")
+    print(f"{'parameter':<28} {'value':>10} {'cycles':>12} {'change':>8}  source")
+    for row in sweep["rows"]:
+        change = "-" if row["change"] is None else f"{row['change']:+.1f}%"
+        print(
+            f"{row['parameter'] or '(base)':<28} {row['value']:>10}"
+            f" {row['cycles']:>12.0f} {change:>8}  {row['source']}"
+        )
+    for name, elasticity in sweep["sensitivity"].items():
+        value = "-" if elasticity is None else f"{elasticity:+.3f}"
+        print(f"++ {name}: {value} % cycles per % change")
+
+
+def sr_config_sweep(**kwargs):
+    """Python entry functions for the call"""
+
+    parser = get_sweep_argparser()
+    args = get_args_from_call(parser=parser, **kwargs)
+    return sweep_main(args)
+
+
+def get_sweep_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Sweep system config parameters and report the cycles."
+    )
+    parser.add_argument(
+        "-m", "--model-file", type=str, required=True, help="TFLite model to compile"
+    )
+    parser.add_argument(
+        "-s",
+        "--system-config",
+        type=str,
+        default="sr100_npu_400MHz_tensor_vmem_weights_flash66MHz",
+        help="Base system config the variants inherit from",
+    )
+    parser.add_argument(
+        "--system-config-ini-file",
+        type=str,
+        help="INI holding the base config, the bundled INIs by default",
+    )
+    parser.add_argument(
+        "--memory-mode",
+        type=str,
+        help="Base memory mode, the last one of the INI by default",
+    )
+    parser.add_argument(
+        "--vary",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Parameter values such as OffChipFlash_clock_scale=0.25,0.5",
+    )
+    parser.add_argument(
+        "--grid",
+        action="store_true",
+        help="Compile every combination instead of one parameter at a time",
+    )
+    parser.add_argument(
+        "--prune-margin",
+        type=float,
+        help="Only compile variants estimated within this fraction of the fastest",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        default="sweep",
+        help="Directory for the variants, the INI and sweep.csv",
+    )
+    parser.add_argument(
+        "--arena-cache-size",
+        type=int,
+        default=1024000,
+        help="Arena cache size of every variant",
+    )
+    parser.add_argument(
+        "-p",
+        "--optimize",
+        type=str,
+        default="Size",
+        choices=["Performance", "Size"],
+        help="Vela optimise mode of every variant",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of variants compiled in parallel",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line sweep"""
+    parser = get_sweep_argparser()
+    args = parser.parse_args()
+
+    print_sweep(sweep_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
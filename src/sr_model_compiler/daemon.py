@@ -0,0 +1,477 @@
+"""Local compile daemon that keeps the compiler warm between calls"""
+
+import io
+import os
+import sys
+import json
+import queue
+import socket
+import struct
+import getpass
+import argparse
+import tempfile
+import itertools
+import threading
+import traceback
+import contextlib
+import socketserver
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Set to run every command locally even when a daemon is running
+NO_DAEMON_ENV = "SR_NO_DAEMON"
+SOCKET_ENV = "SR_COMPILE_SOCKET"
+
+# Log queue of a worker process, set by init_worker
+LOG_QUEUE = None
+
+
+def get_default_socket():
+    """Gets the socket path of the daemon of the current user"""
+
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(
+            os.environ["XDG_RUNTIME_DIR"], f"sr_model_compiler-{getpass.getuser()}.sock"
+        )
+    # The daemon creates the directory only the user can enter
+    return os.path.join(
+        tempfile.gettempdir(), f"sr_model_compiler-{getpass.getuser()}", "daemon.sock"
+    )
+
+
+def get_peer_uid(sock, socket_path):
+    """Gets the user running the other end of a connected Unix socket"""
+
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        return struct.unpack("3i", creds)[1]
+    return os.stat(socket_path).st_uid
+
+
+def get_entry_points():
+    """Gets the command line mains the daemon serves"""
+
+    # Imported on use, so the client does not pay for the compiler import
+    # pylint: disable=C0415
+    from .sr_model_compiler import main as compiler_main
+    from .sr100_model_optimizer import main as optimizer_main
+
+    return {"compile": compiler_main, "check": check_main, "optimize": optimizer_main}
+
+
+class LogWriter(io.TextIOBase):
+    """Sends the printed lines of a request to the daemon"""
+
+    def __init__(self, request_id):
+        super().__init__()
+        self.request_id = request_id
+        self.buffer = ""
+
+    def write(self, text):
+        """Sends the complete lines"""
+
+        self.buffer += text
+        if "\n" in self.buffer:
+            lines, self.buffer = self.buffer.rsplit("\n", 1)
+            LOG_QUEUE.put((self.request_id, lines + "\n"))
+        return len(text)
+
+    def flush(self):
+        """Sends the rest of the buffer"""
+
+        if self.buffer:
+            LOG_QUEUE.put((self.request_id, self.buffer))
+            self.buffer = ""
+
+
+def init_worker(log_queue):
+    """Imports the compiler and TensorFlow once per worker"""
+
+    global LOG_QUEUE  # pylint: disable=W0603
+    LOG_QUEUE = log_queue
+    get_entry_points()
+    with contextlib.suppress(ImportError):
+        import tensorflow  # pylint: disable=C0415,W0611
+
+
+def is_watch(argv):
+    """Checks if a compiler command line asks for the endless --watch"""
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--watch", action="store_true")
+    return parser.parse_known_args(argv)[0].watch
+
+
+def run_request(request_id, command, argv, cwd, env):  # pylint: disable=R0913,R0917
+    """Runs a command line main in a worker with its output sent back"""
+
+    writer = LogWriter(request_id)
+    sys.argv = argv
+    # Vela, the caches and the tools run with the environment of the client
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        with contextlib.redirect_stdout(writer), contextlib.redirect_stderr(writer):
+            try:
+                os.chdir(cwd)
+                returncode = get_entry_points()[command]()
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else int(bool(e.code))
+            except Exception:  # pylint: disable=W0718
+                traceback.print_exc()
+                returncode = 1
+            writer.flush()
+    finally:
+        LOG_QUEUE.put((request_id, None))
+    return returncode or 0
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    """Serves one JSON request and streams the log lines back"""
+
+    def send(self, message):
+        """Sends one JSON message, the client may have gone away"""
+
+        with contextlib.suppress(OSError):
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+    def handle(self):
+        """Runs the request on the worker pool"""
+
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self.send({"error": "invalid request", "returncode": 1})
+            return
+        command = request.get("command")
+        if command == "ping":
+            self.send({"returncode": 0, "pid": os.getpid(), "jobs": self.server.jobs})
+            return
+        if command == "shutdown":
+            self.send({"returncode": 0})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if command not in ["compile", "check", "optimize"]:
+            self.send({"error": f"unknown command {command}", "returncode": 1})
+            return
+        # Other Python installs have their own compiler and TensorFlow
+        if request.get("python") != sys.executable:
+            self.send({"local": f"the daemon runs {sys.executable}"})
+            return
+        if command == "compile" and is_watch(request["argv"][1:]):
+            self.send({"local": "--watch runs in the calling process"})
+            return
+
+        request_id = next(self.server.request_ids)
+        logs = queue.Queue()
+        self.server.routes[request_id] = logs
+        future = self.server.submit(
+            run_request,
+            request_id,
+            command,
+            request["argv"],
+            request["cwd"],
+            request["env"],
+        )
+
+        def end_log(f):
+            # A worker that dies never sends the end of its log
+            if f.cancelled() or f.exception():
+                logs.put(None)
+
+        future.add_done_callback(end_log)
+        try:
+            for text in iter(logs.get, None):
+                self.send({"log": text})
+            try:
+                returncode = future.result()
+            except BrokenProcessPool as e:
+                self.send({"log": f"ERROR:: A compile worker died, {e}\n"})
+                returncode = 1
+            except Exception as e:  # pylint: disable=W0718
+                self.send({"log": f"ERROR:: The compile worker failed, {e}\n"})
+                returncode = 1
+            self.send({"returncode": returncode})
+        finally:
+            del self.server.routes[request_id]
+
+
+class CompileDaemon(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server in front of a pool of warm compile workers"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, jobs):
+        self.jobs = jobs
+        self.routes = {}
+        self.request_ids = itertools.count()
+        self.log_queue = multiprocessing.get_context("spawn").Queue()
+        self.pool_lock = threading.Lock()
+        self.pool = self.create_pool()
+        self.router = threading.Thread(target=self.route_logs, daemon=True)
+        self.router.start()
+        # Only the user may connect, the daemon runs commands as them
+        umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, CompileRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def create_pool(self):
+        """Creates the worker pool"""
+
+        return ProcessPoolExecutor(
+            max_workers=self.jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.log_queue,),
+        )
+
+    def submit(self, *args):
+        """Submits to the pool, replacing it when a dead worker broke it"""
+
+        with self.pool_lock:
+            try:
+                return self.pool.submit(*args)
+            except BrokenProcessPool:
+                print("++ Restarting the compile workers after a worker died")
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.create_pool()
+                return self.pool.submit(*args)
+
+    def route_logs(self):
+        """Passes the worker log lines to the connection of their request"""
+
+        for request_id, text in iter(self.log_queue.get, (None, None)):
+            route = self.routes.get(request_id)
+            if route is not None:
+                route.put(text)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+        self.log_queue.put((None, None))
+        self.router.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
+
+
+def connect_daemon(socket_path, timeout=None):
+    """
+    Connects to the daemon on a socket, when it runs as the same user.
+
+    Returns:
+        socket.socket: The connection, None when no daemon of the user
+            answers.
+    """
+
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "getuid"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        peer_uid = get_peer_uid(sock, socket_path)
+    except OSError:
+        sock.close()
+        return None
+    if peer_uid != os.getuid():
+        sock.close()
+        print(f"++ Compiling locally, {socket_path} belongs to another user")
+        return None
+    return sock
+
+
+def send_request(socket_path, request, timeout=None):
+    """
+    Sends a request to the daemon and prints the log it streams back. The
+    request carries the environment of the client, so it is only sent to a
+    daemon run by the same user.
+
+    Returns:
+        int: The return code, None when no daemon answers on the socket or
+            it asks for the command to run locally.
+    """
+
+    sock = connect_daemon(socket_path, timeout)
+    if sock is None:
+        return None
+
+    with sock, sock.makefile("rwb") as stream:
+        try:
+            stream.write((json.dumps(request) + "\n").encode("utf-8"))
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if "log" in message:
+                    sys.stdout.write(message["log"])
+                    sys.stdout.flush()
+                if "local" in message:
+                    print(f"++ Compiling locally, {message['local']}")
+                    return None
+                if "error" in message:
+                    print(f"ERROR:: {message['error']}")
+                if "returncode" in message:
+                    return message["returncode"]
+        except (OSError, ValueError) as e:
+            print(f"++ The compile daemon did not answer, {e}")
+            return None
+    print("ERROR:: The compile daemon closed the connection")
+    return 1
+
+
+def forward_to_daemon(command, argv, socket_path=None):
+    """
+    Runs a command on the running daemon, unless SR_NO_DAEMON is set.
+
+    Returns:
+        int: The return code, None when the command has to run locally.
+    """
+
+    if os.environ.get(NO_DAEMON_ENV):
+        return None
+    request = {
+        "command": command,
+        "argv": [os.path.basename(sys.argv[0]), *argv],
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "python": sys.executable,
+    }
+    return send_request(socket_path or get_default_socket(), request)
+
+
+def serve_daemon(socket_path, jobs=2):
+    """
+    Starts the daemon on a Unix socket, with the workers warmed up.
+
+    Returns:
+        CompileDaemon: The server, run it with serve_forever.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), 0o700, exist_ok=True)
+    if os.path.exists(socket_path):
+        if send_request(socket_path, {"command": "ping"}, timeout=5) is not None:
+            raise RuntimeError(f"A compile daemon is already running on {socket_path}")
+        os.remove(socket_path)
+
+    server = CompileDaemon(socket_path, jobs)
+    # Start every worker now so the first requests find them warm
+    for future in [server.submit(os.getpid) for _ in range(jobs)]:
+        future.result()
+    print(f"++ Compile daemon with {jobs} workers on {socket_path}")
+    return server
+
+
+def check_main():
+    """Main for the daemon check, compiles into a temporary directory"""
+    parser = argparse.ArgumentParser(description="Check that models fit the SR100.")
+    parser.add_argument("model_files", type=str, nargs="+", help="TFLite models")
+    parser.add_argument(
+        "-s", "--system-config", type=str, help="System config, the compiler default"
+    )
+    args = parser.parse_args()
+
+    # pylint: disable=C0415
+    from .sr_model_compiler import sr_check_model, sr_model_compiler
+
+    returncode = 0
+    kwargs = {"system_config": args.system_config} if args.system_config else {}
+    for model_file in args.model_files:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = sr_model_compiler(
+                model_file=model_file, output_dir=tmp_dir, **kwargs
+            )
+        success, perf_data = sr_check_model(results)
+        if success:
+            print(f"++ {model_file} fits, {perf_data['inference_time']:.6f} s")
+        else:
+            print(f"ERROR:: {model_file} does not fit onto sr")
+            returncode = 1
+    return returncode
+
+
+def compiler_client():
+    """Main of sr_model_compiler, forwarded to the daemon when it runs"""
+
+    # The watch loop never ends, it stays with the terminal that started it
+    returncode = None
+    if not is_watch(sys.argv[1:]):
+        returncode = forward_to_daemon("compile", sys.argv[1:])
+    if returncode is None:
+        returncode = get_entry_points()["compile"]()
+    return returncode
+
+
+def optimizer_client():
+    """Main of sr100_model_optimizer, forwarded to the daemon when it runs"""
+
+    returncode = forward_to_daemon("optimize", sys.argv[1:])
+    if returncode is None:
+        returncode = get_entry_points()["optimize"]()
+    return returncode
+
+
+def get_daemon_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Keep the compiler warm behind a local socket."
+    )
+    parser.add_argument(
+        "command",
+        choices=["start", "stop", "status", "check"],
+        help="Run the daemon, stop or query it, or check models on it",
+    )
+    parser.add_argument(
+        "args", nargs=argparse.REMAINDER, help="Models and options of check"
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=get_default_socket(),
+        help=f"Unix socket of the daemon, also set by {SOCKET_ENV}",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=2, help="Compiles run in parallel"
+    )
+    return parser
+
+
+def main():
+    """Main for the command line compile daemon"""
+    parser = get_daemon_argparser()
+    args = parser.parse_args()
+
+    if args.command == "start":
+        server = serve_daemon(args.socket, args.jobs)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return 0
+
+    if args.command == "check":
+        returncode = forward_to_daemon("check", args.args, args.socket)
+        if returncode is None:
+            sys.argv = [sys.argv[0], *args.args]
+            returncode = check_main()
+        return returncode
+
+    command = "shutdown" if args.command == "stop" else "ping"
+    if send_request(args.socket, {"command": command}, timeout=5) is None:
+        print(f"++ No compile daemon on {args.socket}")
+        return 1
+    state = "stopping" if args.command == "stop" else "running"
+    print(f"++ Compile daemon on {args.socket} is {state}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
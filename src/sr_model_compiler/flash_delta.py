@@ -0,0 +1,74 @@
+"""Sector level deltas between two model binaries for incremental flashing"""
+
+import struct
+
+# Delta header: magic, version, erase size, new image size, dirty sector count
+FLASH_DELTA_MAGIC = b"SRFD"
+FLASH_DELTA_VERSION = 1
+FLASH_DELTA_HEADER = struct.Struct("<4sIIII")
+
+# Erased flash reads as 0xFF, the tail of the last sector is padded with it
+FLASH_PAD_BYTE = b"\xff"
+
+
+def get_sector(data, index, erase_size):
+    """Gets a full sector of data, padded with the erased value"""
+
+    sector = data[index * erase_size : (index + 1) * erase_size]
+    return sector + FLASH_PAD_BYTE * (erase_size - len(sector))
+
+
+def get_dirty_sectors(old_data, new_data, erase_size=4096):
+    """Gets the indices of the sectors that differ in the new binary"""
+
+    num_sectors = (len(new_data) + erase_size - 1) // erase_size
+    return [
+        i
+        for i in range(num_sectors)
+        if get_sector(old_data, i, erase_size) != get_sector(new_data, i, erase_size)
+    ]
+
+
+def build_flash_delta(old_data, new_data, erase_size=4096):
+    """
+    Builds a delta holding only the sectors that changed.
+
+    Returns:
+        tuple: (delta bytes, list of dirty sector indices)
+    """
+
+    dirty = get_dirty_sectors(old_data, new_data, erase_size)
+    delta = bytearray(
+        FLASH_DELTA_HEADER.pack(
+            FLASH_DELTA_MAGIC,
+            FLASH_DELTA_VERSION,
+            erase_size,
+            len(new_data),
+            len(dirty),
+        )
+    )
+    delta += struct.pack(f"<{len(dirty)}I", *dirty)
+    for index in dirty:
+        delta += get_sector(new_data, index, erase_size)
+    return bytes(delta), dirty
+
+
+def apply_flash_delta(old_data, delta):
+    """Applies a delta to the previous binary, as the flashing tool would"""
+
+    magic, version, erase_size, size, count = FLASH_DELTA_HEADER.unpack_from(delta)
+    if magic != FLASH_DELTA_MAGIC or version != FLASH_DELTA_VERSION:
+        raise ValueError("Not a flash delta")
+
+    sectors = struct.unpack_from(f"<{count}I", delta, FLASH_DELTA_HEADER.size)
+    payload = FLASH_DELTA_HEADER.size + 4 * count
+
+    num_sectors = (size + erase_size - 1) // erase_size
+    data = bytearray(old_data[: num_sectors * erase_size])
+    data += FLASH_PAD_BYTE * (num_sectors * erase_size - len(data))
+    for i, index in enumerate(sectors):
+        start = payload + i * erase_size
+        data[index * erase_size : (index + 1) * erase_size] = delta[
+            start : start + erase_size
+        ]
+    return bytes(data[:size])
@@ -0,0 +1,277 @@
+"""Packs compiled models into one aligned flash image"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import struct
+import hashlib
+import argparse
+from pathlib import Path
+from jinja2 import Environment, FileSystemLoader
+from .utils import write_file_if_changed
+
+# Image header: magic, version, number of models, then one entry per model
+FLASH_IMAGE_MAGIC = b"SRMI"
+FLASH_IMAGE_VERSION = 1
+FLASH_IMAGE_HEADER = struct.Struct("<4sII")
+FLASH_IMAGE_ENTRY = struct.Struct("<III")
+
+# Erased flash reads as 0xFF, so padding does not need programming
+FLASH_PAD_BYTE = b"\xff"
+
+
+def align(value, alignment):
+    """Rounds a value up to the alignment"""
+
+    return (value + alignment - 1) // alignment * alignment
+
+
+def get_model_id(name):
+    """Gets a C++ enum name for a model name"""
+
+    words = re.split(r"[^0-9a-zA-Z]+", name)
+    return "k" + "".join(w[:1].upper() + w[1:] for w in words if w)
+
+
+def plan_flash_image(blobs, alignment=4096):
+    """
+    Lays out the blobs after the image header, each aligned to the flash
+    page or XIP boundary. Byte identical blobs are stored once.
+
+    Args:
+        blobs (list): (name, bytes) tuples, in table order.
+        alignment (int): The page or XIP alignment in bytes.
+
+    Returns:
+        list: One dict per blob with its name, offset, length, crc32 and
+            whether it reuses an earlier blob.
+    """
+
+    header_size = FLASH_IMAGE_HEADER.size + FLASH_IMAGE_ENTRY.size * len(blobs)
+    offset = align(header_size, alignment)
+
+    layout = []
+    placed = {}
+    for name, data in blobs:
+        digest = hashlib.sha256(data).digest()
+        entry = {
+            "name": name,
+            "id": get_model_id(name),
+            "length": len(data),
+            "crc32": zlib.crc32(data),
+            "duplicate": digest in placed,
+        }
+        if digest not in placed:
+            placed[digest] = offset
+            offset = align(offset + len(data), alignment)
+        entry["offset"] = placed[digest]
+        layout.append(entry)
+
+    return layout
+
+
+def build_flash_image(blobs, layout):
+    """Builds the image bytes: header, offset/length table and aligned blobs"""
+
+    image_size = max((e["offset"] + e["length"] for e in layout), default=0)
+    image_size = max(
+        image_size, FLASH_IMAGE_HEADER.size + FLASH_IMAGE_ENTRY.size * len(layout)
+    )
+    image = bytearray(FLASH_PAD_BYTE * image_size)
+
+    FLASH_IMAGE_HEADER.pack_into(
+        image, 0, FLASH_IMAGE_MAGIC, FLASH_IMAGE_VERSION, len(layout)
+    )
+    for i, entry in enumerate(layout):
+        FLASH_IMAGE_ENTRY.pack_into(
+            image,
+            FLASH_IMAGE_HEADER.size + i * FLASH_IMAGE_ENTRY.size,
+            entry["offset"],
+            entry["length"],
+            entry["crc32"],
+        )
+    for (_, data), entry in zip(blobs, layout):
+        image[entry["offset"] : entry["offset"] + len(data)] = data
+
+    return bytes(image)
+
+
+def read_flash_image_table(image):
+    """Reads the offset/length table back from an image"""
+
+    magic, version, count = FLASH_IMAGE_HEADER.unpack_from(image, 0)
+    if magic != FLASH_IMAGE_MAGIC or version != FLASH_IMAGE_VERSION:
+        raise ValueError("Not a flash image")
+    return [
+        FLASH_IMAGE_ENTRY.unpack_from(
+            image, FLASH_IMAGE_HEADER.size + i * FLASH_IMAGE_ENTRY.size
+        )
+        for i in range(count)
+    ]
+
+
+def sr_pack_flash_image(  # pylint: disable=R0913,R0914,R0917
+    model_files,
+    output_file,
+    alignment=4096,
+    base_address=0,
+    namespace="flash_image",
+    names=None,
+):
+    """
+    Packs model binaries into one flash image and writes a C++ header with
+    the offset/length table next to it.
+
+    Args:
+        model_files (list): The .bin files written by the compiler.
+        output_file (str): The image file, the header gets the .hpp suffix.
+        alignment (int): The flash page or XIP alignment in bytes.
+        base_address (int): The flash address the image is written to.
+        namespace (str): The C++ namespace of the table.
+        names (list): The model names, the file stems by default.
+
+    Returns:
+        dict: The image size, header file and per model layout.
+    """
+
+    names = names or [Path(f).stem for f in model_files]
+    blobs = []
+    for name, model_file in zip(names, model_files):
+        with open(model_file, "rb") as fp:
+            blobs.append((name, fp.read()))
+
+    layout = plan_flash_image(blobs, alignment)
+    image = build_flash_image(blobs, layout)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    write_file_if_changed(output_file, image)
+
+    env = Environment(
+        loader=FileSystemLoader(Path(__file__).parent / "templates"),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    # No date, so an unchanged image leaves the header untouched
+    license_header = env.get_template("header_template.txt").render(
+        file_name=Path(output_file).name
+    )
+    header_file = str(Path(output_file).with_suffix(".hpp"))
+    write_file_if_changed(
+        header_file,
+        env.get_template("flash_image.hpp.template").render(
+            common_template_header=license_header,
+            guard=f"{namespace}_HPP".upper(),
+            namespace=namespace,
+            base_address=base_address,
+            image_size=len(image),
+            alignment=alignment,
+            models=layout,
+        ),
+    )
+
+    stored = sum(e["length"] for e in layout if not e["duplicate"])
+    return {
+        "image_file": output_file,
+        "header_file": header_file,
+        "image_size": len(image),
+        "model_bytes": sum(e["length"] for e in layout),
+        "stored_bytes": stored,
+        "padding_bytes": len(image) - stored,
+        "models": layout,
+    }
+
+
+def get_bundle_model_files(manifest_file):
+    """Gets the names and binaries of the models in a bundle manifest"""
+
+    with open(manifest_file, "r", encoding="utf-8") as fp:
+        manifest = json.load(fp)
+    models = [m for m in manifest["models"] if m["success"]]
+    return [m["namespace"] for m in models], [m["files"][-1] for m in models]
+
+
+def print_flash_image(image):
+    """Prints the image layout"""
+
+    print(
+        f"++ Flash image {image['image_file']}: {image['image_size']} bytes,"
+        f" {image['stored_bytes']} model bytes stored of {image['model_bytes']},"
+        f" {image['padding_bytes']} bytes header and padding"
+    )
+    print(f"{'offset':>10} {'length':>10} {'crc32':>10} name")
+    for entry in image["models"]:
+        shared = " (shared)" if entry["duplicate"] else ""
+        print(
+            f"{entry['offset']:>#10x} {entry['length']:>10}"
+            f" {entry['crc32']:>#10x} {entry['name']}{shared}"
+        )
+
+
+def get_flash_image_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Pack compiled models into one aligned flash image."
+    )
+    parser.add_argument(
+        "bin_files", type=str, nargs="*", help="Model .bin files to pack, in order"
+    )
+    parser.add_argument(
+        "--bundle-manifest",
+        type=str,
+        help="Pack the models of a sr_model_bundle manifest",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-file",
+        type=str,
+        default="flash_image.bin",
+        help="Image file, the table header is written next to it as .hpp",
+    )
+    parser.add_argument(
+        "--alignment",
+        type=int,
+        default=4096,
+        help="Flash page or XIP alignment of each model in bytes",
+    )
+    parser.add_argument(
+        "--base-address",
+        type=lambda x: int(x, 0),
+        default=0,
+        help="Flash address the image is written to",
+    )
+    parser.add_argument(
+        "--namespace",
+        type=str,
+        default="flash_image",
+        help="Sets the namespace of the table header",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line flash packer"""
+    parser = get_flash_image_argparser()
+    args = parser.parse_args()
+
+    names, model_files = None, args.bin_files
+    if args.bundle_manifest:
+        names, model_files = get_bundle_model_files(args.bundle_manifest)
+    if not model_files:
+        parser.error("no models to pack")
+
+    image = sr_pack_flash_image(
+        model_files,
+        args.output_file,
+        args.alignment,
+        args.base_address,
+        args.namespace,
+        names,
+    )
+    print_flash_image(image)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,38 @@
+import io
 import numpy as np
 import os
-
-os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-import tensorflow as tf
 from mako.template import Template
 from pathlib import Path
 import platform
 
+try:
+    from .utils import write_file_if_changed
+except ImportError:
+    # Run as a script from this directory, see __main__ below
+    from utils import write_file_if_changed
+
 
 def generate_input_expected_data(
     tflite_path, output_folder, namespace, license_header, input_files=None
 ):
+    input_arrays, output_arrays = run_reference_inference(tflite_path, input_files)
+    write_input_expected_data(
+        tflite_path,
+        output_folder,
+        namespace,
+        license_header,
+        input_arrays,
+        output_arrays,
+    )
+
+
+def run_reference_inference(tflite_path, input_files=None):
+    """Runs the reference interpreter, returns the input and output arrays"""
+
+    # TensorFlow is only loaded when the reference results are not cached
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+    import tensorflow as tf
+
     # Load the model
     interpreter = tf.lite.Interpreter(
         model_path=tflite_path,
@@ -24,10 +46,8 @@ def generate_input_expected_data(
     output_details = interpreter.get_output_details()
 
     # Generate input and output data for each input and output
-    input_data_list = []
-    output_data_list = []
-    input_data_size_list = []
-    output_data_size_list = []
+    input_arrays = []
+    output_arrays = []
     for i, input_detail in enumerate(input_details):
         input_shape = input_detail["shape"]
         input_shape_bytes = 1
@@ -64,6 +84,28 @@ def generate_input_expected_data(
         else:
             print(f"User input loaded for input {i}")
 
+        interpreter.set_tensor(input_detail["index"], input_data)
+        input_arrays.append(input_data)
+
+    interpreter.invoke()
+
+    for output_detail in output_details:
+        output_arrays.append(interpreter.get_tensor(output_detail["index"]))
+
+    return input_arrays, output_arrays
+
+
+def write_input_expected_data(
+    tflite_path, output_folder, namespace, license_header, input_arrays, output_arrays
+):
+    """Writes io.cc and the expected output bin/npy files, returns their paths"""
+
+    input_data_list = []
+    output_data_list = []
+    input_data_size_list = []
+    output_data_size_list = []
+    output_files = []
+    for input_data in input_arrays:
         input_data_str = ",\n".join(
             [
                 ", ".join([str(b) for b in a])
@@ -72,14 +114,10 @@ def generate_input_expected_data(
                 )
             ]
         )
-        interpreter.set_tensor(input_detail["index"], input_data)
         input_data_list.append(input_data_str)
-        input_data_size_list.append(input_shape_bytes)
+        input_data_size_list.append(input_data.size)
 
-    interpreter.invoke()
-
-    for i, output_detail in enumerate(output_details):
-        output_data = interpreter.get_tensor(output_detail["index"])
+    for i, output_data in enumerate(output_arrays):
         output_data_str = ",\n".join(
             [
                 ", ".join([str(b) for b in a])
@@ -93,12 +131,14 @@ def generate_input_expected_data(
 
         # Write output_data to binary file
         bin_filename = f"{output_folder}/output_{i}.bin"
-        with open(bin_filename, "wb") as bin_file:
-            bin_file.write(output_data.tobytes())
+        write_file_if_changed(bin_filename, output_data.tobytes())
 
         # Write output_data to NumPy file
         npy_filename = f"{output_folder}/output_{i}.npy"
-        np.save(npy_filename, output_data)
+        npy_data = io.BytesIO()
+        np.save(npy_data, output_data)
+        write_file_if_changed(npy_filename, npy_data.getvalue())
+        output_files.extend([bin_filename, npy_filename])
 
     # Get the path to the directory containing this script
     script_dir = Path(__file__).parent
@@ -119,8 +159,8 @@ def generate_input_expected_data(
     output = license_header + "\n" + output
     # Write the generated code to a file
     filename = f"{output_folder}/{namespace}_io.cc"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(output)
+    write_file_if_changed(filename, output)
+    output_files.append(filename)
 
     if platform.system() == "Windows":
         print(
@@ -131,6 +171,8 @@ def generate_input_expected_data(
             f"++ Generated input and expected output of {os.path.basename(tflite_path)} to {os.path.abspath(output_folder)}/{namespace}_io.cc"
         )
 
+    return output_files
+
 
 # Optionally, keep the command-line interface for standalone usage
 if __name__ == "__main__":
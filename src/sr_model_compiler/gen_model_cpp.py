@@ -3,6 +3,9 @@ from pathlib import Path
 from jinja2 import Environment, FileSystemLoader
 import binascii
 import platform
+from .flash_delta import build_flash_delta
+from .model_info import load_model_index
+from .utils import write_file_if_changed
 
 # Define the choices and corresponding strings for tflite location
 loc_choices = {
@@ -10,6 +13,23 @@ loc_choices = {
     "flash": "MODEL_TFLITE_ATTRIBUTE_FLASH",  # QSPI FLASH
 }
 
+# Model index tensor types to the TFLM TfLiteType enum
+tflite_types = {
+    "float32": "kTfLiteFloat32",
+    "float16": "kTfLiteFloat16",
+    "float64": "kTfLiteFloat64",
+    "int64": "kTfLiteInt64",
+    "uint64": "kTfLiteUInt64",
+    "int32": "kTfLiteInt32",
+    "uint32": "kTfLiteUInt32",
+    "int16": "kTfLiteInt16",
+    "uint16": "kTfLiteUInt16",
+    "int8": "kTfLiteInt8",
+    "uint8": "kTfLiteUInt8",
+    "int4": "kTfLiteInt4",
+    "bool": "kTfLiteBool",
+}
+
 
 def generate_model_cpp(
     tflite_path,
@@ -20,8 +40,24 @@ def generate_model_cpp(
     namespace,
     env,
     license_header,
+    resolver_code="",
+    tensor_arena_size=None,
+    previous_bin=None,
+    erase_size=4096,
 ):
-    """Generates a C++ source file that contains the TFLite model as a byte array."""
+    """
+    Generates a C++ source file that contains the TFLite model as a byte array,
+    followed by the op resolver code, a header with the model metadata as
+    constexpr values, and the flash binary of the model.
+
+    With a previous binary it also writes a .delta file holding only the
+    flash sectors, of erase_size bytes, that changed since then.
+
+    Files are only rewritten when their contents change.
+
+    Returns:
+        list: The generated file paths.
+    """
 
     tflite_loc_choice = loc_choices.get(tflite_loc, "MODEL_TFLITE_ATTRIBUTE")
 
@@ -43,8 +79,12 @@ def generate_model_cpp(
 
     output_dir.mkdir(exist_ok=True)
 
-    model_data, model_length = get_tflite_data(tflite_path)
-    env.get_template("tflite.cc.template").stream(
+    # Read the vela output once for both the C++ array and the binary
+    with open(tflite_path, "rb") as tflite_model:
+        data = tflite_model.read()
+
+    model_data, model_length = get_tflite_data(tflite_path, data)
+    model_code = env.get_template("tflite.cc.template").render(
         common_template_header=license_header,
         arena_cache_size=arena_cache_size,
         tflite_loc=tflite_loc,
@@ -52,34 +92,103 @@ def generate_model_cpp(
         model_length=model_length,
         namespace=namespace,
         tflite_attribute=tflite_loc_choice,
-    ).dump(str(cpp_filename))
+    )
+    write_file_if_changed(str(cpp_filename), model_code + resolver_code)
+
+    # Write the metadata header so the application skips flatbuffer lookups
+    header_filename = output_dir / (model_file + "_metadata.hpp")
+    metadata_code = env.get_template("model_metadata.hpp.template").render(
+        common_template_header=license_header,
+        guard=f"{namespace}_{model_file}_METADATA_HPP".upper(),
+        namespace=namespace,
+        tensor_arena_size=tensor_arena_size,
+        model_length=model_length,
+        **get_model_metadata(load_model_index(tflite_path)),
+    )
+    write_file_if_changed(str(header_filename), metadata_code)
 
     # Write the binary file
     flash_file = tflite_path.replace("_vela.tflite", ".bin")
 
-    # Read vela bytes
-    with open(tflite_path, "rb") as tflite_model:
-        data = tflite_model.read()
+    output_files = [str(cpp_filename), str(header_filename), flash_file]
+
+    # Read the previous binary first, it may be the one about to be replaced.
+    # Without one, as on a first build, the flash is erased and all is dirty.
+    if previous_bin and Path(previous_bin).is_file():
+        with open(previous_bin, "rb") as fp:
+            previous_data = fp.read()
+    elif previous_bin:
+        print(f"++ No previous image {previous_bin}, the delta holds every sector")
+        previous_data = b""
+
     # Write to binary file
-    with open(flash_file, "wb") as fp:
-        fp.write(data)
+    write_file_if_changed(flash_file, data)
+
+    # Write the sectors to reflash
+    if previous_bin:
+        delta_file = tflite_path.replace("_vela.tflite", ".delta")
+        delta, dirty = build_flash_delta(previous_data, data, erase_size)
+        write_file_if_changed(delta_file, delta)
+        num_sectors = (len(data) + erase_size - 1) // erase_size
+        print(
+            f"++ Flash delta {Path(delta_file).name}: {len(dirty)} of {num_sectors}"
+            f" {erase_size} byte sectors dirty"
+        )
+        output_files.append(delta_file)
+
+    return output_files
 
 
-def get_tflite_data(tflite_path):
+def get_tensor_metadata(tensor):
+    """Gets the C++ values describing a graph input or output tensor"""
+
+    quantization = tensor["quantization"]
+    if quantization:
+        scale = quantization["scale"][0]
+        zero_point = quantization["zero_point"][0]
+    else:
+        scale, zero_point = 0.0, 0
+
+    return {
+        "name": tensor["name"],
+        "num_dims": len(tensor["shape"]),
+        # Scalars still need a non empty array
+        "dims": tensor["shape"] or [1],
+        "size": tensor["size"],
+        "type": tflite_types.get(tensor["dtype"], "kTfLiteNoType"),
+        "scale": f"{scale:.9e}f",
+        "zero_point": zero_point,
+    }
+
+
+def get_model_metadata(model_info):
+    """Gets the graph inputs and outputs of the main subgraph"""
+
+    subgraph = model_info["subgraphs"][0]
+    tensors = subgraph["tensors"]
+    return {
+        "inputs": [get_tensor_metadata(tensors[i]) for i in subgraph["inputs"]],
+        "outputs": [get_tensor_metadata(tensors[i]) for i in subgraph["outputs"]],
+    }
+
+
+def get_tflite_data(tflite_path, data=None):
     """
     Reads a binary file and returns a C style array as a
     list of strings.
 
     Argument:
         tflite_path:    path to the tflite model.
+        data:           the model bytes when already read.
 
     Returns:
         tuple: (list of strings, int)
             - List of strings representing the C style array
             - Number of bytes in the binary file
     """
-    with open(tflite_path, "rb") as tflite_model:
-        data = tflite_model.read()
+    if data is None:
+        with open(tflite_path, "rb") as tflite_model:
+            data = tflite_model.read()
 
     bytes_per_line = 32
     hex_digits_per_line = bytes_per_line * 2
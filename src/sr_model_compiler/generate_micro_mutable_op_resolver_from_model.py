@@ -1,10 +1,10 @@
 import os
 import re
 from mako.template import Template
-from tensorflow.lite.tools import visualize as visualize
 from mako import template
 from pathlib import Path
 import platform
+from .model_info import load_model_index
 
 
 def generate_micro_mutable_ops_resolver_header(
@@ -14,6 +14,7 @@ def generate_micro_mutable_ops_resolver_header(
     namespace,
     license_header,
     verify_op_list_against_header=None,
+    index_dir=None,
 ):
     TEMPLATE_DIR = os.path.abspath("templates")
 
@@ -40,39 +41,11 @@ def generate_micro_mutable_ops_resolver_header(
     def GetModelOperatorsAndActivation(model_path):
         """Extracts a set of operators from a tflite model."""
 
-        custom_op_found = False
-        operators_and_activations = set()
-
         print(f"Trying to open {model_path}")
-        with open(model_path, "rb") as f:
-            data_bytes = bytearray(f.read())
-
-        data = visualize.CreateDictFromFlatbuffer(data_bytes)
-
-        for op_code in data["operator_codes"]:
-            if op_code["custom_code"] is None:
-                op_code["builtin_code"] = max(
-                    op_code["builtin_code"], op_code["deprecated_builtin_code"]
-                )
-            else:
-                custom_op_found = True
-                operators_and_activations.add(
-                    visualize.NameListToString(op_code["custom_code"])
-                )
-
-        for op_code in data["operator_codes"]:
-            # Custom operator already added.
-            if (
-                custom_op_found
-                and visualize.BuiltinCodeToName(op_code["builtin_code"]) == "CUSTOM"
-            ):
-                continue
-
-            operators_and_activations.add(
-                visualize.BuiltinCodeToName(op_code["builtin_code"])
-            )
 
-        return operators_and_activations
+        # Custom operators are named by their custom code in the index
+        data = load_model_index(model_path, index_dir)
+        return set(data["operator_codes"])
 
     def GenerateMicroMutableOpsResolverHeaderFile(
         operators, name_of_model, output_dir, namespace
@@ -0,0 +1,638 @@
+"""Removes redundant operators from a TFLite model before vela"""
+
+import os
+import sys
+import copy
+import argparse
+import tempfile
+import numpy as np
+from .model_info import BUILTIN_OPERATOR_NAMES, read_model_info
+from .pipeline import run_stage
+
+# Operators that only change the shape of their first input
+SHAPE_OPS = ["RESHAPE", "SQUEEZE", "EXPAND_DIMS"]
+
+# Operators that convert back what their producer converted
+INVERSE_OPS = {"DEQUANTIZE": "QUANTIZE", "QUANTIZE": "DEQUANTIZE"}
+
+# Float outputs must match like np.allclose with these tolerances
+FLOAT_RTOL = 1e-5
+FLOAT_ATOL = 1e-6
+
+
+def load_flatbuffer_utils():
+    """Loads the TFLite flatbuffer object API from TensorFlow"""
+
+    # TensorFlow is only loaded when the cleanup runs
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+    from tensorflow.lite.tools import (  # pylint: disable=C0415
+        flatbuffer_utils,
+    )
+
+    return flatbuffer_utils
+
+
+def get_opcode_name(model, op):
+    """Gets the builtin name of an operator of the object API model"""
+
+    op_code = model.operatorCodes[op.opcodeIndex]
+    if op_code.customCode:
+        return op_code.customCode.decode("utf-8")
+    builtin_code = max(op_code.builtinCode, op_code.deprecatedBuiltinCode)
+    return BUILTIN_OPERATOR_NAMES.get(builtin_code, f"BUILTIN_{builtin_code}")
+
+
+def get_quantization(tensor):
+    """Gets a comparable type and quantization of a tensor"""
+
+    q = tensor.quantization
+    scale = [] if q is None or q.scale is None else [float(s) for s in q.scale]
+    zero_point = (
+        [] if q is None or q.zeroPoint is None else [int(z) for z in q.zeroPoint]
+    )
+    return tensor.type, scale, zero_point
+
+
+def get_shape(tensor):
+    """Gets the shape of a tensor as a list"""
+
+    return [] if tensor.shape is None else [int(d) for d in tensor.shape]
+
+
+def get_consumers(subgraph):
+    """Gets the operators reading each tensor"""
+
+    consumers = {}
+    for i, op in enumerate(subgraph.operators or []):
+        for t in op.inputs if op.inputs is not None else []:
+            if t >= 0:
+                consumers.setdefault(int(t), []).append(i)
+    return consumers
+
+
+def get_producers(subgraph):
+    """Gets the operator writing each tensor"""
+
+    producers = {}
+    for i, op in enumerate(subgraph.operators or []):
+        for t in op.outputs if op.outputs is not None else []:
+            if t >= 0:
+                producers[int(t)] = i
+    return producers
+
+
+def get_tensor_name(subgraph, index):
+    """Gets a tensor name of the object API model"""
+
+    name = subgraph.tensors[index].name
+    return name.decode("utf-8") if isinstance(name, bytes) else str(name)
+
+
+def get_rewrite(key, kind, remove, replace):
+    """Describes a rewrite, key is the subgraph and the replaced tensor name"""
+
+    return {
+        "subgraph": key[0],
+        "kind": kind,
+        "key": key,
+        "remove": remove,
+        "replace": replace,
+    }
+
+
+def is_on_grid(model, subgraph, producers, source, quantized):
+    """Checks if a float tensor was dequantized with the given quantization"""
+
+    producer = producers.get(source)
+    if producer is None:
+        return False
+    op = subgraph.operators[producer]
+    if get_opcode_name(model, op) != "DEQUANTIZE":
+        return False
+    grid = subgraph.tensors[int(op.inputs[0])]
+    return get_quantization(grid) == get_quantization(quantized)
+
+
+def find_rewrite(model, skip=()):  # pylint: disable=R0911,R0912,R0914
+    """
+    Finds the next redundant operator pattern.
+
+    Returns:
+        dict: The subgraph, the kind, the operators to remove and the tensor
+            replacements, or None when the model is clean.
+    """
+
+    for s, subgraph in enumerate(model.subgraphs):
+        consumers = get_consumers(subgraph)
+        producers = get_producers(subgraph)
+        protected = {int(t) for t in subgraph.outputs}
+        for i, op in enumerate(subgraph.operators or []):
+            if op.inputs is None or op.outputs is None or len(op.outputs) != 1:
+                continue
+            name = get_opcode_name(model, op)
+            source, output = int(op.inputs[0]), int(op.outputs[0])
+            if source < 0 or output in protected:
+                continue
+            key = (s, get_tensor_name(subgraph, output))
+            if key in skip:
+                continue
+            src, out = subgraph.tensors[source], subgraph.tensors[output]
+            users = consumers.get(output, [])
+            user_names = [get_opcode_name(model, subgraph.operators[u]) for u in users]
+
+            # Operators that do not change their input
+            same = get_quantization(src) == get_quantization(out)
+            if (name in SHAPE_OPS and get_shape(src) == get_shape(out) and same) or (
+                name in ["QUANTIZE", "CAST"] and same
+            ):
+                return get_rewrite(key, "identity", [i], {output: source})
+
+            # The first of back to back shape changes is not needed
+            if name in SHAPE_OPS and users and set(user_names) == {"RESHAPE"}:
+                return get_rewrite(key, "reshape_chain", [i], {output: source})
+
+            # Pairs that convert away and back without changing the values
+            pair = INVERSE_OPS.get(name)
+            if pair and users and user_names == [pair] * len(users):
+                user_outputs = [int(subgraph.operators[u].outputs[0]) for u in users]
+                if any(t in protected for t in user_outputs):
+                    continue
+                if name == "DEQUANTIZE" and any(
+                    get_quantization(subgraph.tensors[t]) != get_quantization(src)
+                    for t in user_outputs
+                ):
+                    continue
+                if name == "QUANTIZE" and any(
+                    subgraph.tensors[t].type != src.type for t in user_outputs
+                ):
+                    continue
+                # Quantizing rounds and clips, a fake quant unless the values
+                # were dequantized from the same grid
+                if name == "QUANTIZE" and not is_on_grid(
+                    model, subgraph, producers, source, out
+                ):
+                    continue
+                kind = (
+                    "dequantize_quantize" if name == "DEQUANTIZE" else "quantize_pair"
+                )
+                replace = {t: source for t in user_outputs}
+                return get_rewrite(key, kind, [i, *users], replace)
+    return None
+
+
+def apply_rewrite(model, rewrite):
+    """Bypasses the operators of a rewrite, their consumers read the source"""
+
+    subgraph = model.subgraphs[rewrite["subgraph"]]
+    for op in subgraph.operators:
+        if op.inputs is not None:
+            op.inputs = [rewrite["replace"].get(int(t), int(t)) for t in op.inputs]
+    subgraph.operators = [
+        op for i, op in enumerate(subgraph.operators) if i not in rewrite["remove"]
+    ]
+
+
+def remove_unused_tensors(model):
+    """Drops the tensors nothing refers to and empties their buffers"""
+
+    for subgraph in model.subgraphs:
+        used = {int(t) for t in subgraph.inputs} | {int(t) for t in subgraph.outputs}
+        for op in subgraph.operators:
+            for tensors in [op.inputs, op.outputs, op.intermediates]:
+                if tensors is not None:
+                    used.update(int(t) for t in tensors if t >= 0)
+        remap = {old: new for new, old in enumerate(sorted(used))}
+
+        def get_index(t, remap=remap):
+            return remap[int(t)] if t >= 0 else int(t)
+
+        subgraph.tensors = [subgraph.tensors[i] for i in sorted(used)]
+        subgraph.inputs = [get_index(t) for t in subgraph.inputs]
+        subgraph.outputs = [get_index(t) for t in subgraph.outputs]
+        for op in subgraph.operators:
+            op.inputs = None if op.inputs is None else [get_index(t) for t in op.inputs]
+            op.outputs = (
+                None if op.outputs is None else [get_index(t) for t in op.outputs]
+            )
+            if op.intermediates is not None:
+                op.intermediates = [get_index(t) for t in op.intermediates]
+
+        s = model.subgraphs.index(subgraph)
+        for signature in model.signatureDefs or []:
+            if signature.subgraphIndex != s:
+                continue
+            for tensor_map in (signature.inputs or []) + (signature.outputs or []):
+                tensor_map.tensorIndex = remap[int(tensor_map.tensorIndex)]
+
+    referenced = {0}
+    referenced.update(t.buffer for sg in model.subgraphs for t in sg.tensors)
+    referenced.update(m.buffer for m in model.metadata or [])
+    for i, buffer in enumerate(model.buffers):
+        if i not in referenced:
+            buffer.data = None
+
+
+def get_random_inputs(model_file, seed=0):
+    """Gets random inputs for every model input, in the full range of its type"""
+
+    import tensorflow as tf  # pylint: disable=C0415
+
+    rng = np.random.default_rng(seed)
+    interpreter = tf.lite.Interpreter(model_path=model_file)
+    inputs = []
+    for detail in interpreter.get_input_details():
+        dtype = detail["dtype"]
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            data = rng.integers(info.min, info.max, detail["shape"], endpoint=True)
+        else:
+            data = rng.uniform(-1.0, 1.0, detail["shape"])
+        inputs.append(data.astype(dtype))
+    return inputs
+
+
+def run_model(model_file, inputs):
+    """Runs the reference interpreter, returns the outputs and their scales"""
+
+    import tensorflow as tf  # pylint: disable=C0415
+
+    interpreter = tf.lite.Interpreter(
+        model_path=model_file,
+        experimental_op_resolver_type=tf.lite.experimental.OpResolverType.BUILTIN_REF,
+    )
+    interpreter.allocate_tensors()
+    for detail, data in zip(interpreter.get_input_details(), inputs):
+        interpreter.set_tensor(detail["index"], data)
+    interpreter.invoke()
+    return [
+        interpreter.get_tensor(d["index"]) for d in interpreter.get_output_details()
+    ]
+
+
+def compare_output(expected, actual, rtol=FLOAT_RTOL, atol=FLOAT_ATOL):
+    """
+    Compares one output of the models.
+
+    Returns:
+        tuple: The largest difference in quantization steps for a quantized
+            output, and in multiples of the np.allclose bound
+            atol + rtol * |expected| for a float output.
+    """
+
+    if expected.shape != actual.shape or expected.dtype != actual.dtype:
+        return float("inf"), float("inf")
+    difference = np.abs(expected.astype(np.float64) - actual.astype(np.float64))
+    if np.issubdtype(expected.dtype, np.integer):
+        return float(np.max(difference, initial=0)), 0.0
+    bound = atol + rtol * np.abs(expected.astype(np.float64))
+    return 0.0, float(np.max(difference / bound, initial=0))
+
+
+def get_output_error(  # pylint: disable=R0913,R0917
+    model_file, cleaned_file, num_runs=3, rtol=FLOAT_RTOL, atol=FLOAT_ATOL
+):
+    """
+    Compares the outputs of the models on random inputs.
+
+    Returns:
+        tuple: The largest difference of the quantized outputs in steps and
+            of the float outputs in multiples of their tolerance.
+    """
+
+    max_steps, max_float = 0.0, 0.0
+    for seed in range(num_runs):
+        inputs = get_random_inputs(model_file, seed)
+        expected = run_model(model_file, inputs)
+        actual = run_model(cleaned_file, inputs)
+        if len(expected) != len(actual):
+            return float("inf"), float("inf")
+        for a, b in zip(expected, actual):
+            steps, float_error = compare_output(a, b, rtol, atol)
+            max_steps, max_float = max(max_steps, steps), max(max_float, float_error)
+    return max_steps, max_float
+
+
+def clean_model(model, skip=()):
+    """Applies every rewrite found, returns them"""
+
+    rewrites = []
+    while (rewrite := find_rewrite(model, skip)) is not None:
+        apply_rewrite(model, rewrite)
+        rewrites.append(rewrite)
+    return rewrites
+
+
+def sr_cleanup_graph(  # pylint: disable=R0913,R0914,R0917
+    model_file,
+    output_file,
+    verify=True,
+    tolerance=1.0,
+    num_runs=3,
+    rtol=FLOAT_RTOL,
+    atol=FLOAT_ATOL,
+):
+    """
+    Removes identity operators, back to back reshapes and quantize/dequantize
+    pairs that convert back to exactly the same values, then checks the
+    cleaned model against the original on random inputs with the reference
+    interpreter. When the outputs differ by more than allowed, the rewrites
+    are tried one at a time and only those that keep the outputs are kept.
+
+    Args:
+        model_file (str): The TFLite model.
+        output_file (str): Where to write the cleaned model.
+        verify (bool): Check the outputs with the reference interpreter.
+        tolerance (float): Largest quantized output difference, in
+            quantization steps.
+        num_runs (int): Number of random inputs compared.
+        rtol (float): Relative tolerance of the float outputs.
+        atol (float): Absolute tolerance of the float outputs.
+
+    Returns:
+        dict: The rewrites, the operator counts and the largest output errors.
+    """
+
+    flatbuffer_utils = load_flatbuffer_utils()
+    original = flatbuffer_utils.read_model(model_file)
+    model = copy.deepcopy(original)
+    rewrites = clean_model(model)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    def write_model(candidate):
+        remove_unused_tensors(candidate)
+        flatbuffer_utils.write_model(candidate, output_file)
+
+    def check_outputs():
+        steps, float_error = get_output_error(
+            model_file, output_file, num_runs, rtol, atol
+        )
+        return steps <= tolerance and float_error <= 1.0, (steps, float_error)
+
+    write_model(model)
+    errors = (0.0, 0.0)
+    if verify and rewrites:
+        same, errors = check_outputs()
+        if not same:
+            print(
+                f"++ Cleanup changed the outputs by {errors[0]:g} steps and"
+                f" {errors[1]:.3g} of the float tolerance, checking each rewrite"
+            )
+            model, rewrites, skip = copy.deepcopy(original), [], set()
+            errors = (0.0, 0.0)
+            while (rewrite := find_rewrite(model, skip)) is not None:
+                candidate = copy.deepcopy(model)
+                apply_rewrite(candidate, rewrite)
+                write_model(copy.deepcopy(candidate))
+                same, error = check_outputs()
+                if same:
+                    model = candidate
+                    errors = (max(errors[0], error[0]), max(errors[1], error[1]))
+                    rewrites.append(rewrite)
+                else:
+                    skip.add(rewrite["key"])
+            write_model(model)
+
+    return {
+        "model_file": model_file,
+        "output_file": output_file,
+        "operators_before": sum(len(sg.operators or []) for sg in original.subgraphs),
+        "operators_after": sum(len(sg.operators or []) for sg in model.subgraphs),
+        "rewrites": [
+            {"kind": r["kind"], "tensor": r["key"][1], "removed": len(r["remove"])}
+            for r in rewrites
+        ],
+        "verified": verify,
+        "max_error": errors[0],
+        "max_float_error": errors[1],
+    }
+
+
+def get_vela_partitions(vela_model_file):
+    """Counts the NPU partitions and the operators left on the CPU"""
+
+    model_info = read_model_info(vela_model_file)
+    opcodes = [op["opcode"] for op in model_info["subgraphs"][0]["operators"]]
+    npu = sum(1 for opcode in opcodes if opcode == "ethos-u")
+    return {"npu_partitions": npu, "cpu_operators": len(opcodes) - npu}
+
+
+def print_cleanup_report(report):
+    """Prints the rewrites and the savings"""
+
+    for rewrite in report["rewrites"]:
+        print(f"   {rewrite['kind']}: {rewrite['tensor']}")
+    print(
+        f"++ Graph cleanup removed {report['operators_before'] - report['operators_after']}"
+        f" of {report['operators_before']} operators"
+        + (
+            f", max output error {report['max_error']:g} steps and"
+            f" {report['max_float_error']:.3g} of the float tolerance"
+            if report["verified"]
+            else ""
+        )
+    )
+    if "vela" in report:
+        print_vela_comparison(report["vela"])
+
+
+def print_vela_comparison(compiles):
+    """Prints the NPU partitions and cycles before and after the cleanup"""
+
+    before, after = compiles["before"], compiles["after"]
+    print(
+        f"++ NPU partitions {before['npu_partitions']} -> {after['npu_partitions']},"
+        f" CPU operators {before['cpu_operators']} -> {after['cpu_operators']},"
+        f" cycles {before['cycles']:.0f} -> {after['cycles']:.0f}"
+        f" (saved {before['cycles'] - after['cycles']:.0f})"
+    )
+
+
+def run_cleanup_stage(manifest, args):
+    """
+    Runs the cleanup as a compiler stage. The cleaned model keeps the file
+    name, so the later stages read it in place of the original.
+    """
+
+    output_file = os.path.join(
+        args.output_dir, "cleanup", os.path.basename(args.model_file)
+    )
+    report = run_stage(
+        manifest,
+        "cleanup",
+        [args.model_file],
+        {"tolerance": 1.0, "rtol": FLOAT_RTOL, "atol": FLOAT_ATOL},
+        lambda: (sr_cleanup_graph(args.model_file, output_file), [output_file]),
+        args.force,
+    )
+    print_cleanup_report(report)
+    args.model_file = output_file
+    return report
+
+
+def get_vela_compile(model_file, output_dir, results):
+    """Gets the partitions and cycles of a vela compile of model_file"""
+
+    model_name = os.path.basename(model_file).replace(".tflite", "")
+    compile_info = get_vela_partitions(
+        os.path.join(output_dir, f"{model_name}_vela.tflite")
+    )
+    compile_info["cycles"] = float(results.get("cycles_total", 0))
+    return compile_info
+
+
+def compare_cleanup(manifest, args, cleanup, results):
+    """
+    Compiles the model from before the cleanup with the same vela options,
+    so the report shows the NPU partitions and cycles the cleanup saved.
+
+    Returns:
+        dict: The cleanup report, with the compiles under "vela".
+    """
+
+    if not cleanup or not cleanup["rewrites"] or not results["cycles_npu"]:
+        return cleanup
+
+    # The compiler runs the cleanup stage, so it is imported on use
+    from .sr_model_compiler import (  # pylint: disable=C0415
+        get_vela_config,
+        get_vela_params,
+        get_vela_version,
+        run_vela,
+    )
+
+    before_args = copy.copy(args)
+    before_args.model_file = cleanup["model_file"]
+    before_args.output_dir = os.path.join(args.output_dir, "cleanup", "before")
+    before_args.allocation_report = None
+    os.makedirs(before_args.output_dir, exist_ok=True)
+    arm_config, _ = get_vela_config(args)
+    before = run_stage(
+        manifest,
+        "cleanup_vela",
+        [before_args.model_file, arm_config],
+        {
+            "vela_params": get_vela_params(before_args, ""),
+            "vela_version": get_vela_version(),
+        },
+        lambda: run_vela(before_args),
+        args.force,
+    )
+    if not before["cycles_npu"]:
+        print("++ The model before the cleanup did not compile, no vela comparison")
+        return cleanup
+
+    compiles = {
+        "before": get_vela_compile(
+            before_args.model_file, before_args.output_dir, before
+        ),
+        "after": get_vela_compile(args.model_file, args.output_dir, results),
+    }
+    print_vela_comparison(compiles)
+    return dict(cleanup, vela=compiles)
+
+
+def compare_vela_compiles(model_file, cleaned_file, output_dir, system_config=None):
+    """
+    Compiles the original and the cleaned model with vela.
+
+    Returns:
+        dict: The NPU partitions, CPU operators and cycles of each.
+    """
+
+    # The compiler runs the cleanup stage, so it is imported on use
+    from .sr_model_compiler import sr_model_compiler  # pylint: disable=C0415
+
+    compiles = {}
+    for name, tflite_file in [("before", model_file), ("after", cleaned_file)]:
+        kwargs = {"system_config": system_config} if system_config else {}
+        results = sr_model_compiler(
+            model_file=tflite_file,
+            output_dir=os.path.join(output_dir, name),
+            script=["model"],
+            no_preflight=True,
+            **kwargs,
+        )
+        compiles[name] = get_vela_compile(
+            tflite_file, os.path.join(output_dir, name), results
+        )
+    return compiles
+
+
+def get_graph_cleanup_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Remove redundant operators from a TFLite model before vela."
+    )
+    parser.add_argument("model_file", type=str, help="TFLite model to clean up")
+    parser.add_argument(
+        "-o",
+        "--output-file",
+        type=str,
+        help="Cleaned model, <model>_cleaned.tflite by default",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="Largest quantized output change on random inputs, in steps",
+    )
+    parser.add_argument(
+        "--rtol",
+        type=float,
+        default=FLOAT_RTOL,
+        help="Relative tolerance of the float outputs, as in np.allclose",
+    )
+    parser.add_argument(
+        "--atol",
+        type=float,
+        default=FLOAT_ATOL,
+        help="Absolute tolerance of the float outputs, as in np.allclose",
+    )
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="Skip the reference interpreter check",
+    )
+    parser.add_argument(
+        "--no-vela",
+        action="store_true",
+        help="Skip compiling both models to report the partitions and cycles",
+    )
+    parser.add_argument(
+        "-s",
+        "--system-config",
+        type=str,
+        help="System config of the vela comparison, the compiler default if unset",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line graph cleanup"""
+    parser = get_graph_cleanup_argparser()
+    args = parser.parse_args()
+
+    output_file = args.output_file or args.model_file.replace(
+        ".tflite", "_cleaned.tflite"
+    )
+    report = sr_cleanup_graph(
+        args.model_file,
+        output_file,
+        not args.no_verify,
+        args.tolerance,
+        rtol=args.rtol,
+        atol=args.atol,
+    )
+    if report["rewrites"] and not args.no_vela:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report["vela"] = compare_vela_compiles(
+                args.model_file, output_file, tmp_dir, args.system_config
+            )
+    print_cleanup_report(report)
+    print(f"++ Wrote {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
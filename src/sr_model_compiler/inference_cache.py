@@ -0,0 +1,139 @@
+"""Persistent cache of reference inference results"""
+
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from importlib import metadata
+import numpy as np
+from .gen_input_expected_data import run_reference_inference
+from .utils import set_default_mode
+
+
+def get_default_cache_dir():
+    """Gets the default cache directory, honouring XDG_CACHE_HOME"""
+
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = os.path.join(Path.home(), ".cache")
+    return os.path.join(cache_home, "sr_model_compiler")
+
+
+def get_tensorflow_version():
+    """Gets the installed TensorFlow version without importing it"""
+
+    try:
+        return metadata.version("tensorflow")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_inference_cache_key(model_file, input_files=None):
+    """Hashes the model bytes, input bytes and TensorFlow version"""
+
+    sha = hashlib.sha256()
+    sha.update(f"tensorflow={get_tensorflow_version()}\n".encode("utf-8"))
+    with open(model_file, "rb") as fp:
+        sha.update(hashlib.sha256(fp.read()).digest())
+
+    # Random inputs are cached too, so an empty list is a valid key
+    for input_file in input_files or []:
+        sha.update(os.path.splitext(input_file)[1].lower().encode("utf-8"))
+        with open(input_file, "rb") as fp:
+            sha.update(hashlib.sha256(fp.read()).digest())
+
+    return sha.hexdigest()
+
+
+def get_inference_cache_file(cache_dir, key):
+    """Gets the cache entry path for a key"""
+
+    return os.path.join(cache_dir, "inference", key[:2], key + ".npz")
+
+
+def load_inference_cache(cache_dir, key):
+    """
+    Loads the reference inputs and expected outputs for a key.
+
+    Returns:
+        tuple: (list of input arrays, list of output arrays) or None on a miss
+    """
+
+    cache_file = get_inference_cache_file(cache_dir, key)
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            num_inputs = int(data["num_inputs"])
+            num_outputs = int(data["num_outputs"])
+            input_data_list = [data[f"input_{i}"] for i in range(num_inputs)]
+            output_data_list = [data[f"output_{i}"] for i in range(num_outputs)]
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Ignoring corrupt inference cache entry {cache_file}: {e}")
+        return None
+
+    return input_data_list, output_data_list
+
+
+def store_inference_cache(cache_dir, key, input_data_list, output_data_list):
+    """Stores the reference inputs and expected outputs for a key"""
+
+    cache_file = get_inference_cache_file(cache_dir, key)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+    arrays = {
+        "num_inputs": np.array(len(input_data_list)),
+        "num_outputs": np.array(len(output_data_list)),
+    }
+    for i, input_data in enumerate(input_data_list):
+        arrays[f"input_{i}"] = input_data
+    for i, output_data in enumerate(output_data_list):
+        arrays[f"output_{i}"] = output_data
+
+    # Write to a temporary file first so concurrent runs never see a partial entry
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            np.savez(fp, **arrays)
+        os.replace(tmp_file, cache_file)
+        set_default_mode(cache_file)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def run_cached_reference_inference(
+    model_file, input_files=None, cache_dir=None, stats=None
+):
+    """
+    Runs the reference inference, reusing the results when neither the model
+    nor the inputs changed.
+
+    Args:
+        model_file (str): The TFLite model.
+        input_files (list): The npy/bin inputs, random inputs when None.
+        cache_dir (str): The cache directory, False to not use the cache.
+        stats (dict): Counts the cache "hits" and "misses" when given.
+
+    Returns:
+        tuple: (list of input arrays, list of output arrays)
+    """
+
+    if cache_dir is False:
+        return run_reference_inference(model_file, input_files)
+
+    cache_dir = cache_dir or get_default_cache_dir()
+    cache_key = get_inference_cache_key(model_file, input_files)
+    cached = load_inference_cache(cache_dir, cache_key)
+    outcome = "hits" if cached else "misses"
+    if stats is not None:
+        stats[outcome] = stats.get(outcome, 0) + 1
+    if cached:
+        print(f"Reference inference cache hit {cache_key[:16]}")
+        return cached
+
+    input_arrays, output_arrays = run_reference_inference(model_file, input_files)
+    store_inference_cache(cache_dir, cache_key, input_arrays, output_arrays)
+    return input_arrays, output_arrays
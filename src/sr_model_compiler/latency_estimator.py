@@ -0,0 +1,573 @@
+"""Analytical latency estimates for other system configs from one vela run"""
+
+import os
+import sys
+import argparse
+import tempfile
+import configparser
+from ethosu.vela import compiler_driver, model_reader, scheduler
+from ethosu.vela.architecture_features import ArchitectureFeatures
+from ethosu.vela.errors import VelaError
+from ethosu.vela.npu_performance import (
+    PassCycles,
+    estimate_full_op_performance,
+    measure_mem2mem_cycles,
+)
+from .layer_diff import load_compile_output
+from .sr_model_compiler import get_model_types, sr_model_compiler
+
+SYSTEM_CONFIG_PREFIX = "System_Config."
+
+# Vela memory names and the per layer access cycle columns
+MEMORY_AREAS = {
+    "Sram": "sram",
+    "Dram": "dram",
+    "OnChipFlash": "onflash",
+    "OffChipFlash": "offflash",
+}
+
+# Parameters the estimate follows
+ESTIMATED_PARAMS = ["core_clock"] + [f"{area}_clock_scale" for area in MEMORY_AREAS]
+
+# Vela does not read the outstanding transfer limits from the INI
+IGNORED_PARAMS = [
+    f"{area}_{name}" for area in MEMORY_AREAS for name in ["max_reads", "max_writes"]
+]
+
+# Parameters that move tensors to other memories, a fixed schedule cannot follow
+PLACEMENT_PARAMS = ["axi0_port", "axi1_port"]
+
+# Vela cycle columns and what bounds a layer
+PASS_CYCLES = {
+    "npu": PassCycles.Npu,
+    "sram": PassCycles.SramAccess,
+    "dram": PassCycles.DramAccess,
+    "onflash": PassCycles.OnChipFlashAccess,
+    "offflash": PassCycles.OffChipFlashAccess,
+}
+
+
+def load_system_configs(config_file):
+    """
+    Reads every System_Config section of a vela INI, with inherit resolved.
+
+    Returns:
+        dict: System config name to its parameters.
+    """
+
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(config_file, encoding="utf-8")
+
+    def get_section(section):
+        params = {}
+        if parser.has_option(section, "inherit"):
+            params.update(get_section(parser.get(section, "inherit")))
+        params.update(
+            {k: v.strip() for k, v in parser.items(section) if k != "inherit"}
+        )
+        return params
+
+    return {
+        section[len(SYSTEM_CONFIG_PREFIX) :]: get_section(section)
+        for section in parser.sections()
+        if section.startswith(SYSTEM_CONFIG_PREFIX)
+    }
+
+
+def parse_overrides(values):
+    """Parses name=value system config overrides"""
+
+    overrides = {}
+    for value in values or []:
+        name, setting = value.split("=", 1)
+        overrides[name.strip()] = setting.strip()
+    return overrides
+
+
+def get_clock_scale(system_config, area):
+    """Gets the clock scale of a memory, 1.0 as in vela when not set"""
+
+    return float(system_config.get(f"{area}_clock_scale", 1.0))
+
+
+def get_not_estimated(base_config, target_config):
+    """
+    Gets the parameters the target changes that the estimate cannot follow.
+    Vela uses the burst length for the IFM and OFM transfer efficiency and
+    the latencies for the block and weight DMA cycles, but the per layer
+    report does not give the transfer sizes they apply to. The schedule
+    estimate, see sr_estimate_schedule_latency, follows them.
+
+    Returns:
+        list: The parameter names, sorted.
+    """
+
+    return sorted(
+        name
+        for name in set(base_config) | set(target_config)
+        if name not in ESTIMATED_PARAMS
+        and name not in IGNORED_PARAMS
+        and base_config.get(name) != target_config.get(name)
+    )
+
+
+def estimate_layer_cycles(layer, base_config, target_config):
+    """
+    Estimates the cycles of one layer under another system config.
+
+    Vela costs a layer as the largest of its NPU cycles and the access cycles
+    of each memory. Access cycles are bytes over the memory bandwidth per
+    cycle, so they scale with the inverse of the clock scale. The NPU cycles
+    are carried unchanged, see get_not_estimated for what that leaves out.
+
+    Returns:
+        tuple: (cycles, what bounds the layer)
+    """
+
+    access_cycles = {}
+    for area, key in MEMORY_AREAS.items():
+        cycles = layer[f"{key}_ac"]
+        if not cycles:
+            continue
+        access_cycles[key] = (
+            cycles
+            * get_clock_scale(base_config, area)
+            / get_clock_scale(target_config, area)
+        )
+
+    bound, cycles = max(
+        [("npu", layer["npu_cycles"])] + list(access_cycles.items()), key=lambda b: b[1]
+    )
+    return cycles, bound
+
+
+def estimate_latency(per_layer, base_config, target_config):
+    """
+    Estimates the latency of a compile under another system config.
+
+    Args:
+        per_layer (list): The vela per layer report of the compile.
+        base_config (dict): The system config it was compiled with.
+        target_config (dict): The system config to estimate.
+
+    Returns:
+        dict: The total cycles, inference time in us, the per layer cycles and
+            the changed parameters the cycles do not account for.
+    """
+
+    layers = []
+    for layer in per_layer:
+        cycles, bound = estimate_layer_cycles(layer, base_config, target_config)
+        layers.append({"name": layer["name"], "cycles": cycles, "bound": bound})
+
+    core_clock = float(target_config.get("core_clock", base_config["core_clock"]))
+    return get_estimate(
+        layers, core_clock, get_not_estimated(base_config, target_config)
+    )
+
+
+def get_estimate(layers, core_clock, not_estimated):
+    """Sums the estimated layers, see estimate_latency for the fields"""
+
+    bounds = {}
+    for layer in layers:
+        bounds[layer["bound"]] = bounds.get(layer["bound"], 0) + layer["cycles"]
+
+    cycles = sum(layer["cycles"] for layer in layers)
+    return {
+        "cycles": cycles,
+        "inference_time_us": cycles / core_clock * 1e6,
+        "bounds": bounds,
+        "layers": layers,
+        "not_estimated": not_estimated,
+    }
+
+
+def sr_estimate_latency(compile_output, config_file, targets=None, overrides=None):
+    """
+    Estimates the latency of a compile for other system configs of the INI.
+
+    Args:
+        compile_output (str): Output directory, per layer CSV or vela log of a
+            compile with --per-layer, and its summary CSV.
+        config_file (str): The vela INI with the system configs.
+        targets (list): The system configs to estimate, all when None.
+        overrides (dict): Parameters changed on top of every target, such
+            as OffChipFlash_clock_scale.
+
+    Returns:
+        list: One estimate per target, fastest first.
+    """
+
+    compile_data = load_compile_output(compile_output)
+    system_configs = load_system_configs(config_file)
+    base_name = compile_data["summary"]["system_config"]
+    base_config = system_configs[base_name]
+
+    estimates = []
+    for name in targets or list(system_configs):
+        target_config = dict(system_configs[name])
+        target_config.update(overrides or {})
+        estimate = estimate_latency(compile_data["layers"], base_config, target_config)
+        estimate["system_config"] = name
+        estimate["base_config"] = base_name
+        estimates.append(estimate)
+    estimates.sort(key=lambda e: e["cycles"])
+    return estimates
+
+
+def get_vela_arch(  # pylint: disable=R0913,R0917
+    config_file,
+    system_config,
+    memory_mode,
+    accel_config="ethos-u55-128",
+    arena_cache_size=None,
+):
+    """Gets the vela architecture of a system config and memory mode"""
+
+    return ArchitectureFeatures(
+        vela_config_files=[os.path.abspath(config_file)],
+        system_config=system_config,
+        memory_mode=memory_mode,
+        accelerator_config=accel_config,
+        max_blockdep=ArchitectureFeatures.MAX_BLOCKDEP,
+        verbose_config=False,
+        arena_cache_size=arena_cache_size,
+    )
+
+
+def load_vela_schedule(model_file, arch, optimize="Size"):
+    """
+    Schedules a model with vela in process, as a compile for arch would.
+
+    Returns:
+        Graph: The vela graph, its subgraphs carry the schedule.
+    """
+
+    nng, network_type = model_reader.read_model(
+        model_file, model_reader.ModelReaderOptions()
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compiler_driver.compiler_driver(
+            nng,
+            arch,
+            compiler_driver.CompilerOptions(output_dir=tmp_dir),
+            scheduler.SchedulerOptions(
+                optimization_strategy=scheduler.OptimizationStrategy[optimize],
+                sram_target=arch.arena_cache_size,
+                verbose_schedule=False,
+            ),
+            network_type,
+            os.path.join(tmp_dir, "schedule"),
+        )
+    return nng
+
+
+def recost_schedule(nng, arch):
+    """
+    Costs each operator of a vela schedule on another architecture, the
+    way vela costs its final schedule. This covers the latencies and burst
+    lengths on the transfer sizes of each pass. The scheduler sets the full
+    weight DMA cycles, so they are recomputed for arch.
+
+    Returns:
+        list: The name, cycles and what bounds each operator.
+    """
+
+    layers = []
+    for subgraph in nng.subgraphs:
+        prev_op = None
+        for sched_op in subgraph.sched_ops:
+            cost = subgraph.schedule.cost_map[sched_op]
+            if cost.npu_weights_tensor and cost.buffered_weight_tensors:
+                cost.full_weight_transfer_cycles = measure_mem2mem_cycles(
+                    arch,
+                    cost.npu_weights_tensor.mem_area,
+                    arch.fast_storage_mem_area,
+                    len(cost.npu_weights_tensor.buffer),
+                )
+            _, _, cycles = estimate_full_op_performance(
+                arch, subgraph.schedule, sched_op, prev_op, cost.block_config
+            )
+            layers.append(
+                {
+                    "name": sched_op.name,
+                    "cycles": float(cycles[PassCycles.Total]),
+                    "bound": max(
+                        PASS_CYCLES, key=lambda b, c=cycles: c[PASS_CYCLES[b]]
+                    ),
+                }
+            )
+            prev_op = sched_op
+    return layers
+
+
+def write_override_ini(config_file, names, overrides, output_file):
+    """
+    Writes a copy of the INI with a section per system config that applies
+    the overrides on top of it.
+
+    Returns:
+        dict: The system config name to its section with the overrides.
+    """
+
+    with open(config_file, "r", encoding="utf-8") as fp:
+        lines = [fp.read().rstrip("\n"), "", "; Estimate overrides"]
+    for name in names:
+        lines += ["", f"[System_Config.{name}_override]"]
+        lines.append(f"inherit=System_Config.{name}")
+        lines += [f"{k}={v}" for k, v in overrides.items()]
+    with open(output_file, "w", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+    return {name: f"{name}_override" for name in names}
+
+
+def sr_estimate_schedule_latency(  # pylint: disable=R0913,R0914,R0917
+    model_file,
+    config_file,
+    base_name,
+    targets=None,
+    overrides=None,
+    memory_mode=None,
+    **kwargs,
+):
+    """
+    Estimates the latency of a model for other system configs of the INI by
+    scheduling it once for base_name, then costing that schedule under each
+    target. Unlike sr_estimate_latency this follows every memory parameter
+    vela reads, only a change of the memory ports needs another schedule.
+
+    Args:
+        model_file (str): The TFLite model.
+        config_file (str): The vela INI with the system configs.
+        base_name (str): The system config to schedule for.
+        targets (list): The system configs to estimate, all when None.
+        overrides (dict): Parameters changed on top of every target.
+        memory_mode (str): The memory mode, the last of the INI when None.
+        **kwargs: accel_config, arena_cache_size and optimize as in the
+            compiler.
+
+    Returns:
+        list: One estimate per target, fastest first.
+    """
+
+    system_configs = load_system_configs(config_file)
+    targets = targets or list(system_configs)
+    memory_mode = memory_mode or get_model_types(config_file)[0][base_name][1][-1]
+    optimize = kwargs.pop("optimize", "Size")
+    nng = load_vela_schedule(
+        model_file,
+        get_vela_arch(config_file, base_name, memory_mode, **kwargs),
+        optimize,
+    )
+
+    estimates = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_file, sections = config_file, {name: name for name in targets}
+        if overrides:
+            target_file = os.path.join(tmp_dir, os.path.basename(config_file))
+            sections = write_override_ini(config_file, targets, overrides, target_file)
+        for name in targets:
+            base_config = system_configs[base_name]
+            target_config = dict(system_configs[name], **(overrides or {}))
+            changed = sorted(
+                p
+                for p in set(base_config) | set(target_config)
+                if base_config.get(p) != target_config.get(p)
+            )
+            try:
+                arch = get_vela_arch(target_file, sections[name], memory_mode, **kwargs)
+                estimate = get_estimate(
+                    recost_schedule(nng, arch),
+                    arch.core_clock,
+                    [p for p in changed if p in PLACEMENT_PARAMS],
+                )
+            except (VelaError, ValueError) as e:
+                print(f"++ Vela rejected {name}, not estimated: {e}")
+                estimate = get_estimate([], 1.0, changed)
+                estimate["cycles"] = estimate["inference_time_us"] = float("inf")
+            estimate["system_config"] = name
+            estimate["base_config"] = base_name
+            estimates.append(estimate)
+    estimates.sort(key=lambda e: e["cycles"])
+    return estimates
+
+
+def prune_estimates(estimates, margin=0.1):
+    """
+    Keeps the candidates estimated within margin of the fastest one, the ones
+    worth a full vela compile. Candidates changing parameters the estimate
+    does not follow are always kept.
+    """
+
+    estimated = [e["cycles"] for e in estimates if not e["not_estimated"]]
+    if not estimated:
+        return list(estimates)
+    fastest = min(estimated)
+    return [
+        e
+        for e in estimates
+        if e["not_estimated"] or e["cycles"] <= fastest * (1 + margin)
+    ]
+
+
+def validate_estimates(model_file, estimates, config_file, output_dir=None):
+    """
+    Compiles the model with vela for every estimated system config and
+    reports the estimate error.
+
+    Returns:
+        list: The estimated and vela cycles and the error in percent.
+    """
+
+    validation = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for estimate in estimates:
+            results = sr_model_compiler(
+                model_file=model_file,
+                output_dir=os.path.join(
+                    output_dir or tmp_dir, estimate["system_config"]
+                ),
+                system_config=estimate["system_config"],
+                system_config_ini_file=config_file,
+                no_preflight=True,
+            )
+            vela_cycles = float(results.get("cycles_total", 0))
+            error = (estimate["cycles"] - vela_cycles) / vela_cycles * 100
+            validation.append(
+                {
+                    "system_config": estimate["system_config"],
+                    "estimate": estimate["cycles"],
+                    "vela": vela_cycles,
+                    "error": error,
+                }
+            )
+    return validation
+
+
+def print_estimates(estimates):
+    """Prints the estimates and what bounds each"""
+
+    print(f"++ Estimated from {estimates[0]['base_config']}" if estimates else "")
+    print(f"{'cycles':>12} {'time us':>10}  bound  system config")
+    for e in estimates:
+        bound = max(e["bounds"], key=e["bounds"].get) if e["bounds"] else "-"
+        print(
+            f"{e['cycles']:>12.0f} {e['inference_time_us']:>10.1f}"
+            f"  {bound:<6} {e['system_config']}"
+        )
+        if e["not_estimated"]:
+            print(f"   not estimated: {', '.join(e['not_estimated'])}")
+
+
+def get_latency_estimator_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Estimate the latency of a compiled model for other system configs."
+    )
+    parser.add_argument(
+        "compile_output",
+        type=str,
+        help="Output directory, per layer CSV or vela log of a --per-layer compile,"
+        " or a TFLite model to schedule with vela",
+    )
+    parser.add_argument(
+        "-b",
+        "--base-config",
+        type=str,
+        help="System config to schedule a TFLite model for, the first of the INI"
+        " by default",
+    )
+    parser.add_argument(
+        "--memory-mode",
+        type=str,
+        help="Memory mode to schedule a TFLite model for, the last of the INI"
+        " by default",
+    )
+    parser.add_argument(
+        "-p",
+        "--optimize",
+        type=str,
+        choices=["Performance", "Size"],
+        default="Size",
+        help="Vela optimization to schedule a TFLite model with",
+    )
+    parser.add_argument(
+        "--system-config-ini-file",
+        type=str,
+        default=os.path.join(
+            os.path.dirname(__file__), "config", "sr100_system_config.ini"
+        ),
+        help="Vela INI with the system configs",
+    )
+    parser.add_argument(
+        "-s",
+        "--system-config",
+        type=str,
+        nargs="+",
+        help="System configs to estimate, all of the INI by default",
+    )
+    parser.add_argument(
+        "--set",
+        type=str,
+        nargs="+",
+        help="Parameter overrides such as OffChipFlash_clock_scale=0.2",
+    )
+    parser.add_argument(
+        "--prune-margin",
+        type=float,
+        help="Only keep configs within this fraction of the fastest",
+    )
+    parser.add_argument(
+        "--validate",
+        type=str,
+        metavar="MODEL_FILE",
+        help="Compile the model with vela for each config and report the error",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line latency estimator"""
+    parser = get_latency_estimator_argparser()
+    args = parser.parse_args()
+
+    if args.compile_output.endswith(".tflite"):
+        estimates = sr_estimate_schedule_latency(
+            args.compile_output,
+            args.system_config_ini_file,
+            args.base_config
+            or next(iter(load_system_configs(args.system_config_ini_file))),
+            args.system_config,
+            parse_overrides(args.set),
+            args.memory_mode,
+            optimize=args.optimize,
+        )
+    else:
+        estimates = sr_estimate_latency(
+            args.compile_output,
+            args.system_config_ini_file,
+            args.system_config,
+            parse_overrides(args.set),
+        )
+    if args.prune_margin is not None:
+        estimates = prune_estimates(estimates, args.prune_margin)
+    print_estimates(estimates)
+
+    if args.validate:
+        validation = validate_estimates(
+            args.validate, estimates, args.system_config_ini_file
+        )
+        print(f"{'estimate':>12} {'vela':>12} {'error':>8}  system config")
+        for v in validation:
+            print(
+                f"{v['estimate']:>12.0f} {v['vela']:>12.0f} {v['error']:>+7.1f}%"
+                f"  {v['system_config']}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
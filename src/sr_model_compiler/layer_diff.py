@@ -0,0 +1,334 @@
+"""Layer level diff between two compilations of a model"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+from .perf_baseline import align_layers, get_percent, get_per_layer_report
+from .vela_summary import aggregate_vela_summary, read_vela_summary_rows
+
+# Memory regions of the vela per layer access cycles
+LAYER_REGIONS = ["sram", "dram", "onflash", "offflash"]
+
+# Summary values compared between the compilations
+SUMMARY_METRICS = [
+    "inference_time",
+    "cycles_npu",
+    "cycles_total",
+    "cycles_sram_access",
+    "cycles_dram_access",
+    "cycles_on_chip_flash_access",
+    "cycles_off_chip_flash_access",
+    "sram_memory_used",
+    "dram_memory_used",
+    "on_chip_flash_memory_used",
+    "off_chip_flash_memory_used",
+    "sram_total_bytes",
+    "dram_total_bytes",
+    "on_chip_flash_total_bytes",
+    "off_chip_flash_total_bytes",
+]
+SUMMARY_SETTINGS = [
+    "system_config",
+    "memory_mode",
+    "arena_cache_size",
+    "weights_storage_area",
+    "feature_map_storage_area",
+]
+
+
+def get_per_layer_log_report(log_file):
+    """
+    Reads the per layer tables that vela prints with --verbose-performance.
+
+    Returns:
+        list: The layers in the format of get_per_layer_report.
+    """
+
+    with open(log_file, "r", encoding="utf-8", errors="replace") as fp:
+        lines = fp.read().splitlines()
+
+    layers = []
+    in_table = False
+    for line in lines:
+        if line.startswith("TFLite_operator"):
+            in_table = False
+        elif line.startswith("-----"):
+            in_table = True
+        elif in_table and line.strip():
+            # The operators have no spaces, the name takes the rest of the line
+            values = line.split(None, 14)
+            layers.append(
+                {
+                    "index": len(layers),
+                    "operator": values[0],
+                    "nng_operator": values[1],
+                    "name": values[14].strip(),
+                    "cycles": float(values[4]),
+                    "npu_cycles": float(values[6]),
+                    "sram_usage": int(float(values[2])),
+                    "sram_ac": float(values[7]),
+                    "dram_ac": float(values[8]),
+                    "onflash_ac": float(values[9]),
+                    "offflash_ac": float(values[10]),
+                    "mac_count": int(float(values[11])),
+                }
+            )
+        else:
+            in_table = False
+    return layers
+
+
+def get_summary(summary_file):
+    """Reads a vela summary CSV, the rows of several subgraphs combined"""
+
+    rows = read_vela_summary_rows(summary_file)
+    return aggregate_vela_summary(rows) if rows else {}
+
+
+def find_compile_files(path):
+    """
+    Finds the per layer report and the summary of a compile output, from the
+    output directory, a per layer CSV or a vela log.
+
+    Returns:
+        tuple: (per layer CSV or vela log, summary CSV or None)
+    """
+
+    if os.path.isdir(path):
+        reports = sorted(glob.glob(f"{path}/*_per-layer.csv"))
+        reports = reports or sorted(glob.glob(f"{path}/*_vela.log"))
+        if len(reports) != 1:
+            raise ValueError(f"Expected one vela report in {path}, found {reports}")
+        path = reports[0]
+
+    stem = os.path.basename(path)
+    for suffix in ["_per-layer.csv", "_vela.log"]:
+        stem = stem.removesuffix(suffix)
+    summaries = sorted(
+        glob.glob(f"{os.path.dirname(path) or '.'}/{stem}_summary_*.csv")
+    )
+    return path, summaries[0] if summaries else None
+
+
+def load_compile_output(path, summary_file=None):
+    """Loads the per layer report and the summary of a compile"""
+
+    report_file, found_summary = find_compile_files(path)
+    summary_file = summary_file or found_summary
+    if report_file.endswith(".csv"):
+        layers = get_per_layer_report(report_file)
+    else:
+        layers = get_per_layer_log_report(report_file)
+    return {
+        "path": path,
+        "report_file": report_file,
+        "summary": get_summary(summary_file) if summary_file else {},
+        "layers": layers,
+    }
+
+
+def align_operators(layers_a, layers_b):
+    """
+    Pairs up the layers by name, then the leftovers by operator in order,
+    as vela versions may fuse operators under another name.
+    """
+
+    pairs = align_layers(layers_a, layers_b)
+    only_a = [a for a, b in pairs if b is None]
+    matched = []
+    for a, b in pairs:
+        if a is None:
+            candidates = [c for c in only_a if c["operator"] == b["operator"]]
+            if candidates:
+                a = candidates[0]
+                only_a.remove(a)
+        if b is not None:
+            matched.append((a, b))
+    return matched + [(a, None) for a in only_a]
+
+
+def get_placement(layer):
+    """Gets the memory regions a layer accesses"""
+
+    if layer is None:
+        return "-"
+    regions = [r for r in LAYER_REGIONS if layer[f"{r}_ac"]]
+    return "+".join(regions) or "none"
+
+
+def diff_layers(layers_a, layers_b):
+    """
+    Compares the aligned layers of two compilations.
+
+    Returns:
+        list: One dict per layer with the cycles, access cycles per region and
+            placement of both, sorted by the absolute change in cycles.
+    """
+
+    diff = []
+    for a, b in align_operators(layers_a, layers_b):
+        layer = b or a
+        entry = {
+            "name": layer["name"],
+            "operator": layer["operator"],
+            "status": "added" if a is None else "removed" if b is None else "",
+            "placement_a": get_placement(a),
+            "placement_b": get_placement(b),
+        }
+        for key in ["cycles"] + [f"{r}_ac" for r in LAYER_REGIONS]:
+            value_a = a[key] if a else 0.0
+            value_b = b[key] if b else 0.0
+            entry[f"{key}_a"] = value_a
+            entry[f"{key}_b"] = value_b
+            entry[f"{key}_delta"] = value_b - value_a
+        entry["cycles_percent"] = get_percent(
+            a["cycles"] if a else None, b["cycles"] if b else None
+        )
+        entry["traffic_delta"] = sum(entry[f"{r}_ac_delta"] for r in LAYER_REGIONS)
+        diff.append(entry)
+
+    diff.sort(
+        key=lambda e: (abs(e["cycles_delta"]), abs(e["traffic_delta"])), reverse=True
+    )
+    return diff
+
+
+def diff_summaries(summary_a, summary_b):
+    """Compares the settings and the numeric summary values"""
+
+    settings = [
+        {"setting": key, "a": summary_a.get(key), "b": summary_b.get(key)}
+        for key in SUMMARY_SETTINGS
+        if key in summary_a or key in summary_b
+    ]
+    metrics = []
+    for key in SUMMARY_METRICS:
+        if key not in summary_a or key not in summary_b:
+            continue
+        a, b = float(summary_a[key]), float(summary_b[key])
+        metrics.append(
+            {
+                "metric": key,
+                "a": a,
+                "b": b,
+                "delta": b - a,
+                "percent": get_percent(a, b),
+            }
+        )
+    return settings, metrics
+
+
+def sr_diff_compiles(path_a, path_b, summary_a=None, summary_b=None):
+    """
+    Diffs two compilations of a model, each given as the compiler output
+    directory, the vela per layer CSV or the vela log (all with the
+    per layer report, written with --per-layer).
+
+    Returns:
+        dict: The settings, summary metrics and per layer changes.
+    """
+
+    compile_a = load_compile_output(path_a, summary_a)
+    compile_b = load_compile_output(path_b, summary_b)
+    settings, metrics = diff_summaries(compile_a["summary"], compile_b["summary"])
+    layers = diff_layers(compile_a["layers"], compile_b["layers"])
+    return {
+        "a": compile_a["report_file"],
+        "b": compile_b["report_file"],
+        "settings": settings,
+        "metrics": metrics,
+        "layers": layers,
+        "cycles_a": sum(layer["cycles"] for layer in compile_a["layers"]),
+        "cycles_b": sum(layer["cycles"] for layer in compile_b["layers"]),
+    }
+
+
+def format_percent(percent):
+    """Formats a relative change"""
+
+    return "-" if percent is None else f"{percent:+.1f}%"
+
+
+def print_diff(diff, top=20):
+    """Prints the settings, the summary and the layers by impact"""
+
+    print(f"a: {diff['a']}")
+    print(f"b: {diff['b']}")
+    for s in diff["settings"]:
+        changed = "" if s["a"] == s["b"] else "  (changed)"
+        print(f"   {s['setting']}: {s['a']} -> {s['b']}{changed}")
+
+    if diff["metrics"]:
+        print(f"{'metric':<32} {'a':>14} {'b':>14} {'change':>9}")
+        for m in diff["metrics"]:
+            print(
+                f"{m['metric']:<32} {m['a']:>14.6g} {m['b']:>14.6g}"
+                f" {format_percent(m['percent']):>9}"
+            )
+
+    total = diff["cycles_b"] - diff["cycles_a"]
+    print(f"++ Layer cycles {diff['cycles_a']:.0f} -> {diff['cycles_b']:.0f}")
+    print(
+        f"{'cycles a':>10} {'cycles b':>10} {'delta':>10} {'share':>6} {'change':>8}"
+        + "".join(f" {r + ' ac':>11}" for r in LAYER_REGIONS)
+        + "  placement / layer"
+    )
+    for layer in diff["layers"][:top]:
+        share = layer["cycles_delta"] / total * 100 if total else 0.0
+        placement = layer["placement_b"]
+        if layer["placement_a"] != layer["placement_b"]:
+            placement = f"{layer['placement_a']} -> {layer['placement_b']}"
+        status = f" ({layer['status']})" if layer["status"] else ""
+        print(
+            f"{layer['cycles_a']:>10.0f} {layer['cycles_b']:>10.0f}"
+            f" {layer['cycles_delta']:>+10.0f} {share:>5.0f}%"
+            f" {format_percent(layer['cycles_percent']):>8}"
+            + "".join(f" {layer[f'{r}_ac_delta']:>+11.0f}" for r in LAYER_REGIONS)
+            + f"  {placement} {layer['operator']} {layer['name']}{status}"
+        )
+    if len(diff["layers"]) > top:
+        print(f"++ {len(diff['layers']) - top} more layers")
+
+
+def get_diff_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Show per layer changes between two compilations of a model."
+    )
+    parser.add_argument(
+        "compile_a",
+        type=str,
+        help="Output directory, per layer CSV or vela log of the first compile",
+    )
+    parser.add_argument(
+        "compile_b",
+        type=str,
+        help="Output directory, per layer CSV or vela log of the second compile",
+    )
+    parser.add_argument("--summary-a", type=str, help="Summary CSV of the first")
+    parser.add_argument("--summary-b", type=str, help="Summary CSV of the second")
+    parser.add_argument("--top", type=int, default=20, help="Number of layers to show")
+    parser.add_argument("--json", type=str, help="Also write the diff as JSON")
+    return parser
+
+
+def main():
+    """Main for the command line diff"""
+    parser = get_diff_argparser()
+    args = parser.parse_args()
+
+    diff = sr_diff_compiles(
+        args.compile_a, args.compile_b, args.summary_a, args.summary_b
+    )
+    print_diff(diff, args.top)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(diff, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""OpenMetrics text file and local endpoint for the compile metrics"""
+
+import os
+import sys
+import json
+import argparse
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, updates are not locked there
+    fcntl = None
+
+METRICS_VERSION = 2
+
+# Upper bounds in seconds of the stage duration histogram
+STAGE_DURATION_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300]
+
+# Performance data exported as the latest value per model
+MODEL_GAUGES = {
+    "cycles_npu": "NPU cycles of the latest compile",
+    "inference_time": "Vela estimated inference time in seconds",
+    "weights_size": "Weights size in bytes",
+    "arena_cache_size": "Arena cache size in bytes",
+    "tensor_arena_size": "Planned TFLM tensor arena size in bytes",
+    "vmem_size": "Vmem used in bytes",
+    "lpmem_size": "Lpmem used in bytes",
+    "flash_size": "Flash used in bytes",
+}
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def add_metrics_arguments(parser):
+    """Adds the metrics options to a command line parser"""
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="Update this OpenMetrics text file with the compile, see sr_metrics",
+    )
+
+
+def get_state_file(metrics_file):
+    """Gets the file keeping the counters behind a metrics file"""
+
+    return f"{metrics_file}.json"
+
+
+def get_empty_state():
+    """Gets the counters before any compile"""
+
+    return {
+        "version": METRICS_VERSION,
+        "compiles": {},
+        "failures": {},
+        "stages": {},
+        "inference_cache": {"hits": 0, "misses": 0},
+        "queue_depth": 0,
+        "models": {},
+    }
+
+
+def load_metrics_state(metrics_file):
+    """Loads the counters of a metrics file"""
+
+    try:
+        with open(get_state_file(metrics_file), "r", encoding="utf-8") as fp:
+            state = json.load(fp)
+        if state.get("version") == METRICS_VERSION:
+            return state
+    except (FileNotFoundError, ValueError):
+        pass
+    return get_empty_state()
+
+
+@contextlib.contextmanager
+def update_metrics_state(metrics_file):
+    """
+    Loads the counters for an update and writes them and the metrics file
+    back, locked so that parallel compiles can share one metrics file.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+    with open(f"{metrics_file}.lock", "w", encoding="utf-8") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        state = load_metrics_state(metrics_file)
+        yield state
+        write_atomic(get_state_file(metrics_file), json.dumps(state, indent=2))
+        write_atomic(metrics_file, render_openmetrics(state))
+
+
+def write_atomic(file_path, content):
+    """Replaces a file in one step so scrapers never read half of it"""
+
+    tmp_file = f"{file_path}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as fp:
+        fp.write(content)
+    os.replace(tmp_file, file_path)
+
+
+def observe_stage(state, stage, duration):
+    """Counts a stage run, skipped stages count as cache hits"""
+
+    entry = state["stages"].setdefault(
+        stage,
+        {
+            "runs": 0,
+            "hits": 0,
+            "buckets": [0] * len(STAGE_DURATION_BUCKETS),
+            "sum": 0.0,
+        },
+    )
+    if not duration:
+        entry["hits"] += 1
+        return
+    entry["runs"] += 1
+    entry["sum"] += duration
+    for i, bound in enumerate(STAGE_DURATION_BUCKETS):
+        if duration <= bound:
+            entry["buckets"][i] += 1
+
+
+def record_compile_metrics(args, results, check):
+    """
+    Adds a compile to the metrics file of args.
+
+    Args:
+        args: The compiler arguments, with metrics_file and model_file.
+        results (dict): The compile results with the stage timings.
+        check (tuple): (success, perf_data) from sr_check_model.
+    """
+
+    success, perf_data = check
+    model = os.path.basename(args.model_file).removesuffix(".tflite")
+    with update_metrics_state(args.metrics_file) as state:
+        state["compiles"][model] = state["compiles"].get(model, 0) + 1
+        if not success:
+            state["failures"][model] = state["failures"].get(model, 0) + 1
+        for stage, duration in (results.get("stage_timings") or {}).items():
+            observe_stage(state, stage, duration)
+        for key, count in (results.get("inference_cache") or {}).items():
+            state["inference_cache"][key] += count
+        if perf_data and perf_data.get("cycles_npu"):
+            state["models"][model] = {
+                key: float(perf_data[key])
+                for key in MODEL_GAUGES
+                if perf_data.get(key) is not None
+            }
+
+
+def set_queue_depth(metrics_file, depth):
+    """Sets the number of compiles waiting in a batch"""
+
+    with update_metrics_state(metrics_file) as state:
+        state["queue_depth"] = depth
+
+
+def format_labels(**labels):
+    """Formats OpenMetrics labels"""
+
+    escaped = {
+        k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for k, v in labels.items()
+    }
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def render_openmetrics(state):
+    """Renders the counters in the OpenMetrics text format"""
+
+    lines = [
+        "# TYPE sr_compiles counter",
+        "# HELP sr_compiles Compiles per model.",
+    ]
+    lines += [
+        f"sr_compiles_total{format_labels(model=m)} {n}"
+        for m, n in sorted(state["compiles"].items())
+    ]
+    lines += ["# TYPE sr_compile_failures counter"]
+    lines += [
+        "# HELP sr_compile_failures Compiles that raised or did not fit the SR100."
+    ]
+    lines += [
+        f"sr_compile_failures_total{format_labels(model=m)} {n}"
+        for m, n in sorted(state["failures"].items())
+    ]
+
+    lines += ["# TYPE sr_stage_duration_seconds histogram"]
+    lines += ["# HELP sr_stage_duration_seconds Duration of the stages that ran."]
+    for stage, entry in sorted(state["stages"].items()):
+        for bound, count in zip(STAGE_DURATION_BUCKETS, entry["buckets"]):
+            labels = format_labels(stage=stage, le=float(bound))
+            lines.append(f"sr_stage_duration_seconds_bucket{labels} {count}")
+        labels = format_labels(stage=stage, le="+Inf")
+        lines.append(f"sr_stage_duration_seconds_bucket{labels} {entry['runs']}")
+        lines.append(
+            f"sr_stage_duration_seconds_sum{format_labels(stage=stage)} {entry['sum']}"
+        )
+        lines.append(
+            f"sr_stage_duration_seconds_count{format_labels(stage=stage)}"
+            f" {entry['runs']}"
+        )
+
+    lines += ["# TYPE sr_stage_cache_hits counter"]
+    lines += ["# HELP sr_stage_cache_hits Stages skipped as up to date."]
+    lines += [
+        f"sr_stage_cache_hits_total{format_labels(stage=stage)} {entry['hits']}"
+        for stage, entry in sorted(state["stages"].items())
+    ]
+    lines += ["# TYPE sr_stage_cache_hit_ratio gauge"]
+    lines += ["# HELP sr_stage_cache_hit_ratio Share of the stage calls skipped."]
+    for stage, entry in sorted(state["stages"].items()):
+        calls = entry["runs"] + entry["hits"]
+        ratio = entry["hits"] / calls if calls else 0.0
+        lines.append(f"sr_stage_cache_hit_ratio{format_labels(stage=stage)} {ratio}")
+
+    cache = state["inference_cache"]
+    lines += ["# TYPE sr_inference_cache_hits counter"]
+    lines += [
+        "# HELP sr_inference_cache_hits Reference inferences read from the cache."
+    ]
+    lines += [f"sr_inference_cache_hits_total {cache['hits']}"]
+    lines += ["# TYPE sr_inference_cache_misses counter"]
+    lines += ["# HELP sr_inference_cache_misses Reference inferences that ran."]
+    lines += [f"sr_inference_cache_misses_total {cache['misses']}"]
+    lines += ["# TYPE sr_inference_cache_hit_ratio gauge"]
+    lines += ["# HELP sr_inference_cache_hit_ratio Share of the inferences cached."]
+    calls = cache["hits"] + cache["misses"]
+    ratio = cache["hits"] / calls if calls else 0.0
+    lines += [f"sr_inference_cache_hit_ratio {ratio}"]
+
+    lines += ["# TYPE sr_compile_queue_depth gauge"]
+    lines += ["# HELP sr_compile_queue_depth Compiles waiting in the batch."]
+    lines += [f"sr_compile_queue_depth {state['queue_depth']}"]
+
+    for key, help_text in MODEL_GAUGES.items():
+        lines += [f"# TYPE sr_model_{key} gauge", f"# HELP sr_model_{key} {help_text}."]
+        lines += [
+            f"sr_model_{key}{format_labels(model=m)} {gauges[key]}"
+            for m, gauges in sorted(state["models"].items())
+            if key in gauges
+        ]
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics_file, port, host="127.0.0.1"):
+    """Serves the metrics of a metrics file, read again on every scrape"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Answers /metrics with the current counters"""
+
+        def do_GET(self):  # pylint: disable=C0103
+            """Renders the metrics"""
+
+            if self.path.split("?")[0] not in ["/", "/metrics"]:
+                self.send_error(404)
+                return
+            body = render_openmetrics(load_metrics_state(metrics_file)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=W0622
+            """Keeps scrapes out of the log"""
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    print(f"++ Serving {metrics_file} on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def get_metrics_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Show or serve the compile metrics in the OpenMetrics format."
+    )
+    parser.add_argument(
+        "command",
+        choices=["show", "serve"],
+        help="Print the metrics, or serve them on a local port",
+    )
+    parser.add_argument(
+        "metrics_file", type=str, help="Metrics file given to --metrics-file"
+    )
+    parser.add_argument(
+        "--port", type=int, default=9464, help="Port to serve the metrics on"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to serve on, local only by default",
+    )
+    return parser
+
+
+def main():
+    """Main for the command line metrics"""
+    parser = get_metrics_argparser()
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(render_openmetrics(load_metrics_state(args.metrics_file)), end="")
+        return 0
+
+    server = serve_metrics(args.metrics_file, args.port, args.host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
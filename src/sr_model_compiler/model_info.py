@@ -0,0 +1,249 @@
+"""Reads model structure straight from the TFLite flatbuffer"""
+
+import os
+import json
+import math
+import hashlib
+import tempfile
+import numpy as np
+from ethosu.vela.tflite.Model import Model
+from ethosu.vela.tflite.BuiltinOperator import BuiltinOperator
+from ethosu.vela.tflite.TensorType import TensorType
+from .utils import set_default_mode
+
+# Bumped whenever the index layout changes
+MODEL_INDEX_VERSION = 1
+
+# Flatbuffer enum values to names
+BUILTIN_OPERATOR_NAMES = {
+    v: k for k, v in vars(BuiltinOperator).items() if not k.startswith("_")
+}
+TENSOR_TYPE_NAMES = {
+    v: k.lower() for k, v in vars(TensorType).items() if not k.startswith("_")
+}
+
+# Bytes per element for each tensor type
+DTYPE_SIZES = {
+    "float32": 4,
+    "float16": 2,
+    "bfloat16": 2,
+    "float64": 8,
+    "int64": 8,
+    "uint64": 8,
+    "int32": 4,
+    "uint32": 4,
+    "int16": 2,
+    "uint16": 2,
+    "int8": 1,
+    "uint8": 1,
+    "bool": 1,
+    "int4": 0.5,
+    "complex64": 8,
+    "complex128": 16,
+}
+
+
+def get_operator_code_name(op_code):
+    """Gets the builtin name, or the custom code for custom operators"""
+
+    if op_code.CustomCode() is not None:
+        return op_code.CustomCode().decode("utf-8")
+    builtin_code = max(op_code.BuiltinCode(), op_code.DeprecatedBuiltinCode())
+    return BUILTIN_OPERATOR_NAMES.get(builtin_code, f"BUILTIN_{builtin_code}")
+
+
+def get_buffer_info(buffer):
+    """Gets the file offset and size of a buffer's data"""
+
+    # pylint: disable=W0212
+    field_offset = buffer._tab.Offset(4)
+    if field_offset == 0 or buffer.DataLength() == 0:
+        return {"offset": buffer.Offset(), "size": buffer.Size()}
+    return {"offset": buffer._tab.Vector(field_offset), "size": buffer.DataLength()}
+
+
+def get_offline_offsets(model, data, buffers):
+    """
+    Gets the arena offsets from the OfflineMemoryAllocation metadata vela
+    writes, one list per subgraph with -1 for tensors planned at runtime.
+    """
+
+    for i in range(model.MetadataLength()):
+        metadata = model.Metadata(i)
+        if metadata.Name() != b"OfflineMemoryAllocation":
+            continue
+        buffer = buffers[metadata.Buffer()]
+        values = np.frombuffer(
+            data, dtype="<i4", count=buffer["size"] // 4, offset=buffer["offset"]
+        )
+        # version, subgraph index, number of tensors, then one offset per tensor
+        offsets = [int(v) for v in values[3:]]
+        result = []
+        for j in range(model.SubgraphsLength()):
+            num_tensors = model.Subgraphs(j).TensorsLength()
+            result.append(offsets[:num_tensors])
+            offsets = offsets[num_tensors:]
+        return result
+    return [None] * model.SubgraphsLength()
+
+
+def get_tensor_info(tensor, buffers):
+    """Gets the shape, type, size and quantization of a tensor"""
+
+    shape = [int(d) for d in tensor.ShapeAsNumpy()] if tensor.ShapeLength() else []
+    dtype = TENSOR_TYPE_NAMES.get(tensor.Type(), "unknown")
+    num_elements = math.prod(max(d, 1) for d in shape)
+
+    quantization = None
+    quant = tensor.Quantization()
+    if quant is not None and quant.ScaleLength():
+        quantization = {
+            "scale": [float(s) for s in quant.ScaleAsNumpy()],
+            "zero_point": [int(z) for z in quant.ZeroPointAsNumpy()],
+            "quantized_dimension": quant.QuantizedDimension(),
+        }
+
+    buffer = buffers[tensor.Buffer()] if tensor.Buffer() < len(buffers) else None
+    return {
+        "name": tensor.Name().decode("utf-8") if tensor.Name() else "",
+        "shape": shape,
+        "dtype": dtype,
+        "size": math.ceil(num_elements * DTYPE_SIZES.get(dtype, 0)),
+        "buffer": tensor.Buffer(),
+        "is_constant": buffer is not None and buffer["size"] > 0,
+        "quantization": quantization,
+    }
+
+
+def parse_model_info(data):
+    """
+    Parses a TFLite flatbuffer into a plain dictionary.
+
+    Args:
+        data (bytes): The flatbuffer contents.
+
+    Returns:
+        dict: The operator codes, buffers and per subgraph tensors, operators,
+            inputs, outputs and offline planned arena offsets.
+    """
+
+    model = Model.GetRootAsModel(data, 0)
+
+    buffers = [get_buffer_info(model.Buffers(i)) for i in range(model.BuffersLength())]
+    operator_codes = [
+        get_operator_code_name(model.OperatorCodes(i))
+        for i in range(model.OperatorCodesLength())
+    ]
+
+    offline_offsets = get_offline_offsets(model, data, buffers)
+
+    subgraphs = []
+    for i in range(model.SubgraphsLength()):
+        subgraph = model.Subgraphs(i)
+        tensors = [
+            get_tensor_info(subgraph.Tensors(j), buffers)
+            for j in range(subgraph.TensorsLength())
+        ]
+        operators = []
+        for j in range(subgraph.OperatorsLength()):
+            op = subgraph.Operators(j)
+            operators.append(
+                {
+                    "opcode": operator_codes[op.OpcodeIndex()],
+                    "inputs": (
+                        [int(t) for t in op.InputsAsNumpy()]
+                        if op.InputsLength()
+                        else []
+                    ),
+                    "outputs": (
+                        [int(t) for t in op.OutputsAsNumpy()]
+                        if op.OutputsLength()
+                        else []
+                    ),
+                }
+            )
+        subgraphs.append(
+            {
+                "name": subgraph.Name().decode("utf-8") if subgraph.Name() else "",
+                "inputs": [int(t) for t in subgraph.InputsAsNumpy()],
+                "outputs": [int(t) for t in subgraph.OutputsAsNumpy()],
+                "tensors": tensors,
+                "operators": operators,
+                "offline_offsets": offline_offsets[i],
+            }
+        )
+
+    return {
+        "model_size": len(data),
+        "operator_codes": operator_codes,
+        "buffers": buffers,
+        "subgraphs": subgraphs,
+    }
+
+
+def read_model_info(model_file):
+    """Reads a TFLite model file, see parse_model_info"""
+
+    with open(model_file, "rb") as fp:
+        data = fp.read()
+    return parse_model_info(data)
+
+
+def get_model_index_file(model_file, index_dir=None):
+    """Gets the index sidecar path, next to the model by default"""
+
+    if index_dir is None:
+        index_dir = os.path.dirname(os.path.abspath(model_file))
+    return os.path.join(index_dir, os.path.basename(model_file) + ".index.json")
+
+
+def load_model_index(model_file, index_dir=None):
+    """
+    Gets the model info from its index sidecar, parsing the flatbuffer and
+    writing the sidecar only when the model content changed.
+
+    Args:
+        model_file (str): Path to the TFLite model.
+        index_dir (str): Where to keep the sidecar, defaults to the model
+            directory.
+
+    Returns:
+        dict: The model info, see parse_model_info, plus its sha256.
+    """
+
+    with open(model_file, "rb") as fp:
+        data = fp.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    index_file = get_model_index_file(model_file, index_dir)
+    try:
+        with open(index_file, "r", encoding="utf-8") as fp:
+            index = json.load(fp)
+        if index.get("version") == MODEL_INDEX_VERSION and index["sha256"] == sha256:
+            return index
+    except (FileNotFoundError, ValueError, KeyError, AttributeError):
+        pass
+
+    index = parse_model_info(data)
+    index["version"] = MODEL_INDEX_VERSION
+    index["sha256"] = sha256
+
+    # A read only model directory only costs the parse on every run
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(index_file), suffix=".tmp")
+    except OSError as e:
+        print(f"Could not write the model index {index_file}: {e}")
+        return index
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            json.dump(index, fp)
+        os.replace(tmp_file, index_file)
+        set_default_mode(index_file)
+    except OSError as e:
+        print(f"Could not write the model index {index_file}: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    return index
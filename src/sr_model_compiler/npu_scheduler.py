@@ -0,0 +1,298 @@
+"""Simulates several models sharing the NPU at their frame rates"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from pathlib import Path
+from .latency_estimator import parse_overrides
+from .sr_model_compiler import sr_check_model, sr_model_compiler
+
+
+def get_schedule_model(name, perf_data, rate, priority=0, offset=0.0):
+    """
+    Gets a model of the simulation from its sr_check_model performance data.
+
+    Args:
+        name (str): The model name.
+        perf_data (dict): The performance data of the compiled model.
+        rate (float): Invocations per second, such as the camera frame rate.
+        priority (int): Higher priorities get the NPU first.
+        offset (float): Time of the first invocation in seconds.
+    """
+
+    weights_size = perf_data.get("weights_size") or 0
+    return {
+        "name": name,
+        "inference_time": float(perf_data["inference_time"]),
+        "rate": float(rate),
+        "priority": int(priority),
+        "offset": float(offset),
+        "model_loc": perf_data.get("model_loc"),
+        "vmem_weights": weights_size if perf_data.get("model_loc") == "vmem" else 0,
+        "arena_size": max(
+            perf_data.get("arena_cache_size") or 0,
+            perf_data.get("tensor_arena_size") or 0,
+        ),
+        "lpmem_size": perf_data.get("lpmem_size") or 0,
+        "flash_size": perf_data.get("flash_size") or 0,
+    }
+
+
+def load_bundle_perf_data(manifest_file):
+    """Gets the performance data of every compiled model of a bundle manifest"""
+
+    with open(manifest_file, "r", encoding="utf-8") as fp:
+        manifest = json.load(fp)
+    return {
+        m["namespace"]: dict(m["placement"], inference_time=m["inference_time"])
+        for m in manifest["models"]
+        if "placement" in m
+    }
+
+
+def simulate_npu_schedule(models, window=1.0, overhead=0.0):  # pylint: disable=R0914
+    """
+    Simulates the NPU time sharing. Each model is invoked at its rate, and
+    whenever the NPU is free the highest priority waiting invocation runs to
+    completion, as NPU inferences are not preempted. A model keeps only its
+    newest frame, one that is still waiting when the next arrives is dropped.
+
+    Args:
+        models (list): Models from get_schedule_model.
+        window (float): Simulated time in seconds.
+        overhead (float): Seconds added to every inference for the switch.
+
+    Returns:
+        dict: Per model frames, sustained FPS and latencies, and the NPU
+            utilization over the window.
+    """
+
+    stats = {
+        m["name"]: {"released": 0, "completed": 0, "dropped": 0, "latencies": []}
+        for m in models
+    }
+    pending = {}
+
+    def next_release(m):
+        return m["offset"] + stats[m["name"]]["released"] / m["rate"]
+
+    busy = 0.0
+    now = 0.0
+
+    while True:
+        # Frames that arrived while the NPU was busy
+        for m in models:
+            while next_release(m) <= now and next_release(m) < window:
+                if m["name"] in pending:
+                    stats[m["name"]]["dropped"] += 1
+                pending[m["name"]] = next_release(m)
+                stats[m["name"]]["released"] += 1
+
+        if pending:
+            m = max(
+                (m for m in models if m["name"] in pending),
+                key=lambda m: (m["priority"], -pending[m["name"]]),
+            )
+            released = pending.pop(m["name"])
+            finish = now + m["inference_time"] + overhead
+            busy += max(min(finish, window) - min(now, window), 0.0)
+            stats[m["name"]]["latencies"].append(finish - released)
+            if finish <= window:
+                stats[m["name"]]["completed"] += 1
+            now = finish
+            continue
+
+        upcoming = [next_release(m) for m in models if next_release(m) < window]
+        if not upcoming:
+            break
+        now = min(upcoming)
+
+    results = []
+    for m in models:
+        s = stats[m["name"]]
+        latencies = s.pop("latencies")
+        period = 1 / m["rate"]
+        results.append(
+            dict(
+                s,
+                name=m["name"],
+                rate=m["rate"],
+                priority=m["priority"],
+                inference_time=m["inference_time"],
+                fps=s["completed"] / window,
+                worst_latency=max(latencies, default=0.0),
+                mean_latency=sum(latencies) / len(latencies) if latencies else 0.0,
+                deadline_misses=sum(1 for latency in latencies if latency > period),
+            )
+        )
+    return {
+        "window": window,
+        "models": results,
+        "utilization": busy / window,
+        "load": sum(m["rate"] * (m["inference_time"] + overhead) for m in models),
+        "schedulable": all(
+            r["dropped"] == 0 and r["deadline_misses"] == 0 for r in results
+        ),
+    }
+
+
+def get_memory_footprint(
+    models, vmem_size_limit, lpmem_size_limit, shared_arena=False
+):  # pylint: disable=R0913,R0917
+    """
+    Gets the combined memory of the models. Weights placed in vmem and lpmem
+    add up. Each model has its own arena unless shared_arena is set, where
+    the models run one at a time out of one arena sized for the largest.
+    """
+
+    arenas = [m["arena_size"] for m in models]
+    vmem = sum(m["vmem_weights"] for m in models)
+    vmem += max(arenas, default=0) if shared_arena else sum(arenas)
+    lpmem = sum(m["lpmem_size"] for m in models)
+    return {
+        "vmem_size": vmem,
+        "lpmem_size": lpmem,
+        "flash_size": sum(m["flash_size"] for m in models),
+        "vmem_size_limit": vmem_size_limit,
+        "lpmem_size_limit": lpmem_size_limit,
+        "fits": vmem <= vmem_size_limit and lpmem <= lpmem_size_limit,
+    }
+
+
+def print_schedule(schedule, memory):
+    """Prints the per model frame rates and latencies and the memory fit"""
+
+    print(
+        f"{'model':<36} {'prio':>4} {'rate':>6} {'fps':>6} {'dropped':>7}"
+        f" {'worst ms':>9} {'mean ms':>8} {'misses':>6}"
+    )
+    for m in schedule["models"]:
+        print(
+            f"{m['name']:<36} {m['priority']:>4} {m['rate']:>6.1f} {m['fps']:>6.1f}"
+            f" {m['dropped']:>7} {m['worst_latency'] * 1e3:>9.2f}"
+            f" {m['mean_latency'] * 1e3:>8.2f} {m['deadline_misses']:>6}"
+        )
+    print(
+        f"++ NPU utilization {schedule['utilization'] * 100:.1f}%"
+        f" (requested {schedule['load'] * 100:.1f}%),"
+        f" {'schedulable' if schedule['schedulable'] else 'frames dropped or late'}"
+    )
+    print(
+        f"++ vmem {memory['vmem_size']} of {memory['vmem_size_limit']} bytes,"
+        f" lpmem {memory['lpmem_size']} of {memory['lpmem_size_limit']} bytes,"
+        f" flash {memory['flash_size']} bytes"
+    )
+    if not memory["fits"]:
+        print("ERROR:: The models do not fit in memory together")
+
+
+def get_scheduler_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Simulate several models sharing the NPU at their frame rates."
+    )
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="Bundle manifests from sr_model_bundle or TFLite models to compile",
+    )
+    parser.add_argument(
+        "--rate",
+        type=str,
+        nargs="+",
+        help="Invocations per second per model, such as person_detection=15",
+    )
+    parser.add_argument(
+        "--default-rate",
+        type=float,
+        default=30.0,
+        help="Invocations per second of the models without a --rate",
+    )
+    parser.add_argument(
+        "--priority",
+        type=str,
+        nargs="+",
+        help="Priority per model, higher runs first, such as person_detection=2",
+    )
+    parser.add_argument(
+        "--window", type=float, default=1.0, help="Simulated time in seconds"
+    )
+    parser.add_argument(
+        "--overhead-us",
+        type=float,
+        default=0.0,
+        help="Time added to every inference for switching models",
+    )
+    parser.add_argument(
+        "--shared-arena",
+        action="store_true",
+        help="The models share one arena instead of one each",
+    )
+    parser.add_argument(
+        "-s",
+        "--system-config",
+        type=str,
+        help="System config of the TFLite models, the compiler default if unset",
+    )
+    parser.add_argument(
+        "--vmem-size-limit", type=int, default=1536000, help="Sets limit for vmem"
+    )
+    parser.add_argument(
+        "--lpmem-size-limit", type=int, default=1536000, help="Sets limit for lpmem"
+    )
+    parser.add_argument("--json", type=str, help="Also write the results as JSON")
+    return parser
+
+
+def main():
+    """Main for the command line NPU scheduler"""
+    parser = get_scheduler_argparser()
+    args = parser.parse_args()
+
+    perf_data = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in args.inputs:
+            if path.endswith(".json"):
+                perf_data.update(load_bundle_perf_data(path))
+                continue
+            kwargs = {"system_config": args.system_config} if args.system_config else {}
+            results = sr_model_compiler(
+                model_file=path,
+                output_dir=os.path.join(tmp_dir, Path(path).stem),
+                script=["model"],
+                **kwargs,
+            )
+            success, perf_data[Path(path).stem] = sr_check_model(results)
+            if not success:
+                print(f"ERROR:: {path} does not fit on its own")
+
+    rates = parse_overrides(args.rate)
+    priorities = parse_overrides(args.priority)
+    models = [
+        get_schedule_model(
+            name,
+            data,
+            rates.get(name, args.default_rate),
+            priorities.get(name, 0),
+        )
+        for name, data in perf_data.items()
+        if data and data.get("inference_time")
+    ]
+
+    schedule = simulate_npu_schedule(models, args.window, args.overhead_us * 1e-6)
+    memory = get_memory_footprint(
+        models, args.vmem_size_limit, args.lpmem_size_limit, args.shared_arena
+    )
+    print_schedule(schedule, memory)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump({"schedule": schedule, "memory": memory}, fp, indent=2)
+    return 0 if schedule["schedulable"] and memory["fits"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
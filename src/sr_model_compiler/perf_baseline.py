@@ -0,0 +1,293 @@
+"""Performance regression gate against a stored baseline"""
+
+import os
+import csv
+import json
+from .utils import write_file_if_changed
+
+BASELINE_VERSION = 1
+
+# Metrics compared against the baseline, larger is worse for all of them
+BASELINE_METRICS = [
+    "cycles_npu",
+    "inference_time",
+    "vmem_size",
+    "lpmem_size",
+    "flash_size",
+]
+
+# Regression thresholds in percent
+DEFAULT_THRESHOLD = 5.0
+DEFAULT_LAYER_THRESHOLD = 10.0
+# Layers faster than this are too noisy to gate on
+DEFAULT_MIN_LAYER_CYCLES = 1000
+
+
+def get_per_layer_report(per_layer_file):
+    """
+    Reads the vela per layer CSV written with --verbose-performance.
+
+    Returns:
+        list: One dict per layer with its operators, name, cycles, memory
+            accesses per region and SRAM usage.
+    """
+
+    layers = []
+    with open(per_layer_file, "r", newline="", encoding="utf-8") as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        for index, row in enumerate(reader):
+            # Network% appears twice, so columns are looked up by position
+            values = dict(zip(header[:12], row[:12]))
+            layers.append(
+                {
+                    "index": index,
+                    "operator": values["TFLite_operator"],
+                    "nng_operator": values["NNG Operator"],
+                    "name": row[-1],
+                    "cycles": float(values["Op Cycles"]),
+                    "npu_cycles": float(values["NPU"]),
+                    "sram_usage": int(float(values["SRAM Usage"])),
+                    "sram_ac": float(values["SRAM AC"]),
+                    "dram_ac": float(values["DRAM AC"]),
+                    "onflash_ac": float(values["OnFlash AC"]),
+                    "offflash_ac": float(values["OffFlash AC"]),
+                    "mac_count": int(float(values["MAC Count"])),
+                }
+            )
+    return layers
+
+
+def align_layers(layers_a, layers_b):
+    """
+    Pairs up the layers of two compilations by name. Repeated names pair in
+    order, layers only in one compilation are paired with None.
+
+    Returns:
+        list: (layer_a, layer_b) tuples in the order of the second list, then
+            the layers only found in the first.
+    """
+
+    by_name = {}
+    for layer in layers_a:
+        by_name.setdefault(layer["name"], []).append(layer)
+
+    pairs = []
+    for layer in layers_b:
+        matches = by_name.get(layer["name"])
+        pairs.append((matches.pop(0) if matches else None, layer))
+    for matches in by_name.values():
+        pairs.extend((layer, None) for layer in matches)
+    return pairs
+
+
+def parse_thresholds(values):
+    """
+    Parses thresholds, either a percent for every metric or metric=percent.
+
+    Returns:
+        dict: Metric to percent, "default" for the rest.
+    """
+
+    thresholds = {"default": DEFAULT_THRESHOLD}
+    for value in values or []:
+        if "=" in value:
+            metric, percent = value.split("=", 1)
+            thresholds[metric.strip()] = float(percent)
+        else:
+            thresholds["default"] = float(value)
+    return thresholds
+
+
+def create_baseline(perf_data, per_layer=None):
+    """Creates a baseline from the performance data of a compile"""
+
+    return {
+        "version": BASELINE_VERSION,
+        "system_config": perf_data.get("system_config"),
+        "metrics": {m: perf_data.get(m) for m in BASELINE_METRICS},
+        "layers": [
+            {
+                "name": layer["name"],
+                "operator": layer["operator"],
+                "cycles": layer["cycles"],
+            }
+            for layer in per_layer or []
+        ],
+    }
+
+
+def write_baseline(baseline_file, perf_data, per_layer=None):
+    """Stores the baseline of a compile"""
+
+    baseline = create_baseline(perf_data, per_layer)
+    write_file_if_changed(baseline_file, json.dumps(baseline, indent=2))
+    return baseline
+
+
+def load_baseline(baseline_file):
+    """Loads a stored baseline"""
+
+    with open(baseline_file, "r", encoding="utf-8") as fp:
+        baseline = json.load(fp)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(
+            f"{baseline_file} is not a version {BASELINE_VERSION} baseline"
+        )
+    return baseline
+
+
+def get_percent(old, new):
+    """Gets the relative change in percent, None when it is undefined"""
+
+    if old is None or new is None:
+        return None
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - old) / old * 100
+
+
+def compare_to_baseline(  # pylint: disable=R0913,R0917
+    baseline,
+    perf_data,
+    per_layer=None,
+    thresholds=None,
+    layer_threshold=DEFAULT_LAYER_THRESHOLD,
+    min_layer_cycles=DEFAULT_MIN_LAYER_CYCLES,
+):
+    """
+    Compares a compile against the baseline.
+
+    Args:
+        baseline (dict): From load_baseline.
+        perf_data (dict): From sr_check_model.
+        per_layer (list): From get_per_layer_report, when available.
+        thresholds (dict): From parse_thresholds.
+        layer_threshold (float): Percent a layer may get slower.
+        min_layer_cycles (float): Layers below this in both runs are ignored.
+
+    Returns:
+        dict: The per metric and per layer comparison, and whether it regressed.
+    """
+
+    thresholds = thresholds or parse_thresholds(None)
+
+    metrics = []
+    for metric in BASELINE_METRICS:
+        old, new = baseline["metrics"].get(metric), perf_data.get(metric)
+        percent = get_percent(old, new)
+        threshold = thresholds.get(metric, thresholds["default"])
+        metrics.append(
+            {
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "percent": percent,
+                "threshold": threshold,
+                "regressed": percent is not None and percent > threshold,
+            }
+        )
+
+    layers = []
+    if baseline["layers"] and per_layer:
+        for old, new in align_layers(baseline["layers"], per_layer):
+            if old is None or new is None:
+                continue
+            if max(old["cycles"], new["cycles"]) < min_layer_cycles:
+                continue
+            percent = get_percent(old["cycles"], new["cycles"])
+            if percent > layer_threshold:
+                layers.append(
+                    {
+                        "name": new["name"],
+                        "operator": new["operator"],
+                        "baseline": old["cycles"],
+                        "current": new["cycles"],
+                        "delta": new["cycles"] - old["cycles"],
+                        "percent": percent,
+                    }
+                )
+        layers.sort(key=lambda layer: -layer["delta"])
+
+    return {
+        "metrics": metrics,
+        "layers": layers,
+        "regressed": any(m["regressed"] for m in metrics) or bool(layers),
+    }
+
+
+def print_baseline_report(report, max_layers=20):
+    """Prints the metrics and the layers that regressed"""
+
+    print(f"{'metric':<16} {'baseline':>14} {'current':>14} {'change':>9}")
+    for m in report["metrics"]:
+        change = "-" if m["percent"] is None else f"{m['percent']:+.2f}%"
+        flag = f"  REGRESSED (> {m['threshold']:g}%)" if m["regressed"] else ""
+        print(
+            f"{m['metric']:<16} {str(m['baseline']):>14} {str(m['current']):>14}"
+            f" {change:>9}{flag}"
+        )
+    if report["layers"]:
+        print(f"++ {len(report['layers'])} layers regressed:")
+        print(f"{'baseline':>10} {'current':>10} {'change':>9} layer")
+        for layer in report["layers"][:max_layers]:
+            print(
+                f"{layer['baseline']:>10.0f} {layer['current']:>10.0f}"
+                f" {layer['percent']:>+8.1f}% {layer['operator']} {layer['name']}"
+            )
+
+
+def add_baseline_arguments(parser):
+    """Adds the baseline gate options to a command line parser"""
+
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Baseline JSON to compare against, written when it does not exist",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Overwrite the baseline with this run",
+    )
+    parser.add_argument(
+        "--baseline-threshold",
+        type=str,
+        nargs="+",
+        help=f"Allowed regression in percent, or metric=percent"
+        f" (default {DEFAULT_THRESHOLD:g})",
+    )
+    parser.add_argument(
+        "--baseline-layer-threshold",
+        type=float,
+        default=DEFAULT_LAYER_THRESHOLD,
+        help="Allowed per layer cycles regression in percent",
+    )
+
+
+def run_baseline_gate(args, results, perf_data):
+    """
+    Compares against args.baseline, or writes it when it does not exist yet
+    or args.update_baseline is set.
+
+    Returns:
+        bool: True when the compile did not regress.
+    """
+
+    per_layer = results.get("per_layer") if results else None
+    if args.update_baseline or not os.path.exists(args.baseline):
+        write_baseline(args.baseline, perf_data, per_layer)
+        print(f"++ Wrote baseline {args.baseline}")
+        return True
+
+    report = compare_to_baseline(
+        load_baseline(args.baseline),
+        perf_data,
+        per_layer,
+        parse_thresholds(args.baseline_threshold),
+        args.baseline_layer_threshold,
+    )
+    print_baseline_report(report)
+    if report["regressed"]:
+        print(f"ERROR:: Performance regressed against {args.baseline}")
+    return not report["regressed"]
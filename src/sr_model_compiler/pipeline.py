@@ -0,0 +1,167 @@
+"""Dependency tracked compile stages that skip unchanged work"""
+
+import os
+import json
+import time
+import hashlib
+from .profiling import profile_stage
+from .utils import write_file_if_changed
+
+MANIFEST_FILE = ".sr_model_compiler_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(file_path):
+    """Gets the sha256 of a file, or None if it does not exist"""
+
+    sha = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                sha.update(chunk)
+    except FileNotFoundError:
+        return None
+    return sha.hexdigest()
+
+
+def hash_data(data):
+    """Gets the sha256 of a string or bytes"""
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_stage_key(inputs, params):
+    """Hashes the stage input files and parameters"""
+
+    key = {
+        "inputs": {os.path.abspath(f): hash_file(f) for f in inputs},
+        "params": params,
+    }
+    return hash_data(json.dumps(key, sort_keys=True, default=str))
+
+
+def load_manifest(output_dir, profile=None):
+    """
+    Loads the stage manifest of an output directory. The stages that run
+    are profiled when a profile from profiling.get_profile is given.
+    """
+
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {"version": MANIFEST_VERSION, "stages": {}}
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        if data.get("version") == MANIFEST_VERSION:
+            manifest["stages"] = data["stages"]
+    except (FileNotFoundError, ValueError, KeyError, AttributeError):
+        pass
+
+    manifest["file"] = manifest_file
+    manifest["active"] = []
+    manifest["timings"] = {}
+    manifest["profile"] = profile
+    return manifest
+
+
+def save_manifest(manifest):
+    """Saves the stage manifest, only touching it when it changed"""
+
+    data = {"version": manifest["version"], "stages": manifest["stages"]}
+    write_file_if_changed(manifest["file"], json.dumps(data, indent=2, sort_keys=True))
+
+
+def run_stage(
+    manifest, name, inputs, params, stage_func, force=False
+):  # pylint: disable=R0913,R0917
+    """
+    Runs a stage unless its inputs, parameters and outputs are unchanged
+    since the last recorded run.
+
+    Args:
+        manifest (dict): The manifest from load_manifest.
+        name (str): The stage name.
+        inputs (list): The input file paths.
+        params (dict): JSON serialisable parameters that affect the outputs.
+        stage_func (callable): Runs the stage, returns (result, output files).
+        force (bool): Run the stage even when it is up to date.
+
+    Returns:
+        The stage result, taken from the manifest when the stage is skipped.
+    """
+
+    key = get_stage_key(inputs, params)
+    entry = manifest["stages"].get(name)
+    manifest["active"].append(name)
+    if not force and entry and entry["key"] == key:
+        if all(hash_file(f) == h for f, h in entry["outputs"].items()):
+            print(f"++ Stage {name} is up to date, skipping")
+            manifest["timings"][name] = 0.0
+            return entry["result"]
+
+    start = time.perf_counter()
+    if manifest["profile"]:
+        result, outputs = profile_stage(manifest["profile"], name, stage_func)
+    else:
+        result, outputs = stage_func()
+    manifest["stages"][name] = {
+        "key": key,
+        "inputs": [os.path.abspath(f) for f in inputs],
+        "outputs": {os.path.abspath(f): hash_file(f) for f in outputs},
+        "result": result,
+        "duration": time.perf_counter() - start,
+    }
+    manifest["timings"][name] = manifest["stages"][name]["duration"]
+    return result
+
+
+def get_stage_dependencies(manifest, names):
+    """Gets the source files the stages read, excluding generated files"""
+
+    generated = set()
+    for entry in manifest["stages"].values():
+        generated.update(entry["outputs"])
+
+    dependencies = []
+    for name in names:
+        entry = manifest["stages"].get(name)
+        if entry is None:
+            continue
+        for input_file in entry["inputs"]:
+            if input_file not in generated and input_file not in dependencies:
+                dependencies.append(input_file)
+    return dependencies
+
+
+def escape_depfile_path(file_path):
+    """Escapes a path for a Make/Ninja depfile"""
+
+    return file_path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def write_depfiles(manifest, upstream_stages):
+    """
+    Writes a Make/Ninja depfile next to each output of the stages that ran
+    or were skipped in this invocation.
+
+    Args:
+        manifest (dict): The manifest from load_manifest.
+        upstream_stages (dict): Stage name to the stages its outputs also depend on.
+
+    Returns:
+        list: The depfile paths.
+    """
+
+    depfiles = []
+    for name in manifest["active"]:
+        dependencies = get_stage_dependencies(
+            manifest, [*upstream_stages.get(name, []), name]
+        )
+        for output_file in manifest["stages"][name]["outputs"]:
+            lines = [escape_depfile_path(output_file) + ":"]
+            lines += [escape_depfile_path(f) for f in dependencies]
+            depfile = output_file + ".d"
+            write_file_if_changed(depfile, " \\\n  ".join(lines) + "\n")
+            depfiles.append(depfile)
+    return depfiles
@@ -0,0 +1,206 @@
+"""Fast feasibility checks on the flatbuffer before running vela"""
+
+from ethosu.vela.tflite.BuiltinOperator import BuiltinOperator
+from ethosu.vela.tflite_mapping import builtin_operator_map
+from ethosu.vela.tflite_supported_operators import TFLiteSupportedOperators
+from .model_info import read_model_info
+
+# Custom operators produced by an earlier NPU compilation
+NPU_CUSTOM_OPS = ["ethos-u"]
+
+# Tensor types the NPU accepts for feature maps
+NPU_DTYPES = ["int8", "uint8", "int16", "int32"]
+NPU_QUANTIZED_DTYPES = ["int8", "uint8", "int16"]
+
+
+def get_npu_unsupported_reason(operator, tensors):  # pylint: disable=R0911
+    """Gets why vela cannot map an operator to the NPU, or None if it can"""
+
+    opcode = operator["opcode"]
+    if opcode in NPU_CUSTOM_OPS:
+        return None
+
+    builtin = getattr(BuiltinOperator, opcode, None)
+    if builtin not in builtin_operator_map:
+        return "CPU only operator"
+    op_type = builtin_operator_map[builtin][0]
+    if op_type not in TFLiteSupportedOperators.supported_operators:
+        return "CPU only operator"
+
+    # Feature maps must be quantized integers, constants are checked by vela
+    for index in operator["inputs"] + operator["outputs"]:
+        if index < 0 or tensors[index]["is_constant"]:
+            continue
+        tensor = tensors[index]
+        if tensor["dtype"] not in NPU_DTYPES:
+            return f"unsupported data type {tensor['dtype']} for {tensor['name']}"
+        if (
+            tensor["dtype"] == "int32"
+            and op_type not in TFLiteSupportedOperators.supported_int32_tensor_ops
+        ):
+            return f"int32 tensor {tensor['name']}"
+        if tensor["dtype"] in NPU_QUANTIZED_DTYPES and tensor["quantization"] is None:
+            return f"missing quantization parameters for {tensor['name']}"
+
+    return None
+
+
+def get_activation_lower_bound(subgraph, cpu_operators):
+    """
+    Gets the arena bytes any schedule needs: the graph inputs and outputs are
+    fully resident, as are the feature maps of every CPU operator. Operators
+    on the NPU can be cascaded, so their intermediate tensors are not counted.
+    """
+
+    tensors = subgraph["tensors"]
+
+    def live_bytes(indices):
+        return sum(
+            tensors[i]["size"]
+            for i in set(indices)
+            if i >= 0 and not tensors[i]["is_constant"]
+        )
+
+    lower_bound = max(live_bytes(subgraph["inputs"]), live_bytes(subgraph["outputs"]))
+    for index in cpu_operators:
+        operator = subgraph["operators"][index]
+        lower_bound = max(
+            lower_bound, live_bytes(operator["inputs"] + operator["outputs"])
+        )
+    return lower_bound
+
+
+def get_preflight_report(model_file, model_info=None):
+    """
+    Analyzes a model without compiling it.
+
+    Returns:
+        dict: The tensor type counts, the operators vela cannot map, the
+            constant bytes, the constant bytes of the NPU operators and a
+            lower bound on the activation memory.
+    """
+
+    if model_info is None:
+        model_info = read_model_info(model_file)
+
+    tensor_dtypes = {}
+    cpu_operators = []
+    constant_buffers = set()
+    npu_constant_buffers = set()
+    num_operators = 0
+    activation_lower_bound = 0
+
+    for subgraph in model_info["subgraphs"]:
+        tensors = subgraph["tensors"]
+        for tensor in tensors:
+            tensor_dtypes[tensor["dtype"]] = tensor_dtypes.get(tensor["dtype"], 0) + 1
+            if tensor["is_constant"]:
+                constant_buffers.add(tensor["buffer"])
+
+        subgraph_cpu_operators = []
+        for index, operator in enumerate(subgraph["operators"]):
+            reason = get_npu_unsupported_reason(operator, tensors)
+            if reason:
+                subgraph_cpu_operators.append(index)
+                cpu_operators.append(
+                    {
+                        "subgraph": subgraph["name"],
+                        "index": index,
+                        "opcode": operator["opcode"],
+                        "reason": reason,
+                    }
+                )
+            else:
+                npu_constant_buffers.update(
+                    tensors[i]["buffer"]
+                    for i in operator["inputs"]
+                    if i >= 0 and tensors[i]["is_constant"]
+                )
+        num_operators += len(subgraph["operators"])
+        activation_lower_bound = max(
+            activation_lower_bound,
+            get_activation_lower_bound(subgraph, subgraph_cpu_operators),
+        )
+
+    return {
+        "model_size": model_info["model_size"],
+        "tensor_dtypes": tensor_dtypes,
+        "operators": num_operators,
+        "npu_operators": num_operators - len(cpu_operators),
+        "cpu_operators": cpu_operators,
+        "constant_bytes": sum(
+            model_info["buffers"][b]["size"] for b in sorted(constant_buffers)
+        ),
+        "npu_constant_bytes": sum(
+            model_info["buffers"][b]["size"] for b in sorted(npu_constant_buffers)
+        ),
+        "activation_lower_bound": activation_lower_bound,
+    }
+
+
+def sr_preflight_check(  # pylint: disable=R0913,R0917
+    model_file,
+    vmem_size_limit=None,
+    model_info=None,
+    model_loc=None,
+    lpmem_size_limit=None,
+):
+    """
+    Rejects configurations that clearly cannot work before vela runs.
+
+    Args:
+        model_file (str): Path to the TFLite model.
+        vmem_size_limit (int): The vmem size, which always holds the arena.
+        model_info (dict): An already parsed model, see read_model_info.
+        model_loc (str): Where the weights go, vmem, lpmem or flash. The
+            constants are not checked when None.
+        lpmem_size_limit (int): The lpmem size, for weights in lpmem.
+
+    Returns:
+        tuple: (feasible, report), report["reasons"] lists the failures
+            and report["warnings"] the likely ones.
+    """
+
+    report = get_preflight_report(model_file, model_info)
+
+    reasons = []
+    if report["operators"] and report["npu_operators"] == 0:
+        reasons.append("no operator can be mapped to the NPU")
+    if vmem_size_limit and report["activation_lower_bound"] > vmem_size_limit:
+        reasons.append(
+            f"activations need at least {report['activation_lower_bound']} bytes, "
+            f"vmem limit is {vmem_size_limit}"
+        )
+
+    # Vela places the NPU weights in vmem or lpmem, flash has no limit. The
+    # weights are compressed by vela, so their raw size only earns a warning
+    warnings = []
+    weights_limit = {"vmem": vmem_size_limit, "lpmem": lpmem_size_limit}.get(model_loc)
+    if weights_limit and report["npu_constant_bytes"] > weights_limit:
+        warnings.append(
+            f"NPU constants are {report['npu_constant_bytes']} bytes before "
+            f"compression, {model_loc} limit is {weights_limit}"
+        )
+    report["reasons"] = reasons
+    report["warnings"] = warnings
+
+    return not reasons, report
+
+
+def print_preflight_report(report):
+    """Prints a short preflight summary"""
+
+    dtypes = ", ".join(f"{k}={v}" for k, v in sorted(report["tensor_dtypes"].items()))
+    print(f"++ Preflight: tensors {dtypes}")
+    print(
+        f"++ Preflight: {report['npu_operators']}/{report['operators']} NPU operators,"
+        f" {report['constant_bytes']} constant bytes"
+        f" ({report['npu_constant_bytes']} on the NPU),"
+        f" activations >= {report['activation_lower_bound']} bytes"
+    )
+    for operator in report["cpu_operators"]:
+        print(f"   CPU {operator['opcode']} #{operator['index']}: {operator['reason']}")
+    for warning in report.get("warnings", []):
+        print(f"++ Preflight warning: {warning}")
+    for reason in report.get("reasons", []):
+        print(f"ERROR:: Preflight rejected the model, {reason}")
@@ -0,0 +1,183 @@
+"""CPU and memory profiles of the compile stages"""
+
+import os
+import time
+import pstats
+import cProfile
+import tracemalloc
+
+# Functions and allocation sites listed per stage
+HOT_SPOTS = 3
+TOP_ALLOCATIONS = 20
+
+# Stack depth kept per allocation
+TRACEMALLOC_FRAMES = 1
+
+
+def add_profile_arguments(parser):
+    """Adds the profiling options to a command line parser"""
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile each stage with cProfile, writes <stage>.pstats",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Trace the stage allocations, writes <stage>_memory.txt",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        help="Profile directory, <output dir>/profile or ./profile by default",
+    )
+
+
+def get_profile(args):
+    """Gets the profile of a compile from its arguments, None when off"""
+
+    if not (args.profile or args.profile_memory):
+        return None
+    return {
+        "dir": args.profile_dir or os.path.join(args.output_dir, "profile"),
+        "cpu": args.profile,
+        "memory": args.profile_memory,
+        "stages": [],
+    }
+
+
+def get_profile_kwargs(args, name):
+    """Gets the profiling arguments of a compile run by another tool"""
+
+    return {
+        "profile": args.profile,
+        "profile_memory": args.profile_memory,
+        "profile_dir": os.path.join(args.profile_dir or "profile", name),
+    }
+
+
+def get_function_label(func):
+    """Gets a short name of a pstats function key"""
+
+    file_name, line, name = func
+    if file_name == "~":
+        return name
+    return f"{name} ({os.path.basename(file_name)}:{line})"
+
+
+def get_hot_spots(stats, top=HOT_SPOTS):
+    """Gets the functions with the most own time"""
+
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    return [
+        {
+            "function": get_function_label(func),
+            "calls": nc,
+            "tottime": tt,
+            "cumtime": ct,
+        }
+        for func, (_, nc, tt, ct, _) in rows[:top]
+    ]
+
+
+def get_snapshot():
+    """Takes a tracemalloc snapshot without the tracing itself"""
+
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+    )
+
+
+def write_memory_report(report_file, name, peak, diffs):
+    """Writes the allocation sites that grew the most during a stage"""
+
+    lines = [
+        f"Stage {name}",
+        f"Peak traced memory {peak} bytes",
+        "",
+        f"{'size':>12} {'blocks':>8}  location",
+    ]
+    for diff in diffs:
+        frame = diff.traceback[0]
+        lines.append(
+            f"{diff.size_diff:>12} {diff.count_diff:>8}"
+            f"  {frame.filename}:{frame.lineno}"
+        )
+    with open(report_file, "w", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+
+
+def profile_stage(profile, name, stage_func):
+    """
+    Runs a stage under cProfile and tracemalloc as set in the profile.
+
+    Args:
+        profile (dict): The profile from get_profile, collects the stage.
+        name (str): The stage name, used for the report file names.
+        stage_func (callable): Runs the stage.
+
+    Returns:
+        The result of stage_func.
+    """
+
+    os.makedirs(profile["dir"], exist_ok=True)
+    entry = {"stage": name}
+    started_tracing = profile["memory"] and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    if profile["memory"]:
+        before = get_snapshot()
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile() if profile["cpu"] else None
+
+    start = time.perf_counter()
+    try:
+        result = profiler.runcall(stage_func) if profiler else stage_func()
+    finally:
+        entry["duration"] = time.perf_counter() - start
+        if profiler:
+            entry["pstats"] = os.path.join(profile["dir"], f"{name}.pstats")
+            profiler.dump_stats(entry["pstats"])
+            entry["hot_spots"] = get_hot_spots(pstats.Stats(profiler))
+        if profile["memory"]:
+            entry["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            diffs = [
+                diff
+                for diff in get_snapshot().compare_to(before, "lineno")
+                if diff.size_diff > 0
+            ][:TOP_ALLOCATIONS]
+            entry["memory_report"] = os.path.join(profile["dir"], f"{name}_memory.txt")
+            write_memory_report(
+                entry["memory_report"], name, entry["peak_memory"], diffs
+            )
+            entry["top_allocation"] = diffs[0].size_diff if diffs else 0
+            if started_tracing:
+                tracemalloc.stop()
+        profile["stages"].append(entry)
+    return result
+
+
+def print_profile_summary(profile):
+    """Prints the time, peak memory and hot spots of the profiled stages"""
+
+    if not profile:
+        return
+    if not profile["stages"]:
+        print("++ No stage ran to profile, --force reruns the stages up to date")
+        return
+
+    print(f"++ Stage profiles in {profile['dir']}")
+    for entry in profile["stages"]:
+        memory = ""
+        if "peak_memory" in entry:
+            memory = f", peak {entry['peak_memory'] / 2**20:.1f} MiB traced"
+        print(f"   {entry['stage']:<10} {entry['duration']:8.3f} s{memory}")
+        for spot in entry.get("hot_spots", []):
+            print(
+                f"      {spot['tottime']:8.3f} s {spot['calls']:>8} calls"
+                f"  {spot['function']}"
+            )
@@ -0,0 +1,348 @@
+"""SQLite store of compile results for tracking performance over time"""
+
+import sys
+import json
+import sqlite3
+import argparse
+import datetime
+from pathlib import Path
+from .metrics import record_compile_metrics
+from .pipeline import hash_file
+from .utils import get_vela_version
+
+# Bumped whenever the schema changes, stored as the database user_version
+RESULTS_DB_VERSION = 1
+
+# Numeric columns that trends, comparisons and regressions can use
+RESULTS_METRICS = [
+    "cycles_npu",
+    "inference_time",
+    "weights_size",
+    "arena_cache_size",
+    "tensor_arena_size",
+    "vmem_size",
+    "lpmem_size",
+    "flash_size",
+]
+
+RESULTS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    source TEXT NOT NULL,
+    tag TEXT,
+    model TEXT NOT NULL,
+    model_path TEXT,
+    model_sha256 TEXT,
+    system_config TEXT,
+    vela_version TEXT,
+    success INTEGER NOT NULL,
+    {", ".join(f"{metric} REAL" for metric in RESULTS_METRICS)},
+    params TEXT,
+    stage_timings TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model, system_config, id);
+CREATE INDEX IF NOT EXISTS runs_model_sha256 ON runs (model_sha256);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag);
+"""
+
+
+def check_metric(metric):
+    """Rejects anything but a metric column, metrics are formatted into SQL"""
+
+    if metric not in RESULTS_METRICS:
+        raise ValueError(f"Unknown metric {metric}")
+
+
+def open_results_db(db_path):
+    """Opens the results database, creating the schema when needed"""
+
+    if str(db_path) != ":memory:":
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+    # Parallel compiles append to the same database
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, RESULTS_DB_VERSION):
+        connection.close()
+        raise ValueError(f"{db_path} has results schema {version}")
+    connection.executescript(RESULTS_SCHEMA)
+    connection.execute(f"PRAGMA user_version = {RESULTS_DB_VERSION}")
+    return connection
+
+
+def record_run(  # pylint: disable=R0913,R0917
+    db_path, source, model_file, results, check, params=None, tag=None
+):
+    """
+    Appends one compile to the results database.
+
+    Args:
+        db_path (str): The SQLite database file.
+        source (str): What ran the compile, compiler or optimizer.
+        model_file (str): The source model.
+        results (dict): The compiler results with the vela summary.
+        check (tuple): (success, perf_data) from sr_check_model.
+        params (dict): The compile settings, including the vela version.
+        tag (str): A free form label such as a commit or build name.
+
+    Returns:
+        int: The run id.
+    """
+
+    success, perf_data = check
+    params = dict(params or {})
+    perf_data = perf_data or {}
+    results = results or {}
+    summary = {
+        k: v
+        for k, v in results.items()
+        if isinstance(v, (str, int, float)) and k != "vela_log"
+    }
+
+    row = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "tag": tag,
+        "model": Path(model_file).stem,
+        "model_path": str(Path(model_file).resolve()),
+        "model_sha256": hash_file(model_file),
+        "system_config": results.get("system_config"),
+        "vela_version": params.pop("vela_version", None),
+        "success": int(bool(success)),
+        "params": json.dumps(params, sort_keys=True, default=str),
+        "stage_timings": json.dumps(results.get("stage_timings", {}), sort_keys=True),
+        "summary": json.dumps(summary, sort_keys=True),
+    }
+    for metric in RESULTS_METRICS:
+        row[metric] = perf_data.get(metric)
+
+    with open_results_db(db_path) as connection:
+        cursor = connection.execute(
+            f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values()),
+        )
+        run_id = cursor.lastrowid
+    connection.close()
+    return run_id
+
+
+def record_compile_results(args, results, check):
+    """
+    Adds a compile to the results db and the metrics file of args.
+
+    Args:
+        args: The compiler arguments.
+        results (dict): The compiler results.
+        check (tuple): (success, perf_data) from sr_check_model.
+    """
+
+    if args.results_db:
+        record_run(
+            args.results_db,
+            "compiler",
+            args.model_file,
+            results,
+            check,
+            {
+                "vela_version": get_vela_version(),
+                "accel_config": args.accel_config,
+                "arena_cache_size": args.arena_cache_size,
+                "optimize": args.optimize,
+                "memory_mode": args.memory_mode,
+            },
+            args.results_tag,
+        )
+    if args.metrics_file:
+        record_compile_metrics(args, results, check)
+
+
+def get_runs(connection, model=None, limit=20):
+    """Gets the latest runs, optionally for one model"""
+
+    query = "SELECT * FROM runs"
+    values = []
+    if model:
+        query += " WHERE model = ?"
+        values.append(model)
+    query += " ORDER BY id DESC LIMIT ?"
+    return [dict(r) for r in connection.execute(query, values + [limit])]
+
+
+def get_trend(  # pylint: disable=R0913,R0917
+    connection, model, metric="cycles_npu", system_config=None, tag=None, limit=50
+):
+    """Gets a metric over the successive runs of a model, oldest first"""
+
+    check_metric(metric)
+    query = f"SELECT id, timestamp, tag, system_config, {metric} AS value FROM runs"
+    query += " WHERE model = ? AND success = 1"
+    values = [model]
+    if system_config:
+        query += " AND system_config = ?"
+        values.append(system_config)
+    if tag:
+        query += " AND tag = ?"
+        values.append(tag)
+    query += " ORDER BY id DESC LIMIT ?"
+    rows = [dict(r) for r in connection.execute(query, values + [limit])]
+    return rows[::-1]
+
+
+def compare_runs(connection, run_a, run_b):
+    """Compares every metric of two runs"""
+
+    rows = {
+        r["id"]: dict(r)
+        for r in connection.execute(
+            "SELECT * FROM runs WHERE id IN (?, ?)", [run_a, run_b]
+        )
+    }
+    if run_a not in rows or run_b not in rows:
+        raise ValueError(f"Unknown run {run_a if run_a not in rows else run_b}")
+
+    comparison = []
+    for metric in RESULTS_METRICS:
+        a, b = rows[run_a][metric], rows[run_b][metric]
+        comparison.append(
+            {
+                "metric": metric,
+                "a": a,
+                "b": b,
+                "delta": None if a is None or b is None else b - a,
+                "percent": None if not a or b is None else (b - a) / a * 100,
+            }
+        )
+    return rows[run_a], rows[run_b], comparison
+
+
+def get_top_regressions(connection, metric="cycles_npu", top=10):
+    """
+    Gets the models whose latest run is worse than the run before it, per
+    model and system config, largest relative increase first.
+    """
+
+    check_metric(metric)
+    query = f"""
+        WITH ranked AS (
+            SELECT id, model, system_config, {metric} AS value,
+                ROW_NUMBER() OVER (
+                    PARTITION BY model, system_config ORDER BY id DESC
+                ) AS position
+            FROM runs WHERE success = 1 AND {metric} IS NOT NULL
+        )
+        SELECT latest.model, latest.system_config,
+            previous.id AS previous_id, latest.id AS latest_id,
+            previous.value AS previous, latest.value AS latest,
+            (latest.value - previous.value) * 100.0 / previous.value AS percent
+        FROM ranked AS latest
+        JOIN ranked AS previous
+            ON latest.model = previous.model
+            AND latest.system_config IS previous.system_config
+            AND previous.position = 2
+        WHERE latest.position = 1 AND previous.value > 0
+            AND latest.value > previous.value
+        ORDER BY percent DESC LIMIT ?
+    """
+    return [dict(r) for r in connection.execute(query, [top])]
+
+
+def print_rows(rows, columns):
+    """Prints rows as a fixed width table"""
+
+    widths = {
+        c: max([len(c)] + [len(format_value(r.get(c))) for r in rows]) for c in columns
+    }
+    print("  ".join(f"{c:>{widths[c]}}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{format_value(row.get(c)):>{widths[c]}}" for c in columns))
+
+
+def format_value(value):
+    """Formats a table value"""
+
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def get_results_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(description="Query the compile results database.")
+    parser.add_argument(
+        "--results-db", type=str, required=True, help="SQLite results database"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    runs_parser = subparsers.add_parser("runs", help="List the latest runs")
+    runs_parser.add_argument("-m", "--model", type=str, help="Model name")
+    runs_parser.add_argument("--limit", type=int, default=20)
+
+    trend_parser = subparsers.add_parser("trend", help="A metric over time")
+    trend_parser.add_argument("model", type=str, help="Model name")
+    trend_parser.add_argument("--metric", choices=RESULTS_METRICS, default="cycles_npu")
+    trend_parser.add_argument("--system-config", type=str)
+    trend_parser.add_argument("--tag", type=str)
+    trend_parser.add_argument("--limit", type=int, default=50)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two runs")
+    compare_parser.add_argument("run_a", type=int)
+    compare_parser.add_argument("run_b", type=int)
+
+    regressions_parser = subparsers.add_parser(
+        "regressions", help="Largest regressions of the latest runs"
+    )
+    regressions_parser.add_argument(
+        "--metric", choices=RESULTS_METRICS, default="cycles_npu"
+    )
+    regressions_parser.add_argument("--top", type=int, default=10)
+    return parser
+
+
+def main():
+    """Main for the command line results query"""
+    parser = get_results_argparser()
+    args = parser.parse_args()
+
+    connection = open_results_db(args.results_db)
+    if args.command == "runs":
+        print_rows(
+            get_runs(connection, args.model, args.limit),
+            ["id", "timestamp", "source", "tag", "model", "system_config"]
+            + ["success", "cycles_npu", "inference_time"],
+        )
+    elif args.command == "trend":
+        print_rows(
+            get_trend(
+                connection,
+                args.model,
+                args.metric,
+                args.system_config,
+                args.tag,
+                args.limit,
+            ),
+            ["id", "timestamp", "tag", "system_config", "value"],
+        )
+    elif args.command == "compare":
+        run_a, run_b, comparison = compare_runs(connection, args.run_a, args.run_b)
+        print(f"a: run {run_a['id']} {run_a['model']} {run_a['system_config']}")
+        print(f"b: run {run_b['id']} {run_b['model']} {run_b['system_config']}")
+        print_rows(comparison, ["metric", "a", "b", "delta", "percent"])
+    else:
+        print_rows(
+            get_top_regressions(connection, args.metric, args.top),
+            ["model", "system_config", "previous_id", "latest_id"]
+            + ["previous", "latest", "percent"],
+        )
+    connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,17 @@
 
 import argparse
 import tempfile
+from .calibration import apply_calibration, load_calibration
+from .model_info import load_model_index
+from .perf_baseline import add_baseline_arguments, run_baseline_gate
+from .profiling import add_profile_arguments, get_profile_kwargs
+from .preflight import print_preflight_report, sr_preflight_check
+from .results_db import record_run
 from .sr_model_compiler import (
     sr_model_compiler,
     sr_check_model,
     get_args_from_call,
+    get_vela_version,
 )
 
 
@@ -19,9 +26,27 @@ def model_optimizer_search(args):
         # You can perform operations within the temporary directory
         output_dir = f"{tmpdirname}"
 
+        # The arena always lives in vmem, reject models that can never fit.
+        # The model index is kept in the output dir for the compiles below,
+        # which skip their own preflight.
+        feasible, preflight_report = sr_preflight_check(
+            args.model_file,
+            args.vmem_size_limit,
+            load_model_index(args.model_file, output_dir),
+        )
+        print_preflight_report(preflight_report)
+        if not feasible:
+            return sr_check_model(
+                {"cycles_npu": 0, "model_loc": None, "preflight": preflight_report}
+            )
+
         # Gets minimum arena cache size
         results_size = sr_model_compiler(
-            model_file=args.model_file, arena_cache_size=3072000, output_dir=output_dir
+            model_file=args.model_file,
+            arena_cache_size=3072000,
+            output_dir=output_dir,
+            no_preflight=True,
+            **get_profile_kwargs(args, "size"),
         )
         # Analyze the results
         weights_size = int(float(results_size["off_chip_flash_memory_used"]) * 1024)
@@ -52,11 +77,41 @@ def model_optimizer_search(args):
             vmem_size_limit=args.vmem_size_limit,
             lpmem_size_limit=args.lpmem_size_limit,
             optimize=args.optimize,
+            per_layer=bool(args.baseline or args.calibration),
+            no_preflight=True,
+            **get_profile_kwargs(args, "final"),
         )
 
     # Checks the SR100 mapping
     success, perf_data = sr_check_model(results)
 
+    # Measured correction of the vela estimate
+    if args.calibration and success:
+        apply_calibration(
+            perf_data, load_calibration(args.calibration), results.get("per_layer")
+        )
+
+    # Gate on the stored baseline
+    if args.baseline and success:
+        perf_data["baseline_passed"] = run_baseline_gate(args, results, perf_data)
+
+    if args.results_db:
+        record_run(
+            args.results_db,
+            "optimizer",
+            args.model_file,
+            results,
+            (success, perf_data),
+            {
+                "vela_version": get_vela_version(),
+                "arena_cache_size": cache_size,
+                "optimize": args.optimize,
+                "vmem_size_limit": args.vmem_size_limit,
+                "lpmem_size_limit": args.lpmem_size_limit,
+            },
+            args.results_tag,
+        )
+
     return success, perf_data
 
 
@@ -93,6 +148,23 @@ def get_optimizer_argparser():
         choices=["Performance", "Size"],
         help="Choose optimization Type",
     )
+    parser.add_argument(
+        "--results-db",
+        type=str,
+        help="Append the chosen configuration to this SQLite database",
+    )
+    parser.add_argument(
+        "--results-tag",
+        type=str,
+        help="Label stored with the result, such as a commit or build name",
+    )
+    add_profile_arguments(parser)
+    add_baseline_arguments(parser)
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="Measured latency factors that correct the chosen configuration",
+    )
     return parser
 
 
@@ -113,6 +185,8 @@ def main():
         returncode = 0
     else:
         returncode = 1
+    if perf_data and perf_data.get("baseline_passed") is False:
+        returncode = 2
     return returncode
 
 
@@ -8,17 +8,38 @@ import tempfile
 from pathlib import Path
 import datetime
 import glob
-import csv
 import re
 from jinja2 import Environment, FileSystemLoader
 
 # import platform
 from .gen_model_cpp import generate_model_cpp
-from .gen_input_expected_data import generate_input_expected_data
+from .gen_input_expected_data import write_input_expected_data
 from .generate_micro_mutable_op_resolver_from_model import (
     generate_micro_mutable_ops_resolver_header,
 )
-from .utils import get_platform_path
+from .inference_cache import get_tensorflow_version, run_cached_reference_inference
+from .pipeline import hash_data, load_manifest, run_stage, save_manifest, write_depfiles
+from .arena_planner import print_arena_report, sr_plan_arena
+from .calibration import apply_calibration, load_calibration
+from .graph_cleanup import compare_cleanup, run_cleanup_stage
+from .metrics import add_metrics_arguments, record_compile_metrics
+from .model_info import load_model_index
+from .perf_baseline import add_baseline_arguments, run_baseline_gate
+from .perf_baseline import get_per_layer_report
+from .profiling import add_profile_arguments, get_profile, print_profile_summary
+from .preflight import print_preflight_report, sr_preflight_check
+from .results_db import record_compile_results
+from .utils import get_platform_path, get_vela_version, write_file_if_changed
+from .vela_allocation import print_allocation_report, sr_allocation_report
+from .vela_summary import get_subgraph_breakdown, get_vela_summary
+from .watch import add_watch_arguments, watch_compiler
+
+# Stages whose outputs also depend on the inputs of earlier stages
+UPSTREAM_STAGES = {
+    "vela": ["cleanup"],
+    "resolver": ["cleanup", "vela"],
+    "model": ["cleanup", "vela", "resolver"],
+}
 
 
 # Function to expand wildcards in input paths
@@ -39,25 +60,8 @@ def expand_wildcards(file_paths):
     return expanded_paths
 
 
-def gen_model_script(new_model_file, args, env, license_header):
-    """Generate the model script outputs"""
-
-    if "flash" in args.system_config:
-        weights_loc = "flash"
-    else:
-        weights_loc = "sram"
-
-    # Generate model C++ code
-    generate_model_cpp(
-        new_model_file,
-        args.output_dir,
-        args.model_file_out,
-        weights_loc,
-        args.arena_cache_size,
-        args.model_namespace,
-        env,
-        license_header,
-    )
+def gen_resolver_script(new_model_file, args, license_header):
+    """Generate the op resolver code and detect custom ops in the original model"""
 
     # Generate micro mutable op resolver code
     common_path = os.path.dirname(new_model_file)
@@ -69,21 +73,15 @@ def gen_model_script(new_model_file, args, env, license_header):
         args.output_dir,
         args.model_namespace,
         license_header,
+        index_dir=args.output_dir,
     )
 
-    # Open the source file in read mode and the destination file in append mode
+    # Read the resolver so it can be appended to the model code
     src_fn = get_platform_path(
         args.output_dir + "/" + args.model_namespace + "_micro_mutable_op_resolver.hpp"
     )
-    dest_fn = get_platform_path(args.output_dir + "/" + args.model_file_out + ".cc")
-    with (
-        open(src_fn, "r", encoding="utf-8") as source_file,
-        open(dest_fn, "a", encoding="utf-8") as destination_file,
-    ):
-        # Read the content from the source file
-        content = source_file.read()
-        # Append the content to the destination file
-        destination_file.write(content)
+    with open(src_fn, "r", encoding="utf-8") as source_file:
+        resolver_code = source_file.read()
 
     # Generate on the original file
     generate_micro_mutable_ops_resolver_header(
@@ -92,6 +90,7 @@ def gen_model_script(new_model_file, args, env, license_header):
         args.output_dir,
         "orig",
         license_header,
+        index_dir=args.output_dir,
     )
 
     resolver_file = get_platform_path(
@@ -106,24 +105,107 @@ def gen_model_script(new_model_file, args, env, license_header):
         else:
             synai_ethosu_op_found = 0
 
-    # Delete micro mutable op resolver file if it exists
-    micro_mutable_file = get_platform_path(
-        args.output_dir + "/" + args.model_file_out + "_micro_mutable_op_resolver.hpp"
+    # Delete the intermediate micro mutable op resolver files
+    for micro_mutable_file in [src_fn, resolver_file]:
+        if os.path.exists(micro_mutable_file):
+            os.remove(micro_mutable_file)
+
+    return resolver_code, synai_ethosu_op_found
+
+
+def gen_model_script(  # pylint: disable=R0913,R0917
+    new_model_file, args, env, license_header, manifest, tensor_arena_size=None
+):
+    """Generate the model script outputs"""
+
+    if "flash" in args.system_config:
+        weights_loc = "flash"
+    else:
+        weights_loc = "sram"
+
+    templates_dir = Path(__file__).parent / "templates"
+
+    # Generate the op resolver, skipped when the models are unchanged
+    resolver_code, synai_ethosu_op_found = run_stage(
+        manifest,
+        "resolver",
+        [
+            new_model_file,
+            args.model_file,
+            templates_dir / "micro_mutable_op_resolver.hpp.mako",
+        ],
+        {"namespace": args.model_namespace},
+        lambda: (gen_resolver_script(new_model_file, args, license_header), []),
+        args.force,
     )
-    if os.path.exists(micro_mutable_file):
-        os.remove(micro_mutable_file)
 
-    # Delete micro mutable op resolver file if it exists
-    micro_mutable_file = get_platform_path(
-        args.output_dir + "/" + "orig_micro_mutable_op_resolver.hpp"
+    # Bundles share one resolver across models instead
+    if args.shared_resolver:
+        resolver_code = ""
+
+    # Generate model C++ code with the resolver appended
+    run_stage(
+        manifest,
+        "model",
+        [
+            new_model_file,
+            templates_dir / "tflite.cc.template",
+            templates_dir / "model_metadata.hpp.template",
+            templates_dir / "header_template.txt",
+            *([args.delta_from] if args.delta_from else []),
+        ],
+        {
+            "model_file_out": args.model_file_out,
+            "weights_loc": weights_loc,
+            "arena_cache_size": args.arena_cache_size,
+            "namespace": args.model_namespace,
+            "resolver": hash_data(resolver_code),
+            "tensor_arena_size": tensor_arena_size,
+            "delta_from": args.delta_from,
+            "flash_erase_size": args.flash_erase_size,
+        },
+        lambda: (
+            None,
+            generate_model_cpp(
+                new_model_file,
+                args.output_dir,
+                args.model_file_out,
+                weights_loc,
+                args.arena_cache_size,
+                args.model_namespace,
+                env,
+                license_header,
+                resolver_code,
+                tensor_arena_size,
+                args.delta_from,
+                args.flash_erase_size,
+            ),
+        ),
+        args.force,
     )
-    if os.path.exists(micro_mutable_file):
-        os.remove(micro_mutable_file)
 
     return synai_ethosu_op_found
 
 
-def gen_inout_script(synai_ethosu_op_found, args, license_header):
+def gen_expected_data(args, license_header, manifest):
+    """Generate io.cc and the expected outputs, using the inference cache"""
+
+    cache_dir = False if args.no_cache else args.cache_dir
+    manifest["inference_cache"] = {"hits": 0, "misses": 0}
+    input_arrays, output_arrays = run_cached_reference_inference(
+        args.model_file, args.input, cache_dir, manifest["inference_cache"]
+    )
+    return write_input_expected_data(
+        args.model_file,
+        args.output_dir,
+        args.model_file_out,
+        license_header,
+        input_arrays,
+        output_arrays,
+    )
+
+
+def gen_inout_script(synai_ethosu_op_found, args, license_header, manifest):
     """Generate the inout script results"""
 
     # Check if AddSynai or AddEthosU is present in the contents of micro mutable op resolver
@@ -137,21 +219,23 @@ def gen_inout_script(synai_ethosu_op_found, args, license_header):
                 "EthosU custom op found in the model, skipping expected output generation"
             )
     else:
-        if args.input:
-            generate_input_expected_data(
+        templates_dir = Path(__file__).parent / "templates"
+        run_stage(
+            manifest,
+            "inout",
+            [
                 args.model_file,
-                args.output_dir,
-                args.model_file_out,
-                license_header,
-                args.input,
-            )
-        else:
-            generate_input_expected_data(
-                args.model_file,
-                args.output_dir,
-                args.model_file_out,
-                license_header,
-            )
+                *(args.input or []),
+                templates_dir / "io_template.mako",
+                templates_dir / "header_template.txt",
+            ],
+            {
+                "namespace": args.model_file_out,
+                "tensorflow": get_tensorflow_version(),
+            },
+            lambda: (None, gen_expected_data(args, license_header, manifest)),
+            args.force,
+        )
 
 
 def setup_input(args):
@@ -216,34 +300,6 @@ def sr_get_compile_log(out_dir):
     return log_text
 
 
-def get_vela_summary(summary_file):
-    """
-    Parses a CSV file into a list of dictionaries, where each dictionary
-    represents a row and uses the header row as keys.
-
-    Args:
-        filename (str): The path to the CSV file.
-
-    Returns:
-        list: A list of dictionaries, or an empty list if the file is not found.
-    """
-
-    data = []
-    try:
-        with open(summary_file, "r", newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data.append(row)
-    except FileNotFoundError:
-        print(f"Error: The file '{summary_file}' was not found.")
-
-    if len(data) == 1:
-        data = data[0]
-    for key in data.keys():
-        print(f"{key} = {data[key]}")
-    return data
-
-
 def sr_check_model(results_dict):
     """Check model on SR data file to see if it fits"""
 
@@ -307,11 +363,26 @@ def sr_check_model(results_dict):
     if perf_data["lpmem_size"] > results_dict["lpmem_size_limit"]:
         success = False
 
+    # Per subgraph breakdown and vela allocations when they were reported
+    if results_dict.get("subgraphs"):
+        perf_data["subgraphs"] = get_subgraph_breakdown(results_dict["subgraphs"])
+    if results_dict.get("allocation"):
+        perf_data["allocation"] = results_dict["allocation"]
+
+    # Check the planned TFLM tensor arena, it shares vmem with vmem weights
+    if results_dict.get("tensor_arena_size") is not None:
+        perf_data["tensor_arena_size"] = results_dict["tensor_arena_size"]
+        tensor_arena_vmem = perf_data["tensor_arena_size"]
+        if results_dict["model_loc"] == "vmem":
+            tensor_arena_vmem += perf_data["weights_size"]
+        if tensor_arena_vmem > results_dict["vmem_size_limit"]:
+            success = False
+
     return success, perf_data
 
 
-def run_vela(args):
-    """Run the vela compiler"""
+def get_vela_config(args):
+    """Gets the vela INI file and memory mode for the system config"""
 
     # get the types of models
     model_types, _ = get_model_types(args.system_config_ini_file)
@@ -324,67 +395,120 @@ def run_vela(args):
 
     # Set the memory mode
     if args.memory_mode:
-        memory_mode = f"--memory-mode={args.memory_mode}"
+        memory_mode = args.memory_mode
     else:
-        memory_mode = f"--memory-mode={model_types[args.system_config][1][-1]}"
+        memory_mode = model_types[args.system_config][1][-1]
+
+    return arm_config, memory_mode
+
+
+def get_vela_params(args, output_dir):
+    """Gets the vela command line"""
+
+    arm_config, memory_mode = get_vela_config(args)
 
     # Generate vela optimized model
     vela_params = [
         "vela",
         "--output-dir",
-        args.output_dir,
+        output_dir,
         f"--accelerator-config={args.accel_config}",
         "--optimise=" + args.optimize,
         f"--config={arm_config}",
-        memory_mode,
+        f"--memory-mode={memory_mode}",
         f"--system-config={args.system_config}",
     ]
     if args.arena_cache_size:
         vela_params.append(f"--arena-cache-size={args.arena_cache_size}")
     if args.verbose_cycle_estimate:
         vela_params.append("--verbose-cycle-estimate")
+    if args.per_layer or args.baseline or args.calibration:
+        vela_params.append("--verbose-performance")
+    if args.allocation_report:
+        vela_params.append("--verbose-allocation")
     if args.verbose_all:
         vela_params.append("--verbose-all")
     vela_params.append(args.model_file)
 
+    return vela_params
+
+
+def run_vela(args):
+    """Run the vela compiler, returns the results and the generated files"""
+
+    model_name = args.model_file.split("/")[-1].replace(".tflite", "")
+    output_files = []
+
     print("************ VELA ************")
     vela_log = ""
-    try:
-        vela_result = subprocess.run(vela_params, capture_output=True, check=True)
-        vela_log += vela_result.stdout.decode("utf-8")
-        vela_log += "\n"
-        vela_log += vela_result.stderr.decode("utf-8")
-
-        # Grab the summary file
-        model_name = args.model_file.split("/")[-1].replace(".tflite", "")
-        summary_file = (
-            f"{args.output_dir}/{model_name}_summary_{args.system_config}.csv"
-        )
-        results = get_vela_summary(summary_file)
-        results["vmem_size_limit"] = args.vmem_size_limit
-        results["lpmem_size_limit"] = args.lpmem_size_limit
 
-    except subprocess.CalledProcessError as e:
-        print("Compilation failed:")
-        results = {"cycles_npu": 0}
-        vela_log += e.stdout.decode("utf-8")
-        vela_log += "\n"
-        vela_log += e.stderr.decode("utf-8")
+    # Vela writes to a staging directory so unchanged outputs keep their mtime
+    with tempfile.TemporaryDirectory(dir=args.output_dir) as staging_dir:
+        vela_params = get_vela_params(args, staging_dir)
+        try:
+            vela_result = subprocess.run(vela_params, capture_output=True, check=True)
+            vela_log += vela_result.stdout.decode("utf-8")
+            vela_log += "\n"
+            vela_log += vela_result.stderr.decode("utf-8")
+
+            # Grab the summary file
+            summary_file = (
+                f"{staging_dir}/{model_name}_summary_{args.system_config}.csv"
+            )
+            results = get_vela_summary(summary_file)
+
+            # Written with --verbose-performance
+            per_layer_file = f"{staging_dir}/{model_name}_per-layer.csv"
+            if os.path.exists(per_layer_file):
+                results["per_layer"] = get_per_layer_report(per_layer_file)
+
+            # Written with --verbose-allocation
+            if args.allocation_report:
+                results["allocation"] = sr_allocation_report(
+                    vela_log, staging_dir, model_name, args.allocation_report
+                )
+                print_allocation_report(results["allocation"])
+
+        except subprocess.CalledProcessError as e:
+            print("Compilation failed:")
+            results = {"cycles_npu": 0}
+            vela_log += e.stdout.decode("utf-8")
+            vela_log += "\n"
+            vela_log += e.stderr.decode("utf-8")
+
+        # Only replace the outputs whose contents changed
+        for staged_file in sorted(glob.glob(f"{staging_dir}/*")):
+            output_file = f"{args.output_dir}/{os.path.basename(staged_file)}"
+            with open(staged_file, "rb") as fp:
+                write_file_if_changed(output_file, fp.read())
+            output_files.append(output_file)
 
     # print the log
     results["vela_log"] = vela_log
     print(vela_log)
 
     # Store the logs as well
-    with open(f"{args.output_dir}/{model_name}_vela.log", "w", encoding="utf-8") as fp:
-        fp.write(vela_log)
+    log_file = f"{args.output_dir}/{model_name}_vela.log"
+    write_file_if_changed(log_file, vela_log)
+    output_files.append(log_file)
     print("********* END OF VELA *********")
 
-    return results
+    return results, output_files
+
+
+def compiler_main(args):
+    """Main function with input args, a compile that raises is a failure"""
+
+    try:
+        return run_compiler(args)
+    except Exception:
+        if args.metrics_file:
+            record_compile_metrics(args, {}, (False, None))
+        raise
 
 
-def compiler_main(args):  # pylint: disable=R0914
-    """Main function with input args"""
+def run_compiler(args):  # pylint: disable=R0912,R0914,R0915
+    """Compiles the model of args, returns the results"""
 
     # Creating a temporary directory if output dir is not provided
     tmp_dir = None
@@ -396,6 +520,11 @@ def compiler_main(args):  # pylint: disable=R0914
     synai_ethosu_op_found = 0
     args, scripts_to_run, new_model_file, _, model_loc = setup_input(args)
 
+    # Stages are skipped when their inputs match the manifest
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = load_manifest(args.output_dir, get_profile(args))
+    cleanup = run_cleanup_stage(manifest, args) if args.graph_cleanup else None
+
     # Get the path to the directory containing this script
     script_dir = Path(__file__).parent
     get_model_types()
@@ -415,13 +544,55 @@ def compiler_main(args):  # pylint: disable=R0914
     license_header = header_template.render(
         script_name=script_dir.name,
         file_name=Path(args.model_file).name,
-        gen_time=datetime.datetime.now(),
+        gen_time=None,
         year=datetime.datetime.now().year,
     )
 
-    if args.compiler == "vela":
-        results = run_vela(args)
+    # Reject clearly infeasible models without spending a vela run
+    feasible, preflight_report = True, None
+    if args.compiler == "vela" and not args.no_preflight:
+        feasible, preflight_report = sr_preflight_check(
+            args.model_file,
+            args.vmem_size_limit,
+            load_model_index(args.model_file, args.output_dir),
+            model_loc,
+            args.lpmem_size_limit,
+        )
+        print_preflight_report(preflight_report)
+
+    if not feasible:
+        results = {
+            "cycles_npu": 0,
+            "model_loc": model_loc,
+            "system_config": args.system_config,
+            "preflight": preflight_report,
+        }
+    elif args.compiler == "vela":
+        arm_config, _ = get_vela_config(args)
+        results = run_stage(
+            manifest,
+            "vela",
+            [args.model_file, arm_config],
+            {
+                "vela_params": get_vela_params(args, ""),
+                "vela_version": get_vela_version(),
+                "allocation_report": args.allocation_report,
+            },
+            lambda: run_vela(args),
+            args.force,
+        )
+        results = dict(results)
+        results["vmem_size_limit"] = args.vmem_size_limit
+        results["lpmem_size_limit"] = args.lpmem_size_limit
         results["model_loc"] = model_loc
+        results["preflight"] = preflight_report
+        results["graph_cleanup"] = compare_cleanup(manifest, args, cleanup, results)
+
+        # Size the tensor arena exactly from the vela output
+        if results["cycles_npu"] and os.path.exists(new_model_file):
+            arena = sr_plan_arena(new_model_file, load_model_index(new_model_file))
+            print_arena_report(arena)
+            results["tensor_arena_size"] = arena["arena_size"]
     elif args.compiler == "synai":
         # Generate synai optimized model
         print("*********** SYNAI **********")
@@ -441,10 +612,25 @@ def compiler_main(args):  # pylint: disable=R0914
         for script in scripts_to_run:
             if script == "model":
                 synai_ethosu_op_found = gen_model_script(
-                    new_model_file, args, env, license_header
+                    new_model_file,
+                    args,
+                    env,
+                    license_header,
+                    manifest,
+                    results.get("tensor_arena_size"),
                 )
             elif script == "inout":
-                gen_inout_script(synai_ethosu_op_found, args, license_header)
+                gen_inout_script(synai_ethosu_op_found, args, license_header, manifest)
+    save_manifest(manifest)
+    if args.emit_depfiles:
+        write_depfiles(manifest, UPSTREAM_STAGES)
+
+    # Keep the results for tracking performance over time
+    if results is not None:
+        results["stage_timings"] = manifest["timings"]
+        results["inference_cache"] = manifest.get("inference_cache")
+        record_compile_results(args, results, sr_check_model(results))
+    print_profile_summary(manifest["profile"])
 
     # Cleaning up the temporary directory if it was created
     if tmp_dir:
@@ -642,6 +828,65 @@ def get_compiler_argparser():
         default=1024000,
         help="Sets the model arena cache size in bytes",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="Directory for cached reference inference results",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always rerun the reference inference for expected outputs",
+    )
+    parser.add_argument(
+        "--graph-cleanup",
+        action="store_true",
+        help="Remove redundant reshapes and quantize pairs before vela",
+    )
+    parser.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="Run vela even when the preflight check rejects the model",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun every stage even when its inputs are unchanged",
+    )
+    parser.add_argument(
+        "--emit-depfiles",
+        action="store_true",
+        help="Write a Make/Ninja depfile (<output>.d) next to each output",
+    )
+    parser.add_argument(
+        "--shared-resolver",
+        action="store_true",
+        help="Do not append the op resolver to the model code, see sr_model_bundle",
+    )
+    parser.add_argument(
+        "--delta-from",
+        type=str,
+        help="Previous .bin, writes a .delta with the flash sectors that changed",
+    )
+    parser.add_argument(
+        "--flash-erase-size",
+        type=int,
+        default=4096,
+        help="Flash erase sector size in bytes for --delta-from",
+    )
+    parser.add_argument(
+        "--results-db",
+        type=str,
+        help="Append the results to this SQLite database, see sr_results",
+    )
+    parser.add_argument(
+        "--results-tag",
+        type=str,
+        help="Label stored with the results, such as a commit or build name",
+    )
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_watch_arguments(parser)
     parser.add_argument(
         "-v",
         "--verbose-all",
@@ -653,6 +898,24 @@ def get_compiler_argparser():
         action="store_true",
         help="Turns on verbose cycle estimation",
     )
+    parser.add_argument(
+        "--per-layer",
+        action="store_true",
+        help="Write the vela per layer performance report",
+    )
+    parser.add_argument(
+        "--allocation-report",
+        nargs="?",
+        const="csv",
+        choices=["csv", "svg", "txt"],
+        help="Write the vela tensor allocation table, svg or txt adds a timeline",
+    )
+    add_baseline_arguments(parser)
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="Calibration from sr_calibrate, reports the calibrated latency",
+    )
     parser.add_argument(
         "-p",
         "--optimize",
@@ -666,6 +929,27 @@ def get_compiler_argparser():
     return parser
 
 
+def check_compile(args, results):
+    """
+    Checks the SR100 mapping of a compile, with the calibration applied and
+    gated on the stored baseline.
+
+    Returns:
+        tuple: (success, perf_data, whether the baseline gate passed)
+    """
+
+    success, perf_data = sr_check_model(results)
+
+    # Measured correction of the vela estimate
+    if args.calibration and success:
+        calibration = load_calibration(args.calibration)
+        apply_calibration(perf_data, calibration, results.get("per_layer"))
+
+    # Gate on the stored baseline
+    gated = args.baseline and success
+    return success, perf_data, not gated or run_baseline_gate(args, results, perf_data)
+
+
 def main():
     """Main for the command line compiler"""
     parser = get_compiler_argparser()
@@ -676,11 +960,17 @@ def main():
         print_modes(args)
         return 0
 
-    # Runs the vela compiler
-    results = compiler_main(args)
+    # Recompiles in this process on every change until interrupted
+    if args.watch:
+        inputs = expand_wildcards(args.input or [])
+        files = [args.model_file, get_vela_config(args)[0], *inputs]
+        return watch_compiler(
+            args, files, lambda a: check_compile(a, compiler_main(a))[:2]
+        )
 
-    # Checks the SR100 mapping
-    success, perf_data = sr_check_model(results)
+    # Runs the vela compiler and checks the SR100 mapping
+    results = compiler_main(args)
+    success, perf_data, gate_passed = check_compile(args, results)
 
     # Reports the
     if success:
@@ -692,6 +982,10 @@ def main():
     for key, value in perf_data.items():
         print(f"   {key} = {value}")
 
+    # Failed the stored baseline
+    if not gate_passed:
+        returncode = 2
+
     return returncode
 
 
@@ -1,7 +1,9 @@
 """Utilities to help the library"""
 
+import os
 import subprocess
 import platform
+from importlib import metadata
 
 
 def call_shell_cmd(cmd):
@@ -32,3 +34,54 @@ def get_platform_path(unix_path):
     if platform.system() == "Windows":
         return unix_path.replace("/", "\\")
     return unix_path
+
+
+def write_file_if_changed(file_path, data):
+    """
+    Writes data to a file only when the contents differ, so unchanged
+    artifacts keep their modification time.
+
+    Args:
+        file_path (str): The path to the file.
+        data (str or bytes): Text is written as UTF-8, bytes as is.
+
+    Returns:
+        bool: True if the file was written, False if it was already current.
+    """
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    try:
+        with open(file_path, "rb") as fp:
+            if fp.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    with open(file_path, "wb") as fp:
+        fp.write(data)
+    return True
+
+
+def set_default_mode(file_path):
+    """
+    Gives a file the mode open() would have, mkstemp files are only
+    readable by their owner.
+
+    Args:
+        file_path (str): The path to the file.
+    """
+
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(file_path, 0o666 & ~umask)
+
+
+def get_vela_version():
+    """Gets the installed vela version"""
+
+    try:
+        return metadata.version("ethos-u-vela")
+    except metadata.PackageNotFoundError:
+        return "unknown"
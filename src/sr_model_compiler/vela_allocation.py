@@ -0,0 +1,305 @@
+"""Tensor allocation and fragmentation report from the vela allocation log"""
+
+import re
+import csv
+import sys
+import argparse
+from .arena_planner import get_covered_bytes
+from .utils import write_file_if_changed
+
+# Printed by vela with --verbose-allocation
+ALLOCATION_HEADER = re.compile(
+    r"Tensor Allocation for mem_area (\w+), of mem_type_set \((.*)\),"
+    r" using allocator (\w+), in (.+) subgraph:"
+)
+ALLOCATION_ROW = re.compile(
+    r"^\s*(\d+)\s*-\s*(\d+):\s*(0x[0-9a-fA-F]+)\s*-\s*(0x[0-9a-fA-F]+):"
+    r"\s*(\d+):\s*(\d+):\s*([^:]*?)\s*: (.*)$"
+)
+ALLOCATION_PEAKS = {
+    "peak_tensor_size": "Allocation Peak Tensor Size:",
+    "peak_memory_usage": "Allocation Peak Memory Usage:",
+}
+
+# Timeline colours per tensor purpose
+PURPOSE_COLOURS = {
+    "FeatureMap": "#4c78a8",
+    "Weights": "#f58518",
+    "Scratch": "#54a24b",
+    "ScratchFast": "#54a24b",
+    "LUT": "#b279a2",
+    "FastStorageBias": "#e45756",
+}
+
+
+def parse_vela_allocation(vela_log):
+    """
+    Parses the tensor allocation tables vela prints with --verbose-allocation.
+
+    Returns:
+        list: One dict per allocation with the memory area, memory types,
+            allocator, subgraph and the tensors with their live range and
+            address range.
+    """
+
+    sections = []
+    section = {}
+    for line in vela_log.splitlines():
+        header = ALLOCATION_HEADER.search(line)
+        row = ALLOCATION_ROW.match(line) if section else None
+        if header:
+            section = {
+                "mem_area": header.group(1),
+                "mem_types": [t.strip() for t in header.group(2).split(",")],
+                "allocator": header.group(3),
+                "subgraph": header.group(4),
+                "tensors": [],
+            }
+            sections.append(section)
+        elif row:
+            section["tensors"].append(
+                {
+                    "start": int(row.group(1)),
+                    "end": int(row.group(2)),
+                    "address": int(row.group(3), 16),
+                    "size": int(row.group(5)),
+                    "purpose": row.group(7),
+                    "name": row.group(8).strip(),
+                }
+            )
+        elif section:
+            for key, label in ALLOCATION_PEAKS.items():
+                if line.startswith(label):
+                    section[key] = int(line[len(label) :].split()[0])
+    return sections
+
+
+def get_live_bytes(tensors):
+    """
+    Gets the bytes live at each time step. Vela lists every tensor of a live
+    range, so tensors sharing memory are counted once.
+    """
+
+    live = []
+    for step in range(1 + max((t["end"] for t in tensors), default=-1)):
+        live.append(
+            get_covered_bytes(
+                [
+                    {"offset": t["address"], "size": t["size"]}
+                    for t in tensors
+                    if t["start"] <= step <= t["end"]
+                ]
+            )
+        )
+    return live
+
+
+def get_peak_tensors(tensors, step, top):
+    """Gets the largest buffers live at a step, with the tensors sharing them"""
+
+    buffers = {}
+    for t in tensors:
+        if t["start"] <= step <= t["end"]:
+            buffer = buffers.setdefault(
+                (t["address"], t["size"]),
+                {"name": t["name"], "size": t["size"], "purpose": t["purpose"]},
+            )
+            buffer["aliases"] = buffer.get("aliases", -1) + 1
+    return sorted(buffers.values(), key=lambda b: b["size"], reverse=True)[:top]
+
+
+def analyze_allocation(section, top=5):
+    """
+    Gets the peak usage and the fragmentation of an allocation. The
+    fragmentation is the share of the memory used that is not live at the
+    peak, the bytes lost to the placement rather than to the tensors.
+
+    Returns:
+        dict: The peak live bytes and time, the memory used, the
+            fragmentation and the largest tensors live at the peak.
+    """
+
+    tensors = section["tensors"]
+    live = get_live_bytes(tensors)
+    peak_live = max(live, default=0)
+    peak_time = live.index(peak_live) if live else 0
+    memory_used = section.get(
+        "peak_memory_usage",
+        max((t["address"] + t["size"] for t in tensors), default=0),
+    )
+    return {
+        "mem_area": section["mem_area"],
+        "mem_types": section["mem_types"],
+        "subgraph": section["subgraph"],
+        "tensors": len(tensors),
+        "peak_live_bytes": peak_live,
+        "peak_time": peak_time,
+        "memory_used": memory_used,
+        "fragmentation": (
+            (memory_used - peak_live) / memory_used if memory_used else 0.0
+        ),
+        "peak_tensors": get_peak_tensors(tensors, peak_time, top),
+    }
+
+
+def get_arena_section(sections):
+    """Gets the allocation of the scratch arena, the one vmem has to hold"""
+
+    for section in sections:
+        if any(t.startswith("Scratch") for t in section["mem_types"]):
+            return section
+    return sections[0] if sections else None
+
+
+def write_allocation_csv(sections, csv_file):
+    """Writes the per tensor address, size and live range table"""
+
+    with open(csv_file, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(
+            ["mem_area", "mem_types", "start", "end", "address", "size", "purpose"]
+            + ["name"]
+        )
+        for section in sections:
+            for t in section["tensors"]:
+                writer.writerow(
+                    [section["mem_area"], "+".join(section["mem_types"])]
+                    + [t["start"], t["end"], t["address"], t["size"], t["purpose"]]
+                    + [t["name"]]
+                )
+
+
+def escape_xml(text):
+    """Escapes text for an SVG element"""
+
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def get_svg_timeline(section, width=1000, height=500):
+    """Draws the tensors as boxes of live range against address"""
+
+    tensors = section["tensors"]
+    steps = 1 + max((t["end"] for t in tensors), default=0)
+    top = max((t["address"] + t["size"] for t in tensors), default=1) or 1
+    x_scale = width / steps
+    y_scale = height / top
+
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}"'
+        f' height="{height + 40}" font-family="sans-serif" font-size="12">',
+        f"<text x=\"0\" y=\"{height + 30}\">{section['mem_area']}"
+        f" {'+'.join(section['mem_types'])}: {steps} steps, {top} bytes</text>",
+    ]
+    for t in tensors:
+        colour = PURPOSE_COLOURS.get(t["purpose"], "#9d9d9d")
+        lines.append(
+            f'<rect x="{t["start"] * x_scale:.1f}"'
+            f' y="{height - (t["address"] + t["size"]) * y_scale:.1f}"'
+            f' width="{max((t["end"] - t["start"] + 1) * x_scale, 0.5):.1f}"'
+            f' height="{max(t["size"] * y_scale, 0.5):.1f}" fill="{colour}"'
+            f' stroke="white" stroke-width="0.2"><title>{escape_xml(t["name"])}'
+            f' {t["size"]} bytes @ {t["address"]:#x}, {t["start"]}-{t["end"]}'
+            "</title></rect>"
+        )
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
+
+
+def get_text_timeline(section, width=60):
+    """Gets the live bytes per time step as a text bar chart"""
+
+    live = get_live_bytes(section["tensors"])
+    peak = max(live, default=0) or 1
+    lines = [f"{'step':>6} {'live':>10}"]
+    for step, live_bytes in enumerate(live):
+        bars = "#" * round(live_bytes / peak * width)
+        lines.append(f"{step:>6} {live_bytes:>10} {bars}")
+    return "\n".join(lines) + "\n"
+
+
+def sr_allocation_report(vela_log, output_dir, model_name, timeline=None):
+    """
+    Writes <model>_allocation.csv from the vela allocation log and, with
+    timeline set to svg or txt, the arena timeline next to it as
+    <model>_allocation.svg or .txt.
+
+    Returns:
+        list: analyze_allocation of each allocation, the arena first.
+    """
+
+    sections = parse_vela_allocation(vela_log)
+    write_allocation_csv(sections, f"{output_dir}/{model_name}_allocation.csv")
+    arena = get_arena_section(sections)
+    if timeline in ["svg", "txt"] and arena is not None:
+        content = (
+            get_svg_timeline(arena) if timeline == "svg" else get_text_timeline(arena)
+        )
+        write_file_if_changed(
+            f"{output_dir}/{model_name}_allocation.{timeline}", content
+        )
+    if arena is not None:
+        sections.remove(arena)
+        sections.insert(0, arena)
+    return [analyze_allocation(section) for section in sections]
+
+
+def print_allocation_report(report):
+    """Prints the peak, the fragmentation and the largest tensors at the peak"""
+
+    for a in report:
+        print(
+            f"++ {a['mem_area']} {'+'.join(a['mem_types'])}: {a['memory_used']} bytes"
+            f" used, {a['peak_live_bytes']} bytes peak live at step {a['peak_time']},"
+            f" {a['fragmentation'] * 100:.1f}% fragmentation"
+        )
+        for t in a["peak_tensors"]:
+            aliases = f" (+{t['aliases']} sharing it)" if t["aliases"] else ""
+            print(f"   {t['size']:>10} {t['purpose']:<12} {t['name']}{aliases}")
+
+
+def get_allocation_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Report the vela tensor allocation and fragmentation."
+    )
+    parser.add_argument(
+        "vela_log", type=str, help="Vela log written with --verbose-allocation"
+    )
+    parser.add_argument(
+        "--timeline",
+        type=str,
+        help="Write the arena timeline, as SVG if the file ends in .svg",
+    )
+    parser.add_argument("--csv", type=str, help="Write the per tensor allocation table")
+    parser.add_argument(
+        "--top", type=int, default=5, help="Largest tensors at the peak to show"
+    )
+    return parser
+
+
+def main():
+    """Main for the command line allocation report"""
+    parser = get_allocation_argparser()
+    args = parser.parse_args()
+
+    with open(args.vela_log, "r", encoding="utf-8", errors="replace") as fp:
+        sections = parse_vela_allocation(fp.read())
+    if not sections:
+        print(f"ERROR:: No allocation tables in {args.vela_log}")
+        return 1
+
+    print_allocation_report([analyze_allocation(s, args.top) for s in sections])
+    if args.csv:
+        write_allocation_csv(sections, args.csv)
+    if args.timeline:
+        arena = get_arena_section(sections)
+        if args.timeline.endswith(".svg"):
+            write_file_if_changed(args.timeline, get_svg_timeline(arena))
+        else:
+            write_file_if_changed(args.timeline, get_text_timeline(arena))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Reads the vela summary CSV and combines rows of several subgraphs"""
+
+import csv
+
+# Columns that describe the compile, taken from the first row
+SUMMARY_SETTINGS = [
+    "experiment",
+    "network",
+    "accelerator_configuration",
+    "system_config",
+    "memory_mode",
+    "core_clock",
+    "arena_cache_size",
+    "sram_bandwidth",
+    "dram_bandwidth",
+    "on_chip_flash_bandwidth",
+    "off_chip_flash_bandwidth",
+    "weights_storage_area",
+    "feature_map_storage_area",
+    "batch_size",
+]
+
+# Memory regions as the column prefix and the vela storage area name
+MEMORY_REGIONS = {
+    "sram": "SRAM",
+    "dram": "DRAM",
+    "on_chip_flash": "On-chip Flash",
+    "off_chip_flash": "Off-chip Flash",
+}
+
+
+def read_vela_summary_rows(summary_file):
+    """Reads every row of a vela summary CSV, empty if there is no file"""
+
+    try:
+        with open(summary_file, "r", newline="", encoding="utf-8") as csvfile:
+            return list(csv.DictReader(csvfile))
+    except FileNotFoundError:
+        print(f"Error: The file '{summary_file}' was not found.")
+        return []
+
+
+def aggregate_vela_summary(rows):
+    """
+    Combines the summary rows of the subgraphs of a network, which run one
+    after the other. Cycles, times, traffic, MACs and weights add up. Memory
+    used is the peak over the subgraphs, apart from the weights storage area
+    where each subgraph keeps its own weights and the usage adds up.
+
+    Args:
+        rows (list): The summary rows as read from the CSV.
+
+    Returns:
+        dict: The summary of the network, with the rows under subgraphs when
+            there is more than one, or only cycles_npu 0 without rows.
+    """
+
+    if not rows:
+        return {"cycles_npu": 0}
+    if len(rows) == 1:
+        return dict(rows[0])
+
+    weights_area = rows[0].get("weights_storage_area")
+    summary = {}
+    for key in rows[0]:
+        values = [row.get(key) for row in rows]
+        if key in SUMMARY_SETTINGS:
+            summary[key] = values[0]
+        elif key.endswith("_memory_used"):
+            region = MEMORY_REGIONS.get(key.removesuffix("_memory_used"))
+            memory = [float(v or 0) for v in values]
+            summary[key] = sum(memory) if region == weights_area else max(memory)
+        else:
+            try:
+                summary[key] = sum(float(v or 0) for v in values)
+            except ValueError:
+                summary[key] = values[0]
+
+    # Rates follow from the combined inference time
+    inference_time = summary.get("inference_time") or 0
+    if inference_time:
+        summary["inferences_per_second"] = 1 / inference_time
+        if "nn_macs" in summary:
+            summary["nn_tops"] = summary["nn_macs"] * 2 / inference_time / 1e12
+    summary["subgraphs"] = [dict(row) for row in rows]
+    return summary
+
+
+def get_subgraph_breakdown(subgraphs):
+    """Gets the cycles, time and memory used of each subgraph"""
+
+    breakdown = []
+    for row in subgraphs:
+        entry = {
+            key: float(row[key])
+            for key in ["cycles_npu", "cycles_total", "inference_time"]
+            if row.get(key)
+        }
+        for region in MEMORY_REGIONS:
+            if row.get(f"{region}_memory_used"):
+                entry[f"{region}_memory_used"] = float(row[f"{region}_memory_used"])
+        breakdown.append(entry)
+    return breakdown
+
+
+def get_vela_summary(summary_file):
+    """
+    Parses the vela summary CSV into one dictionary, combining the rows when
+    there are several.
+
+    Args:
+        summary_file (str): The path to the CSV file.
+
+    Returns:
+        dict: The summary, see aggregate_vela_summary.
+    """
+
+    data = aggregate_vela_summary(read_vela_summary_rows(summary_file))
+    for key, value in data.items():
+        if key != "subgraphs":
+            print(f"{key} = {value}")
+    for i, row in enumerate(data.get("subgraphs", [])):
+        print(f"subgraph {i}: cycles_total = {row.get('cycles_total')}")
+    return data
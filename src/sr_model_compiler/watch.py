@@ -0,0 +1,165 @@
+"""Recompiles a model whenever its inputs change"""
+
+import os
+import copy
+import time
+import tempfile
+
+# Performance data compared between consecutive compiles
+WATCH_DELTA_KEYS = ["cycles_npu", "vmem_size", "flash_size"]
+
+
+def add_watch_arguments(parser):
+    """Adds the watch options to a command line parser"""
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Recompile when the model, INI config or inputs change",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between checks of the watched files",
+    )
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=1.0,
+        help="Seconds the files must stay unchanged before recompiling",
+    )
+
+
+def get_file_states(files):
+    """Gets the modification time and size of each file, None if missing"""
+
+    states = {}
+    for file_path in files:
+        try:
+            stat = os.stat(file_path)
+            states[file_path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            states[file_path] = None
+    return states
+
+
+def wait_for_change(files, states, interval=0.5, debounce=1.0):
+    """
+    Polls the files until they change and then stay unchanged for the
+    debounce time, so a model export still being written is not compiled.
+    A file that disappears counts as a change, the compile reports it.
+
+    Returns:
+        tuple: (changed files, the new file states)
+    """
+
+    while True:
+        time.sleep(interval)
+        current = get_file_states(files)
+        if current != states:
+            break
+
+    settle_start = time.monotonic()
+    while time.monotonic() - settle_start < debounce:
+        time.sleep(interval)
+        latest = get_file_states(files)
+        if latest != current:
+            current = latest
+            settle_start = time.monotonic()
+
+    changed = [f for f in files if current[f] != states[f]]
+    return changed, current
+
+
+def get_perf_delta(previous, current, keys=None):
+    """Gets the change of the performance data between two compiles"""
+
+    delta = {}
+    for key in keys or WATCH_DELTA_KEYS:
+        before = float(previous.get(key) or 0)
+        after = float(current.get(key) or 0)
+        delta[key] = {
+            "before": before,
+            "after": after,
+            "change": after - before,
+            "percent": (after - before) / before * 100 if before else None,
+        }
+    return delta
+
+
+def print_perf_delta(delta):
+    """Prints one line per compared value"""
+
+    for key, d in delta.items():
+        if not d["change"]:
+            print(f"   {key} = {d['after']:.0f} (unchanged)")
+            continue
+        percent = f", {d['percent']:+.1f}%" if d["percent"] is not None else ""
+        print(
+            f"   {key} = {d['before']:.0f} -> {d['after']:.0f}"
+            f" ({d['change']:+.0f}{percent})"
+        )
+
+
+def watch_compiler(args, files, compile_func, max_runs=None):
+    """
+    Compiles and then recompiles whenever a watched file changes, in the
+    same process. The stage manifest of the output directory skips the
+    stages whose inputs did not change.
+
+    Args:
+        args: The compiler arguments.
+        files (list): The files to watch.
+        compile_func (callable): Compiles args, returns (success, perf_data).
+        max_runs (int): Stop after this many compiles, watch until
+            interrupted when None.
+
+    Returns:
+        int: 0 once interrupted.
+    """
+
+    # The manifest only skips stages when the output directory is kept
+    tmp_dir = None
+    if args.output_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        args.output_dir = tmp_dir.name
+
+    files = [os.path.abspath(f) for f in files if f]
+    states = get_file_states(files)
+    previous = None
+    runs = 0
+    try:
+        while True:
+            try:
+                # The compiler updates args, such as the model of the cleanup
+                success, perf_data = compile_func(copy.copy(args))
+            except Exception as e:  # pylint: disable=W0718
+                print(f"ERROR:: The compile failed, {e}")
+                success, perf_data = False, None
+            runs += 1
+
+            if not success:
+                print(f"ERROR:: Failed to map {args.model_file} onto sr")
+            elif previous:
+                print("++ Changes since the previous compile")
+                print_perf_delta(get_perf_delta(previous, perf_data))
+            else:
+                for key in WATCH_DELTA_KEYS:
+                    print(f"   {key} = {perf_data[key]}")
+            if success:
+                previous = perf_data
+
+            if max_runs is not None and runs >= max_runs:
+                break
+            print(f"++ Watching {len(files)} files, Ctrl+C to stop")
+            changed, states = wait_for_change(
+                files, states, args.watch_interval, args.watch_debounce
+            )
+            print(f"++ Changed {', '.join(os.path.basename(f) for f in changed)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tmp_dir:
+            tmp_dir.cleanup()
+    return 0
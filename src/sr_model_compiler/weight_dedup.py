@@ -0,0 +1,296 @@
+"""Shares identical weight blocks across variants of the same network"""
+
+import os
+import sys
+import struct
+import argparse
+from pathlib import Path
+from .model_info import parse_model_info
+from .utils import write_file_if_changed
+
+# Package header: magic, version, number of variants, shared region size
+WEIGHT_PACKAGE_MAGIC = b"SRWD"
+WEIGHT_PACKAGE_VERSION = 1
+WEIGHT_PACKAGE_HEADER = struct.Struct("<4sIII")
+# Per variant: model size, first segment, number of segments
+WEIGHT_PACKAGE_VARIANT = struct.Struct("<III")
+# Per segment: kind, source offset, length
+WEIGHT_PACKAGE_SEGMENT = struct.Struct("<III")
+
+SEGMENT_SHARED = 0
+SEGMENT_PRIVATE = 1
+
+# Vela aligns the encoded weight streams to 16 bytes
+BLOCK_ALIGNMENT = 16
+
+
+def get_weight_stream(data):
+    """Gets the file offset and size of the vela flash tensor of a model"""
+
+    model_info = parse_model_info(data)
+    for tensor in model_info["subgraphs"][0]["tensors"]:
+        if tensor["name"].endswith("_flash") and tensor["is_constant"]:
+            buffer = model_info["buffers"][tensor["buffer"]]
+            return buffer["offset"], buffer["size"]
+    return 0, 0
+
+
+def find_shared_segments(reference, data, block_size=64, min_run=256):
+    """
+    Splits data into runs shared with the reference and private runs.
+
+    Every aligned block of the reference is indexed, matches on aligned
+    blocks of data are extended byte by byte in both directions, and runs
+    shorter than min_run are kept private.
+
+    Returns:
+        list: (kind, offset, length) tuples covering data in order, the offset
+            is in the reference for shared runs and in data for private runs.
+    """
+
+    blocks = {}
+    for offset in range(0, len(reference) - block_size + 1, BLOCK_ALIGNMENT):
+        blocks.setdefault(reference[offset : offset + block_size], offset)
+
+    segments = []
+    private_start = 0
+    offset = 0
+    while offset + block_size <= len(data):
+        ref_offset = blocks.get(data[offset : offset + block_size])
+        if ref_offset is None:
+            offset += BLOCK_ALIGNMENT
+            continue
+
+        # Grow the match in both directions
+        start, ref_start = offset, ref_offset
+        while (
+            start > private_start
+            and ref_start > 0
+            and data[start - 1] == reference[ref_start - 1]
+        ):
+            start -= 1
+            ref_start -= 1
+        end = offset + block_size
+        while end < len(data) and ref_start + end - start < len(reference):
+            if data[end] != reference[ref_start + end - start]:
+                break
+            end += 1
+
+        if end - start < min_run:
+            offset += BLOCK_ALIGNMENT
+            continue
+
+        if start > private_start:
+            segments.append((SEGMENT_PRIVATE, private_start, start - private_start))
+        segments.append((SEGMENT_SHARED, ref_start, end - start))
+        private_start = end
+        offset = (end + BLOCK_ALIGNMENT - 1) // BLOCK_ALIGNMENT * BLOCK_ALIGNMENT
+
+    if private_start < len(data):
+        segments.append((SEGMENT_PRIVATE, private_start, len(data) - private_start))
+    return segments
+
+
+def get_weight_shared_bytes(segments, weight_stream):
+    """Gets how many bytes of the weight stream are covered by shared runs"""
+
+    start, end = weight_stream[0], weight_stream[0] + weight_stream[1]
+    shared = 0
+    offset = 0
+    for kind, _, length in segments:
+        if kind == SEGMENT_SHARED:
+            shared += max(0, min(end, offset + length) - max(start, offset))
+        offset += length
+    return shared
+
+
+def build_weight_package(reference, variants):
+    """
+    Builds the package: header, variant table, segment table, the shared
+    region (the reference model) and the private bytes of every variant.
+    """
+
+    segment_table = []
+    variant_table = []
+    private_data = bytearray()
+    for data, segments in variants:
+        variant_table.append((len(data), len(segment_table), len(segments)))
+        for kind, offset, length in segments:
+            if kind == SEGMENT_PRIVATE:
+                segment_table.append((kind, len(private_data), length))
+                private_data += data[offset : offset + length]
+            else:
+                segment_table.append((kind, offset, length))
+
+    package = bytearray(
+        WEIGHT_PACKAGE_HEADER.pack(
+            WEIGHT_PACKAGE_MAGIC, WEIGHT_PACKAGE_VERSION, len(variants), len(reference)
+        )
+    )
+    for entry in variant_table:
+        package += WEIGHT_PACKAGE_VARIANT.pack(*entry)
+    for entry in segment_table:
+        package += WEIGHT_PACKAGE_SEGMENT.pack(*entry)
+    package += reference
+    package += private_data
+    return bytes(package)
+
+
+def expand_weight_package(package):  # pylint: disable=R0914
+    """Rebuilds every variant model from a package"""
+
+    magic, version, count, shared_size = WEIGHT_PACKAGE_HEADER.unpack_from(package)
+    if magic != WEIGHT_PACKAGE_MAGIC or version != WEIGHT_PACKAGE_VERSION:
+        raise ValueError("Not a weight package")
+
+    offset = WEIGHT_PACKAGE_HEADER.size
+    variants = []
+    for i in range(count):
+        variants.append(
+            WEIGHT_PACKAGE_VARIANT.unpack_from(
+                package, offset + i * WEIGHT_PACKAGE_VARIANT.size
+            )
+        )
+    segments_offset = offset + count * WEIGHT_PACKAGE_VARIANT.size
+    num_segments = sum(v[2] for v in variants)
+    shared_offset = segments_offset + num_segments * WEIGHT_PACKAGE_SEGMENT.size
+    private_offset = shared_offset + shared_size
+
+    models = []
+    for _, first, num in variants:
+        data = bytearray()
+        for i in range(first, first + num):
+            kind, source, length = WEIGHT_PACKAGE_SEGMENT.unpack_from(
+                package, segments_offset + i * WEIGHT_PACKAGE_SEGMENT.size
+            )
+            base = shared_offset if kind == SEGMENT_SHARED else private_offset
+            data += package[base + source : base + source + length]
+        models.append(bytes(data))
+    return models
+
+
+def sr_dedup_weights(  # pylint: disable=R0914
+    model_files, output_file=None, block_size=64, min_run=256
+):
+    """
+    Compares the vela encoded weights of variants of the same network and
+    packages them with the identical runs stored once. The first model is
+    the reference that the other variants share blocks with. The package
+    saves storage, each variant is rebuilt in full before it runs.
+
+    Args:
+        model_files (list): The compiled .bin or _vela.tflite files.
+        output_file (str): Where to write the package, report only when None.
+        block_size (int): The block size used to find matches.
+        min_run (int): The shortest run worth sharing.
+
+    Returns:
+        dict: The per variant sharing, the storage saving and the load size.
+    """
+
+    datas = []
+    for model_file in model_files:
+        with open(model_file, "rb") as fp:
+            datas.append(fp.read())
+    reference = datas[0]
+
+    variants = []
+    report = []
+    for model_file, data in zip(model_files, datas):
+        if data is reference:
+            segments = [(SEGMENT_SHARED, 0, len(data))]
+        else:
+            segments = find_shared_segments(reference, data, block_size, min_run)
+        variants.append((data, segments))
+
+        weight_stream = get_weight_stream(data)
+        shared = sum(s[2] for s in segments if s[0] == SEGMENT_SHARED)
+        report.append(
+            {
+                "model": Path(model_file).stem,
+                "size": len(data),
+                "weights_size": weight_stream[1],
+                "shared_bytes": 0 if data is reference else shared,
+                "weights_shared_bytes": (
+                    0
+                    if data is reference
+                    else get_weight_shared_bytes(segments, weight_stream)
+                ),
+                "segments": len(segments),
+            }
+        )
+
+    package = build_weight_package(reference, variants)
+    if output_file:
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        write_file_if_changed(output_file, package)
+
+    # Variants are rebuilt into RAM to run, models run from flash save nothing
+    total_size = sum(len(d) for d in datas)
+    return {
+        "variants": report,
+        "total_size": total_size,
+        "package_size": len(package),
+        "storage_saved_bytes": total_size - len(package),
+        "load_size": max(len(d) for d in datas),
+    }
+
+
+def print_dedup_report(report):
+    """Prints the per variant sharing and the total savings"""
+
+    print(f"{'model':<36} {'size':>10} {'weights':>10} {'shared':>10} {'segs':>6}")
+    for v in report["variants"]:
+        print(
+            f"{v['model']:<36} {v['size']:>10} {v['weights_size']:>10}"
+            f" {v['weights_shared_bytes']:>10} {v['segments']:>6}"
+        )
+    saved = report["storage_saved_bytes"] / max(report["total_size"], 1) * 100
+    print(
+        f"++ {report['total_size']} bytes packed into {report['package_size']},"
+        f" {report['storage_saved_bytes']} bytes less to store ({saved:.1f}%)"
+    )
+    print(
+        f"   A variant is rebuilt into up to {report['load_size']} bytes of RAM"
+        " to run, executing from flash in place saves nothing"
+    )
+
+
+def get_weight_dedup_argparser():
+    """Parse command line arguments"""
+
+    parser = argparse.ArgumentParser(
+        description="Share identical weight blocks across compiled model variants."
+    )
+    parser.add_argument(
+        "model_files",
+        type=str,
+        nargs="+",
+        help="Compiled .bin files, the first one is the reference",
+    )
+    parser.add_argument(
+        "-o", "--output-file", type=str, help="Write the shared weight package"
+    )
+    parser.add_argument(
+        "--block-size", type=int, default=64, help="Block size used to find matches"
+    )
+    parser.add_argument(
+        "--min-run", type=int, default=256, help="Shortest run worth sharing"
+    )
+    return parser
+
+
+def main():
+    """Main for the command line weight dedup"""
+    parser = get_weight_dedup_argparser()
+    args = parser.parse_args()
+
+    report = sr_dedup_weights(
+        args.model_files, args.output_file, args.block_size, args.min_run
+    )
+    print_dedup_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Testing the offline tensor arena planner"""
+
+from sr_model_compiler import sr_model_compiler, sr_plan_arena
+
+
+def test_plan_float_model():
+    """Intermediate tensors with disjoint live ranges share arena space"""
+
+    arena = sr_plan_arena("tests/models/hello_world/hello_world_float.tflite")
+
+    assert arena["arena_size"] == 128
+    assert arena["peak_live_bytes"] == 128
+    assert len(arena["timeline"]) == 3
+    assert [t["high_water"] for t in arena["timeline"]] == [80, 128, 128]
+
+
+def test_plan_vela_model(tmp_path):
+    """The vela scratch areas and the tensors inside them are not counted twice"""
+
+    results = sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path),
+    )
+
+    arena = sr_plan_arena(str(tmp_path / "hello_world_vela.tflite"))
+    scratch = [t for t in arena["tensors"] if t["name"].endswith("_scratch")]
+
+    assert len(scratch) == 1
+    assert arena["arena_size"] == scratch[0]["size"]
+    assert results["tensor_arena_size"] == arena["arena_size"]
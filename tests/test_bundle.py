@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Testing the firmware bundle of all use cases"""
+
+import shutil
+from sr_model_compiler.bundle import (
+    find_use_cases,
+    load_enabled_symbols,
+    sr_model_bundle,
+)
+from sr_model_compiler.metrics import load_metrics_state
+from sr_model_compiler.results_db import get_runs, open_results_db
+
+
+def test_find_use_cases(tmp_path):
+    """Use cases are the model directories with a kconfig"""
+
+    use_cases = find_use_cases("tests/models")
+    assert [u["name"] for u in use_cases] == [
+        "uc_person_classification",
+        "uc_person_detection",
+        "uc_person_pose_detection",
+        "uc_person_segmentation",
+    ]
+
+    config = tmp_path / ".config"
+    config.write_text(
+        "CONFIG_UC_PERSON_DETECTION_ENABLED=y\n"
+        "# CONFIG_UC_PERSON_CLASSIFICATION_ENABLED is not set\n",
+        encoding="utf-8",
+    )
+    use_cases = find_use_cases("tests/models", load_enabled_symbols(str(config)))
+    assert [u["name"] for u in use_cases] == ["uc_person_detection"]
+    assert len(use_cases[0]["models"]) == 2
+
+
+def test_bundle(tmp_path):
+    """The enabled use case models share one resolver"""
+
+    config = tmp_path / ".config"
+    config.write_text("CONFIG_UC_PERSON_CLASSIFICATION_ENABLED=y\n", encoding="utf-8")
+
+    manifest = sr_model_bundle(
+        models_dir="tests/models",
+        config=str(config),
+        output_dir=str(tmp_path / "bundle"),
+        system_config="sr100_npu_400MHz_tensor_vmem_weights_lpmem",
+        jobs=2,
+    )
+
+    assert manifest["use_cases"] == ["uc_person_classification"]
+    assert manifest["resolver"]["operators"] == ["ethos-u"]
+    resolver = (tmp_path / "bundle" / "bundle_resolver.cc").read_text(encoding="utf-8")
+    assert "micro_op_resolver.AddEthosU();" in resolver
+
+    assert len(manifest["models"]) == 2
+    for model in manifest["models"]:
+        assert model["success"], f"{model['namespace']} did not fit"
+        assert model["placement"]["model_loc"] == "lpmem"
+        with open(model["files"][0], "r", encoding="utf-8") as fp:
+            assert "get_resolver" not in fp.read(), "Resolver not shared"
+    assert manifest["totals"]["lpmem_size"] == sum(
+        m["placement"]["lpmem_size"] for m in manifest["models"]
+    )
+
+
+def test_bundle_placements_recorded_once(tmp_path):
+    """Each model is recorded once however many placements were tried"""
+
+    use_case_dir = tmp_path / "models" / "uc_hello_world"
+    use_case_dir.mkdir(parents=True)
+    (use_case_dir / "kconfig").write_text(
+        "config UC_HELLO_WORLD_ENABLED\n", encoding="utf-8"
+    )
+    shutil.copy("tests/models/hello_world/hello_world.tflite", use_case_dir)
+    metrics_file = str(tmp_path / "compile.prom")
+    db_path = str(tmp_path / "results.db")
+
+    # Nothing fits in a 1 byte vmem, every placement is tried
+    manifest = sr_model_bundle(
+        models_dir=str(tmp_path / "models"),
+        output_dir=str(tmp_path / "bundle"),
+        vmem_size_limit=1,
+        jobs=1,
+        metrics_file=metrics_file,
+        results_db=db_path,
+    )
+
+    assert not manifest["models"][0]["success"]
+    assert manifest["resolver"]["file"] is None
+    state = load_metrics_state(metrics_file)
+    assert state["compiles"] == {"hello_world": 1}
+    assert state["failures"] == {"hello_world": 1}
+    assert len(get_runs(open_results_db(db_path))) == 1
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Testing the calibration against measured latencies"""
+
+import csv
+import pytest
+from sr_model_compiler import sr_model_compiler, sr_check_model
+from sr_model_compiler.sr_model_compiler import (
+    check_compile,
+    get_args_from_call,
+    get_compiler_argparser,
+)
+from sr_model_compiler.calibration import (
+    apply_calibration,
+    find_estimates,
+    fit_calibration,
+    get_calibration_report,
+    load_measurements,
+    write_calibration,
+)
+
+
+def write_measurements(measured_file, rows):
+    """Writes a measured latency CSV"""
+
+    with open(measured_file, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.DictWriter(
+            fp, fieldnames=["model", "system_config", "layer", "measured_us"]
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_calibration(tmp_path):
+    """Factors fitted per config and operator class correct the estimate"""
+
+    system_config = "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"
+    results = sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path / "out"),
+        system_config=system_config,
+        per_layer=True,
+    )
+    estimates = find_estimates([str(tmp_path)])
+    estimate = estimates[("hello_world", system_config)]
+    assert estimate["estimated_us"] == pytest.approx(
+        float(results["inference_time"]) * 1e6
+    )
+
+    # The device runs 1.5 times slower than vela estimates
+    measured_file = tmp_path / "measured.csv"
+    write_measurements(
+        measured_file,
+        [
+            {
+                "model": "hello_world",
+                "system_config": system_config,
+                "measured_us": estimate["estimated_us"] * 1.5,
+            }
+        ],
+    )
+    measurements = load_measurements(measured_file)
+    calibration = fit_calibration(measurements, estimates)
+    assert calibration["system_configs"][system_config]["factor"] == pytest.approx(1.5)
+
+    _, perf_data = sr_check_model(results)
+    apply_calibration(perf_data, calibration)
+    assert perf_data["calibrated_inference_time"] == pytest.approx(
+        perf_data["inference_time"] * 1.5
+    )
+    report = get_calibration_report(measurements, estimates, calibration)[0]
+    assert report["raw_error"] == pytest.approx(100 / 1.5 - 100)
+    assert report["calibrated_error"] == pytest.approx(0)
+
+    # Per layer measurements fit the operator classes
+    layers = [
+        {
+            "model": "hello_world",
+            "system_config": system_config,
+            "layer": layer["name"],
+            "measured_us": layer["cycles"] / estimate["core_clock"] * 1e6 * 2,
+        }
+        for layer in estimate["per_layer"]
+    ]
+    write_measurements(measured_file, layers)
+    calibration = fit_calibration(load_measurements(measured_file), estimates)
+    fully_connected = calibration["op_classes"][system_config]["fully_connected"]
+    assert fully_connected["factor"] == pytest.approx(2)
+    assert fully_connected["samples"] == 3
+
+    apply_calibration(perf_data, calibration, results["per_layer"])
+    assert perf_data["calibration_factor"] == pytest.approx(2)
+
+    # The compiler and its watch mode apply a stored calibration
+    write_calibration(str(tmp_path / "calibration.json"), calibration)
+    checked = check_compile(
+        get_args_from_call(
+            get_compiler_argparser(), calibration=str(tmp_path / "calibration.json")
+        ),
+        results,
+    )
+    assert checked[0] and checked[2], "The compile failed the check or the gate"
+    assert checked[1]["calibration_factor"] == pytest.approx(2)
+
+    # Configs without measurements are left uncalibrated
+    perf_data["system_config"] = "sr100_npu_400MHz_all_vmem"
+    apply_calibration(perf_data, calibration, results["per_layer"])
+    assert perf_data["calibrated_inference_time"] is None
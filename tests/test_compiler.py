@@ -2,6 +2,7 @@
 """Testing different builds of models"""
 
 import os
+import stat
 import filecmp
 import argparse
 from pathlib import Path
@@ -157,6 +158,110 @@ def test_float_model(tmp_path):
     assert cycles_npu == 0.0, f"Failed to get 0 cycles in the NPU, found {cycles_npu}"
 
 
+def test_inference_cache(tmp_path, capsys):
+    """Tests that expected outputs are reused from the inference cache"""
+
+    model = "tests/models/hello_world/hello_world.tflite"
+    cache_dir = tmp_path / "cache"
+
+    # First run populates the cache, second run must reuse the random inputs
+    for run in ["first", "second"]:
+        sr_model_compiler(
+            model_file=model,
+            output_dir=f"{tmp_path / run}",
+            script=["model", "inout"],
+            cache_dir=f"{cache_dir}",
+        )
+    entries = list(cache_dir.glob("inference/*/*.npz"))
+    assert entries, "No inference cache entry"
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(entries[0].stat().st_mode) == 0o666 & ~umask
+    assert "inference cache hit" in capsys.readouterr().out, "Cache was not used"
+
+    # The expected outputs and the data arrays must match
+    assert filecmp.cmp(
+        tmp_path / "first" / "output_0.bin",
+        tmp_path / "second" / "output_0.bin",
+        shallow=False,
+    ), "Cached expected output mismatch"
+    io_files = [tmp_path / run / "model_io.cc" for run in ["first", "second"]]
+    io_data = [p.read_text(encoding="utf-8").split("*/")[-1] for p in io_files]
+    assert io_data[0] == io_data[1], "Cached io.cc data mismatch"
+
+
+def test_incremental_rebuild(tmp_path, capsys):
+    """Tests that an unchanged re-run skips every stage and touches no file"""
+
+    def compile_model():
+        return sr_model_compiler(
+            model_file="tests/models/hello_world/hello_world.tflite",
+            output_dir=f"{tmp_path}",
+            script=["model", "inout"],
+            cache_dir=f"{tmp_path / 'cache'}",
+        )
+
+    first_results = compile_model()
+    mtimes = {p: p.stat().st_mtime_ns for p in tmp_path.glob("*") if p.is_file()}
+    capsys.readouterr()
+
+    second_results = compile_model()
+    output = capsys.readouterr().out
+    for stage in ["vela", "resolver", "model", "inout"]:
+        assert f"Stage {stage} is up to date" in output, f"{stage} was rerun"
+    for path, mtime in mtimes.items():
+        assert path.stat().st_mtime_ns == mtime, f"{path} was rewritten"
+    assert first_results["cycles_npu"] == second_results["cycles_npu"]
+
+
+def test_depfiles(tmp_path):
+    """Tests that the depfiles list the model, config and templates"""
+
+    model = "tests/models/hello_world/hello_world.tflite"
+    sr_model_compiler(
+        model_file=model,
+        output_dir=f"{tmp_path}",
+        script=["model", "inout"],
+        cache_dir=f"{tmp_path / 'cache'}",
+        emit_depfiles=True,
+    )
+
+    depfile = (tmp_path / "model.cc.d").read_text(encoding="utf-8")
+    target, dependencies = depfile.split(":", 1)
+    assert target == f"{tmp_path / 'model.cc'}", f"Bad depfile target {target}"
+    for dependency in [
+        os.path.abspath(model),
+        "sr100_system_config.ini",
+        "tflite.cc.template",
+        "micro_mutable_op_resolver.hpp.mako",
+    ]:
+        assert dependency in dependencies, f"{dependency} missing from depfile"
+    assert "_vela.tflite" not in dependencies, "Generated file listed in depfile"
+    assert (tmp_path / "model_io.cc.d").exists(), "Missing io.cc depfile"
+
+
+def test_model_metadata_header(tmp_path):
+    """Test the constexpr model metadata header"""
+
+    results = sr_model_compiler(
+        model_file="tests/models/uc_person_detection/person_detection_256x480.tflite",
+        output_dir=f"{tmp_path}",
+        script=["model"],
+    )
+
+    header = (tmp_path / "model_metadata.hpp").read_text(encoding="utf-8")
+    for line in [
+        f"constexpr size_t kTensorArenaSize = {results['tensor_arena_size']};",
+        "constexpr size_t kNumInputs = 1;",
+        "constexpr size_t kNumOutputs = 3;",
+        "constexpr int32_t kInput0Dims[] = { 1, 256, 480, 3 };",
+        "constexpr size_t kInput0Bytes = 368640;",
+        "constexpr TfLiteType kInput0Type = kTfLiteInt8;",
+        "constexpr int32_t kInput0ZeroPoint = -128;",
+    ]:
+        assert line in header, f"{line} missing from the metadata header"
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
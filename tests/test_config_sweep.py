@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Testing the system config sensitivity sweep"""
+
+import os
+from pathlib import Path
+from sr_model_compiler.config_sweep import sr_config_sweep
+
+
+def test_config_sweep(tmp_path):
+    """Flash clock variants are compiled in parallel from the base config"""
+
+    sweep = sr_config_sweep(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        system_config="sr100_npu_400MHz_tensor_vmem_weights_flash66MHz",
+        vary=["OffChipFlash_clock_scale=0.1,0.5", "OffChipFlash_max_reads=4"],
+        output_dir=str(tmp_path),
+        jobs=2,
+    )
+    assert os.path.exists(tmp_path / "sweep.csv")
+    assert os.path.exists(tmp_path / "sweep_system_config.ini")
+
+    assert len(sweep["rows"]) == 4
+    base, slow, fast, max_reads = sweep["rows"]  # pylint: disable=W0632
+    assert base["parameter"] == "" and base["change"] == 0
+    assert all(row["source"] == "vela" for row in sweep["rows"])
+    assert slow["cycles"] > base["cycles"] > fast["cycles"]
+    assert max_reads["cycles"] == base["cycles"]
+    assert sweep["sensitivity"]["OffChipFlash_clock_scale"] < 0
+
+    # Only the variant estimated fastest gets a full compile, latencies too
+    pruned = sr_config_sweep(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        system_config="sr100_npu_400MHz_tensor_vmem_weights_flash66MHz",
+        vary=["OffChipFlash_clock_scale=0.1,0.5", "OffChipFlash_read_latency=512"],
+        output_dir=str(tmp_path / "pruned"),
+        prune_margin=0.0,
+        jobs=2,
+    )
+    assert [row["source"] for row in pruned["rows"]] == [
+        "vela",
+        "estimate",
+        "vela",
+        "estimate",
+    ]
+    assert pruned["rows"][2]["cycles"] == fast["cycles"]
+
+
+def test_config_sweep_failures(tmp_path):
+    """Failed compiles have no change and variants not estimated are compiled"""
+
+    sweep = sr_config_sweep(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        system_config="sr100_npu_400MHz_tensor_vmem_weights_flash66MHz",
+        vary=["OffChipFlash_clock_scale=0.1,0.5", "OffChipFlash_burst_length=bad"],
+        output_dir=str(tmp_path / "variant"),
+        prune_margin=0.0,
+        jobs=2,
+    )
+    base, slow, fast, bad = sweep["rows"]  # pylint: disable=W0632
+    assert [r["source"] for r in [base, slow, fast]] == ["vela", "estimate", "vela"]
+    assert bad["source"] == "failed" and bad["change"] is None
+    assert sweep["sensitivity"]["OffChipFlash_burst_length"] is None
+
+    # A base config vela rejects fails every variant instead of dividing by 0
+    ini_file = tmp_path / "bad.ini"
+    ini_file.write_text(
+        Path("src/sr_model_compiler/config/sr100_system_config.ini").read_text(
+            encoding="utf-8"
+        )
+        + "\n[System_Config.bad]\n"
+        + "inherit=System_Config.sr100_npu_400MHz_all_vmem\n"
+        + "Sram_burst_length=bad\n",
+        encoding="utf-8",
+    )
+    sweep = sr_config_sweep(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        system_config="bad",
+        system_config_ini_file=str(ini_file),
+        vary=["OffChipFlash_clock_scale=0.5"],
+        output_dir=str(tmp_path / "base"),
+        jobs=1,
+    )
+    assert [r["source"] for r in sweep["rows"]] == ["failed", "failed"]
+    assert all(r["change"] is None for r in sweep["rows"])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Testing the compile daemon"""
+
+import os
+import socket
+import threading
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from sr_model_compiler.daemon import forward_to_daemon, send_request, serve_daemon
+
+
+def test_daemon(tmp_path, capsys, monkeypatch):
+    """Compiles forwarded to the daemon stream their log and return code"""
+
+    socket_path = str(tmp_path / "daemon.sock")
+    assert forward_to_daemon("compile", [], socket_path) is None
+
+    server = serve_daemon(socket_path, jobs=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        capsys.readouterr()
+        model_file = "tests/models/hello_world/hello_world.tflite"
+        argv = ["-m", model_file, "-o", str(tmp_path / "out")]
+        # The worker runs with the environment of the client
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+        argv_inout = [*argv, "--script", "model", "inout"]
+        assert forward_to_daemon("compile", argv_inout, socket_path) == 0
+        assert "Successfully mapped" in capsys.readouterr().out
+        assert (tmp_path / "out" / "model.cc").exists()
+        assert list((tmp_path / "cache").glob("sr_model_compiler/inference/*/*"))
+
+        assert forward_to_daemon("compile", ["--bogus"], socket_path) == 2
+        assert "unrecognized arguments" in capsys.readouterr().out
+        assert forward_to_daemon("check", [model_file], socket_path) == 0
+
+        # Watching never ends, other Pythons have their own compiler
+        assert forward_to_daemon("compile", [*argv, "--watch"], socket_path) is None
+        request = {"command": "compile", "argv": ["x", *argv], "python": "other"}
+        assert send_request(socket_path, request) is None
+
+        # A dead worker is replaced for the next request
+        with pytest.raises(BrokenProcessPool):
+            server.submit(os._exit, 1).result()
+        assert forward_to_daemon("compile", argv, socket_path) == 0
+    finally:
+        assert send_request(socket_path, {"command": "shutdown"}) == 0
+        thread.join()
+        server.server_close()
+    assert not (tmp_path / "daemon.sock").exists()
+
+
+def test_daemon_untrusted_socket(tmp_path, capsys, monkeypatch):
+    """Nothing is sent to another user, a hung socket counts as no daemon"""
+
+    socket_path = str(tmp_path / "daemon.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung:
+        hung.bind(socket_path)
+        hung.listen()
+
+        assert send_request(socket_path, {"command": "ping"}, timeout=0.5) is None
+        assert "did not answer" in capsys.readouterr().out
+
+        monkeypatch.setattr(os, "getuid", lambda: os.geteuid() + 1)
+        assert forward_to_daemon("compile", [], socket_path) is None
+        assert "belongs to another user" in capsys.readouterr().out
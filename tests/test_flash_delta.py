@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Testing the sector deltas for incremental flashing"""
+
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.flash_delta import apply_flash_delta, build_flash_delta
+
+
+def test_flash_delta():
+    """A delta between two binaries rebuilds the new one"""
+
+    with open(
+        "tests/models/uc_person_classification/person_classification_256x448.bin", "rb"
+    ) as fp:
+        old_data = fp.read()
+    with open(
+        "tests/models/uc_person_classification/person_classification_448x640.bin", "rb"
+    ) as fp:
+        new_data = fp.read()
+
+    delta, dirty = build_flash_delta(old_data, new_data, 4096)
+    assert apply_flash_delta(old_data, delta) == new_data
+    assert len(dirty) <= (len(new_data) + 4095) // 4096
+
+    delta, dirty = build_flash_delta(new_data, new_data, 4096)
+    assert not dirty
+    assert apply_flash_delta(new_data, delta) == new_data
+
+
+def test_compiler_delta(tmp_path):
+    """The compiler writes only the sectors changed since the previous binary"""
+
+    sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=f"{tmp_path}",
+    )
+    new_data = (tmp_path / "hello_world.bin").read_bytes()
+
+    # One byte changed in the second sector
+    previous = bytearray(new_data)
+    previous[2000] ^= 0xFF
+    previous_bin = tmp_path / "previous.bin"
+    previous_bin.write_bytes(previous)
+
+    sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=f"{tmp_path}",
+        delta_from=str(previous_bin),
+        flash_erase_size=1024,
+    )
+
+    delta = (tmp_path / "hello_world.delta").read_bytes()
+    _, dirty = build_flash_delta(bytes(previous), new_data, 1024)
+    assert dirty == [1]
+    assert apply_flash_delta(bytes(previous), delta) == new_data
+
+
+def test_compiler_delta_first_build(tmp_path):
+    """A first build without the previous binary reflashes every sector"""
+
+    sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=f"{tmp_path}",
+        delta_from=str(tmp_path / "hello_world.bin"),
+        flash_erase_size=1024,
+    )
+
+    new_data = (tmp_path / "hello_world.bin").read_bytes()
+    delta = (tmp_path / "hello_world.delta").read_bytes()
+    assert apply_flash_delta(b"", delta) == new_data
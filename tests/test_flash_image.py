@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Testing the packed multi-model flash image"""
+
+import shutil
+from sr_model_compiler.flash_image import read_flash_image_table, sr_pack_flash_image
+
+bin_files = [
+    "tests/models/hello_world/hello_world.bin",
+    "tests/models/uc_person_classification/person_classification_256x448.bin",
+    "tests/models/uc_person_classification/person_classification_448x640.bin",
+]
+
+
+def test_flash_image(tmp_path):
+    """Models are aligned, identical models are stored once"""
+
+    duplicate = tmp_path / "hello_world_copy.bin"
+    shutil.copy(bin_files[0], duplicate)
+    image = sr_pack_flash_image(
+        bin_files + [str(duplicate)],
+        str(tmp_path / "image.bin"),
+        alignment=4096,
+        base_address=0x10000000,
+    )
+
+    data = (tmp_path / "image.bin").read_bytes()
+    table = read_flash_image_table(data)
+    assert len(table) == 4
+    assert len(data) == image["image_size"]
+
+    for (offset, length, _), bin_file in zip(table, bin_files):
+        assert offset % 4096 == 0, f"{bin_file} is not aligned"
+        with open(bin_file, "rb") as fp:
+            assert data[offset : offset + length] == fp.read()
+    assert table[3] == table[0], "Identical models not shared"
+    assert image["models"][3]["duplicate"]
+
+    header = (tmp_path / "image.hpp").read_text(encoding="utf-8")
+    assert "constexpr uint32_t kFlashImageBase = 0x10000000;" in header
+    assert "kPersonClassification448x640 = 2," in header
+    assert f"{{ 0x{table[1][0]:08X}, {table[1][1]}," in header
+
+    # Packing the same models again leaves the header untouched
+    mtime = (tmp_path / "image.hpp").stat().st_mtime_ns
+    sr_pack_flash_image(
+        bin_files + [str(duplicate)],
+        str(tmp_path / "image.bin"),
+        alignment=4096,
+        base_address=0x10000000,
+    )
+    assert (tmp_path / "image.hpp").stat().st_mtime_ns == mtime
+    assert "Date:" not in header
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Testing the pre vela graph cleanup"""
+
+import copy
+import numpy as np
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.graph_cleanup import (
+    compare_output,
+    compare_vela_compiles,
+    get_output_error,
+    load_flatbuffer_utils,
+    sr_cleanup_graph,
+)
+
+MODEL_FILE = "tests/models/hello_world/hello_world.tflite"
+
+
+def write_redundant_model(model_file, fake_quant=False):  # pylint: disable=R0914
+    """
+    Adds a reshape chain and a dequantize/quantize pair between the first two
+    layers of hello world, all of which the cleanup removes. With fake_quant
+    the float values also go through a coarser quantize/dequantize pair.
+    """
+
+    flatbuffer_utils = load_flatbuffer_utils()
+    schema = flatbuffer_utils.schema_fb
+    model = flatbuffer_utils.read_model(MODEL_FILE)
+    subgraph = model.subgraphs[0]
+    first_output = int(subgraph.operators[0].outputs[0])
+    source = subgraph.tensors[first_output]
+
+    def add_opcode(builtin_code):
+        op_code = schema.OperatorCodeT()
+        op_code.builtinCode = op_code.deprecatedBuiltinCode = builtin_code
+        op_code.version = 1
+        model.operatorCodes.append(op_code)
+        return len(model.operatorCodes) - 1
+
+    def add_tensor(name, shape, tensor_type=None, data=None):
+        tensor = copy.deepcopy(source)
+        tensor.name = name.encode("utf-8")
+        tensor.shape = np.array(shape, dtype=np.int32)
+        tensor.buffer = 0
+        if tensor_type is not None:
+            tensor.type, tensor.quantization = tensor_type, None
+        if data is not None:
+            buffer = schema.BufferT()
+            buffer.data = np.frombuffer(data.tobytes(), dtype=np.uint8)
+            model.buffers.append(buffer)
+            tensor.buffer = len(model.buffers) - 1
+        subgraph.tensors.append(tensor)
+        return len(subgraph.tensors) - 1
+
+    def add_op(opcode_index, inputs, output):
+        op = schema.OperatorT()
+        op.opcodeIndex, op.inputs, op.outputs = opcode_index, inputs, [output]
+        return op
+
+    reshape = add_opcode(schema.BuiltinOperator.RESHAPE)
+    flat_shape = add_tensor("flat_shape", [1], schema.TensorType.INT32, np.int32([16]))
+    row_shape = add_tensor("row_shape", [2], schema.TensorType.INT32, np.int32([1, 16]))
+    flat = add_tensor("flat", [16])
+    row = add_tensor("row", [1, 16])
+    dequantized = add_tensor("dequantized", [1, 16], schema.TensorType.FLOAT32)
+    requantized = add_tensor("requantized", [1, 16])
+
+    quantize = add_opcode(schema.BuiltinOperator.QUANTIZE)
+    dequantize = add_opcode(schema.BuiltinOperator.DEQUANTIZE)
+    ops = [
+        add_op(reshape, [first_output, flat_shape], flat),
+        add_op(reshape, [flat, row_shape], row),
+        add_op(dequantize, [row], dequantized),
+    ]
+    if fake_quant:
+        coarse = add_tensor("coarse", [1, 16])
+        subgraph.tensors[coarse].quantization.scale = source.quantization.scale * 4
+        fake_quantized = add_tensor(
+            "fake_quantized", [1, 16], schema.TensorType.FLOAT32
+        )
+        ops.append(add_op(quantize, [dequantized], coarse))
+        ops.append(add_op(dequantize, [coarse], fake_quantized))
+        dequantized = fake_quantized
+    ops.append(add_op(quantize, [dequantized], requantized))
+    subgraph.operators[1].inputs[0] = requantized
+    subgraph.operators[1:1] = ops
+    flatbuffer_utils.write_model(model, model_file)
+
+
+def test_graph_cleanup(tmp_path):
+    """The redundant operators go and the outputs stay the same"""
+
+    redundant_file = str(tmp_path / "hello_world.tflite")
+    cleaned_file = str(tmp_path / "cleaned" / "hello_world.tflite")
+    write_redundant_model(redundant_file)
+
+    report = sr_cleanup_graph(redundant_file, cleaned_file)
+    assert report["operators_before"] == 7
+    assert report["operators_after"] == 3
+    assert sorted(r["kind"] for r in report["rewrites"]) == [
+        "dequantize_quantize",
+        "identity",
+        "reshape_chain",
+    ]
+    assert get_output_error(MODEL_FILE, cleaned_file) == (0, 0)
+
+    # Nothing left to clean
+    again = sr_cleanup_graph(cleaned_file, str(tmp_path / "again.tflite"))
+    assert not again["rewrites"]
+
+    compiles = compare_vela_compiles(redundant_file, cleaned_file, str(tmp_path))
+    assert compiles["after"]["cpu_operators"] == 0
+    assert compiles["after"]["npu_partitions"] == 1
+    assert compiles["after"]["cycles"] <= compiles["before"]["cycles"]
+
+    results = sr_model_compiler(
+        model_file=redundant_file,
+        output_dir=str(tmp_path / "compile"),
+        script=["model"],
+        graph_cleanup=True,
+    )
+    assert results["graph_cleanup"]["operators_after"] == 3
+    assert results["graph_cleanup"]["vela"] == compiles
+
+
+def test_graph_cleanup_fake_quant(tmp_path):
+    """A quantize/dequantize pair onto a coarser grid is kept"""
+
+    redundant_file = str(tmp_path / "hello_world.tflite")
+    write_redundant_model(redundant_file, fake_quant=True)
+
+    # Found safe without the reference interpreter check
+    report = sr_cleanup_graph(
+        redundant_file, str(tmp_path / "cleaned.tflite"), verify=False
+    )
+    assert report["operators_before"] == 9
+    assert report["operators_after"] == 7
+    assert sorted(r["kind"] for r in report["rewrites"]) == [
+        "identity",
+        "reshape_chain",
+    ]
+
+
+def test_compare_output():
+    """Float outputs are compared relatively, quantized ones in steps"""
+
+    softmax = np.float32([0.1, 0.2, 0.7])
+    assert compare_output(softmax, softmax + np.float32(1e-7))[1] <= 1.0
+    assert compare_output(softmax, np.float32([0.2, 0.2, 0.6]))[1] > 1.0
+    assert compare_output(np.int8([3, -4]), np.int8([4, -4])) == (1.0, 0.0)
+    assert compare_output(softmax, softmax[:2])[0] == float("inf")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Testing the analytical latency estimator against vela"""
+
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.latency_estimator import (
+    load_system_configs,
+    prune_estimates,
+    sr_estimate_latency,
+    sr_estimate_schedule_latency,
+    validate_estimates,
+)
+
+CONFIG_FILE = "src/sr_model_compiler/config/sr100_system_config.ini"
+
+
+def test_load_system_configs():
+    """Inherited sections carry the parent parameters"""
+
+    configs = load_system_configs(CONFIG_FILE)
+    flash = configs["sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"]
+    assert flash["core_clock"] == "400e6"
+    assert flash["Sram_clock_scale"] == "1.0"
+    assert flash["OffChipFlash_clock_scale"] == "0.1675"
+
+
+def test_latency_estimator(tmp_path):
+    """Estimates from one vela run match vela for the other configs"""
+
+    model = "tests/models/hello_world/hello_world.tflite"
+    sr_model_compiler(
+        model_file=model, output_dir=str(tmp_path / "base"), per_layer=True
+    )
+    estimates = sr_estimate_latency(str(tmp_path / "base"), CONFIG_FILE)
+    assert len(estimates) == len(load_system_configs(CONFIG_FILE))
+    assert estimates[0]["system_config"] == "sr100_npu_400MHz_all_vmem"
+
+    for v in validate_estimates(model, estimates, CONFIG_FILE, str(tmp_path)):
+        assert abs(v["error"]) < 5, v
+
+    # A faster flash clock only helps the layers reading from flash
+    faster = sr_estimate_latency(
+        str(tmp_path / "base"),
+        CONFIG_FILE,
+        ["sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"],
+        {"OffChipFlash_clock_scale": "0.5"},
+    )
+    flash66 = [
+        e
+        for e in estimates
+        if e["system_config"] == "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"
+    ]
+    assert faster[0]["cycles"] < flash66[0]["cycles"]
+
+    # The flash configs also change the read latency, which is not estimated
+    not_estimated = {e["system_config"]: e["not_estimated"] for e in estimates}
+    assert not_estimated["sr100_npu_400MHz_all_vmem"] == []
+    assert not_estimated["sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"] == [
+        "OffChipFlash_read_latency"
+    ]
+
+    pruned = prune_estimates(estimates, 0.0)
+    assert [e["system_config"] for e in pruned if not e["not_estimated"]] == [
+        "sr100_npu_400MHz_all_vmem"
+    ]
+    assert all(e in pruned for e in estimates if e["not_estimated"])
+
+
+def test_schedule_latency_estimator(tmp_path):
+    """One vela schedule follows the latencies of the other configs"""
+
+    model = "tests/models/hello_world/hello_world.tflite"
+    flash66 = "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"
+    estimates = sr_estimate_schedule_latency(
+        model, CONFIG_FILE, "sr100_npu_400MHz_all_vmem"
+    )
+    assert len(estimates) == len(load_system_configs(CONFIG_FILE))
+    assert all(not e["not_estimated"] for e in estimates)
+
+    for v in validate_estimates(model, estimates, CONFIG_FILE, str(tmp_path)):
+        assert abs(v["error"]) < 1, v
+
+    # A slower flash read latency costs cycles on the same schedule
+    slower = sr_estimate_schedule_latency(
+        model,
+        CONFIG_FILE,
+        "sr100_npu_400MHz_all_vmem",
+        [flash66],
+        {"OffChipFlash_read_latency": "512"},
+    )
+    assert (
+        slower[0]["cycles"]
+        > [e for e in estimates if e["system_config"] == flash66][0]["cycles"]
+    )
+
+    # Changing the memory ports needs another schedule
+    moved = sr_estimate_schedule_latency(
+        model,
+        CONFIG_FILE,
+        "sr100_npu_400MHz_all_vmem",
+        [flash66],
+        {"axi1_port": "OnChipFlash"},
+    )
+    assert moved[0]["not_estimated"] == ["axi1_port"]
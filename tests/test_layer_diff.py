@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Testing the layer level diff between two compilations"""
+
+import pytest
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.layer_diff import (
+    align_operators,
+    get_per_layer_log_report,
+    sr_diff_compiles,
+)
+from sr_model_compiler.perf_baseline import get_per_layer_report
+
+
+def test_layer_diff(tmp_path):
+    """Moving the weights to flash shows up on the layers that read them"""
+
+    model = "tests/models/hello_world/hello_world.tflite"
+    for name, system_config in [
+        ("vmem", "sr100_npu_400MHz_all_vmem"),
+        ("flash", "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"),
+    ]:
+        sr_model_compiler(
+            model_file=model,
+            output_dir=str(tmp_path / name),
+            system_config=system_config,
+            per_layer=True,
+        )
+
+    # The vela log holds the same table as the per layer CSV, rounded
+    from_log = get_per_layer_log_report(str(tmp_path / "flash/hello_world_vela.log"))
+    from_csv = get_per_layer_report(str(tmp_path / "flash/hello_world_per-layer.csv"))
+    assert [l["name"] for l in from_log] == [l["name"] for l in from_csv]
+    for log_layer, csv_layer in zip(from_log, from_csv):
+        assert abs(log_layer["cycles"] - csv_layer["cycles"]) <= 1
+
+    diff = sr_diff_compiles(str(tmp_path / "vmem"), str(tmp_path / "flash"))
+    assert [s["b"] for s in diff["settings"] if s["setting"] == "system_config"] == [
+        "sr100_npu_400MHz_tensor_vmem_weights_flash66MHz"
+    ]
+    assert len(diff["layers"]) == len(from_csv)
+    assert not any(layer["status"] for layer in diff["layers"])
+    assert diff["cycles_b"] - diff["cycles_a"] == pytest.approx(
+        sum(layer["cycles_delta"] for layer in diff["layers"])
+    )
+    impact = [abs(layer["cycles_delta"]) for layer in diff["layers"]]
+    assert impact == sorted(impact, reverse=True)
+
+
+def test_align_operators():
+    """Renamed layers pair by operator, the rest are added or removed"""
+
+    def layer(name, operator):
+        return {"name": name, "operator": operator}
+
+    pairs = align_operators(
+        [layer("a", "CONV_2D"), layer("b", "ADD"), layer("c", "MUL")],
+        [layer("a", "CONV_2D"), layer("b2", "ADD"), layer("d", "SOFTMAX")],
+    )
+    assert [(a and a["name"], b and b["name"]) for a, b in pairs] == [
+        ("a", "a"),
+        ("b", "b2"),
+        (None, "d"),
+        ("c", None),
+    ]
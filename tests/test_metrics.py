@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Testing the OpenMetrics exporter"""
+
+import struct
+import urllib.request
+import threading
+import pytest
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.metrics import serve_metrics, set_queue_depth
+
+
+def get_samples(text):
+    """Gets the sample values of an OpenMetrics text by name and labels"""
+
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def test_metrics(tmp_path):
+    """Compiles update the metrics file and the local endpoint serves it"""
+
+    metrics_file = str(tmp_path / "metrics" / "compile.prom")
+    for _ in range(2):
+        sr_model_compiler(
+            model_file="tests/models/hello_world/hello_world.tflite",
+            output_dir=str(tmp_path / "out"),
+            script=["model"],
+            metrics_file=metrics_file,
+        )
+    set_queue_depth(metrics_file, 3)
+
+    with open(metrics_file, "r", encoding="utf-8") as fp:
+        text = fp.read()
+    assert text.endswith("# EOF\n")
+    samples = get_samples(text)
+    assert samples['sr_compiles_total{model="hello_world"}'] == 2
+    assert 'sr_compile_failures_total{model="hello_world"}' not in samples
+    # The second compile finds vela up to date
+    assert samples['sr_stage_cache_hits_total{stage="vela"}'] == 1
+    assert samples['sr_stage_cache_hit_ratio{stage="vela"}'] == 0.5
+    assert samples['sr_stage_duration_seconds_count{stage="vela"}'] == 1
+    assert samples['sr_stage_duration_seconds_bucket{stage="vela",le="+Inf"}'] == 1
+    assert samples['sr_model_cycles_npu{model="hello_world"}'] > 0
+    assert samples["sr_compile_queue_depth"] == 3
+
+    server = serve_metrics(metrics_file, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url, timeout=10) as response:
+            assert "openmetrics-text" in response.headers["Content-Type"]
+            assert response.read().decode("utf-8") == text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_inference_cache(tmp_path):
+    """The reference inferences read from the cache are counted"""
+
+    metrics_file = str(tmp_path / "compile.prom")
+    for run in ["first", "second"]:
+        sr_model_compiler(
+            model_file="tests/models/hello_world/hello_world.tflite",
+            output_dir=str(tmp_path / run),
+            script=["model", "inout"],
+            cache_dir=str(tmp_path / "cache"),
+            metrics_file=metrics_file,
+        )
+
+    with open(metrics_file, "r", encoding="utf-8") as fp:
+        samples = get_samples(fp.read())
+    assert samples["sr_inference_cache_misses_total"] == 1
+    assert samples["sr_inference_cache_hits_total"] == 1
+    assert samples["sr_inference_cache_hit_ratio"] == 0.5
+
+
+def test_metrics_compile_error(tmp_path):
+    """A compile that raises is counted as a failure"""
+
+    model_file = tmp_path / "broken.tflite"
+    model_file.write_bytes(b"garbage")
+    metrics_file = str(tmp_path / "compile.prom")
+    with pytest.raises(struct.error):
+        sr_model_compiler(
+            model_file=str(model_file),
+            output_dir=str(tmp_path / "out"),
+            metrics_file=metrics_file,
+        )
+
+    with open(metrics_file, "r", encoding="utf-8") as fp:
+        samples = get_samples(fp.read())
+    assert samples['sr_compiles_total{model="broken"}'] == 1
+    assert samples['sr_compile_failures_total{model="broken"}'] == 1
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Testing the model metadata index sidecar"""
+
+import os
+import json
+import stat
+import shutil
+from sr_model_compiler.model_info import get_model_index_file, load_model_index
+
+
+def test_model_index(tmp_path):
+    """The index is written once and invalidated by the model content"""
+
+    model_file = str(tmp_path / "model.tflite")
+    shutil.copy("tests/models/hello_world/hello_world.tflite", model_file)
+
+    index = load_model_index(model_file)
+    index_file = get_model_index_file(model_file)
+    assert index_file == model_file + ".index.json"
+
+    # Shared caches need the usual mode, not the owner only one of mkstemp
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(index_file).st_mode) == 0o666 & ~umask
+
+    subgraph = index["subgraphs"][0]
+    assert index["operator_codes"] == ["FULLY_CONNECTED"]
+    assert subgraph["tensors"][subgraph["inputs"][0]]["shape"] == [1, 1]
+    assert subgraph["tensors"][subgraph["inputs"][0]]["dtype"] == "int8"
+
+    # A second load comes from the sidecar
+    with open(index_file, "r", encoding="utf-8") as fp:
+        data = json.load(fp)
+    data["operator_codes"] = ["FROM_SIDECAR"]
+    with open(index_file, "w", encoding="utf-8") as fp:
+        json.dump(data, fp)
+    assert load_model_index(model_file)["operator_codes"] == ["FROM_SIDECAR"]
+
+    # New model content parses the flatbuffer again
+    shutil.copy("tests/models/hello_world/hello_world_float.tflite", model_file)
+    index = load_model_index(model_file)
+    assert index["operator_codes"] == ["FULLY_CONNECTED"]
+    assert index["subgraphs"][0]["tensors"][0]["dtype"] == "float32"
+
+    # The sidecar can live in another directory
+    load_model_index(model_file, str(tmp_path / "index"))
+    assert (tmp_path / "index" / "model.tflite.index.json").exists()
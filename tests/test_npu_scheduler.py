@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Testing the multi model NPU scheduling simulator"""
+
+import pytest
+from sr_model_compiler import sr_check_model, sr_model_compiler
+from sr_model_compiler.npu_scheduler import (
+    get_memory_footprint,
+    get_schedule_model,
+    simulate_npu_schedule,
+)
+
+
+def get_model(name, inference_time, rate, priority, arena_size=400000):
+    """Gets a model with only the values the simulation reads"""
+
+    perf_data = {
+        "inference_time": inference_time,
+        "arena_cache_size": arena_size,
+        "weights_size": 500000,
+        "model_loc": "flash",
+        "flash_size": 500000,
+    }
+    return get_schedule_model(name, perf_data, rate, priority)
+
+
+def test_npu_schedule():
+    """Models within the NPU budget keep their rates, overloads drop frames"""
+
+    models = [
+        get_model("detection", 0.010, 30, 2),
+        get_model("pose", 0.040, 10, 1),
+    ]
+    schedule = simulate_npu_schedule(models)
+    assert schedule["schedulable"]
+    assert schedule["utilization"] == pytest.approx(0.7)
+    detection, pose = schedule["models"][0], schedule["models"][1]
+    assert detection["fps"] == 30 and pose["fps"] == 10
+    # Detection can wait for a pose inference that just started
+    assert 0.010 < detection["worst_latency"] <= 0.050
+    assert pose["worst_latency"] == pytest.approx(0.050)
+
+    overloaded = simulate_npu_schedule(
+        [get_model("detection", 0.030, 30, 2), get_model("pose", 0.080, 10, 1)]
+    )
+    assert not overloaded["schedulable"]
+    assert overloaded["utilization"] == pytest.approx(1.0, abs=0.05)
+    assert overloaded["models"][0]["fps"] > overloaded["models"][1]["fps"]
+
+    memory = get_memory_footprint(models, 1536000, 1536000)
+    assert memory["vmem_size"] == 800000 and memory["flash_size"] == 1000000
+    assert memory["fits"]
+    big = [get_model(f"m{i}", 0.01, 10, 0, 800000) for i in range(2)]
+    assert not get_memory_footprint(big, 1536000, 1536000)["fits"]
+    assert get_memory_footprint(big, 1536000, 1536000, shared_arena=True)["fits"]
+
+
+def test_npu_schedule_compiled(tmp_path):
+    """Compiled models feed the simulation"""
+
+    results = sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path),
+        script=["model"],
+    )
+    _, perf_data = sr_check_model(results)
+    model = get_schedule_model("hello_world", perf_data, 100)
+    schedule = simulate_npu_schedule([model], window=0.5)
+    assert schedule["models"][0]["completed"] == 50
+    assert schedule["models"][0]["worst_latency"] == pytest.approx(
+        perf_data["inference_time"]
+    )
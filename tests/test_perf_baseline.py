@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Testing the baseline performance regression gate"""
+
+import json
+import argparse
+from sr_model_compiler import sr_model_compiler, sr_check_model
+from sr_model_compiler.perf_baseline import (
+    compare_to_baseline,
+    load_baseline,
+    parse_thresholds,
+    run_baseline_gate,
+)
+
+
+def test_perf_baseline(tmp_path):
+    """The first run writes the baseline, later runs are gated on it"""
+
+    baseline_file = str(tmp_path / "baseline.json")
+    results = sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path / "out"),
+        per_layer=True,
+    )
+    assert results["per_layer"]
+    assert all(layer["name"] for layer in results["per_layer"])
+    assert sum(layer["cycles"] for layer in results["per_layer"]) > 0
+
+    _, perf_data = sr_check_model(results)
+    args = argparse.Namespace(
+        baseline=baseline_file,
+        update_baseline=False,
+        baseline_threshold=None,
+        baseline_layer_threshold=10.0,
+    )
+    assert run_baseline_gate(args, results, perf_data)
+    baseline = load_baseline(baseline_file)
+    assert baseline["metrics"]["cycles_npu"] == perf_data["cycles_npu"]
+    assert len(baseline["layers"]) == len(results["per_layer"])
+
+    # The same compile passes against its own baseline
+    assert run_baseline_gate(args, results, perf_data)
+
+    # A faster baseline makes this compile a regression
+    baseline["metrics"]["cycles_npu"] = perf_data["cycles_npu"] / 2
+    with open(baseline_file, "w", encoding="utf-8") as fp:
+        json.dump(baseline, fp)
+    assert not run_baseline_gate(args, results, perf_data)
+
+    # Unless the threshold allows it
+    args.baseline_threshold = ["cycles_npu=150"]
+    assert run_baseline_gate(args, results, perf_data)
+
+    # A slower layer is reported on its own
+    baseline["metrics"]["cycles_npu"] = perf_data["cycles_npu"]
+    slowest = max(results["per_layer"], key=lambda layer: layer["cycles"])
+    for layer in baseline["layers"]:
+        if layer["name"] == slowest["name"]:
+            layer["cycles"] = slowest["cycles"] / 2
+    report = compare_to_baseline(
+        baseline,
+        perf_data,
+        results["per_layer"],
+        parse_thresholds(["5"]),
+        min_layer_cycles=0,
+    )
+    assert report["regressed"]
+    assert [layer["name"] for layer in report["layers"]] == [slowest["name"]]
+    assert report["layers"][0]["percent"] == 100
+
+    # Updating the baseline accepts the current compile
+    args.update_baseline = True
+    assert run_baseline_gate(args, results, perf_data)
+    assert load_baseline(baseline_file)["layers"][0]["cycles"] > 0
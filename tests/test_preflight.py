@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Testing the preflight feasibility checks"""
+
+from sr_model_compiler import sr_preflight_check, sr100_model_optimizer
+
+
+def test_preflight_float_model():
+    """A float model has no operator vela can map"""
+
+    feasible, report = sr_preflight_check(
+        "tests/models/hello_world/hello_world_float.tflite"
+    )
+
+    assert feasible is False, "Float model passed the preflight check"
+    assert report["tensor_dtypes"] == {"float32": 10}
+    assert report["npu_operators"] == 0
+    assert len(report["cpu_operators"]) == 3
+    assert "no operator can be mapped to the NPU" in report["reasons"]
+
+
+def test_preflight_quantized_model():
+    """A quantized model passes and reports its sizes"""
+
+    model = "tests/models/uc_person_detection/person_detection_480x640.tflite"
+    feasible, report = sr_preflight_check(model, 1536000)
+
+    assert feasible is True, f"Rejected {model}: {report['reasons']}"
+    assert not report["cpu_operators"]
+    assert report["constant_bytes"] > 1000000
+    assert report["activation_lower_bound"] == 480 * 640 * 3
+
+    # The input image alone does not fit in a smaller vmem
+    feasible, report = sr_preflight_check(model, 800000)
+    assert feasible is False, "Input larger than vmem passed the preflight check"
+
+
+def test_optimizer_preflight_reject():
+    """The optimizer rejects a model without compiling it"""
+
+    success, results = sr100_model_optimizer(
+        model_file="tests/models/hello_world/hello_world_float.tflite"
+    )
+
+    assert success is False
+    assert results["cycles_npu"] == 0
+    assert results["preflight"]["reasons"], "Missing preflight reasons"
+
+
+def test_preflight_constants():
+    """Weights larger than their memory are only a warning, vela compresses them"""
+
+    model = "tests/models/uc_person_detection/person_detection_256x480.tflite"
+    feasible, report = sr_preflight_check(
+        model, 1536000, model_loc="lpmem", lpmem_size_limit=1536000
+    )
+    assert feasible is True, f"Rejected {model}: {report['reasons']}"
+    assert not report["warnings"]
+    assert 0 < report["npu_constant_bytes"] <= report["constant_bytes"]
+
+    feasible, report = sr_preflight_check(
+        model, 1536000, model_loc="lpmem", lpmem_size_limit=1000000
+    )
+    assert feasible is True, f"Rejected {model}: {report['reasons']}"
+    assert "lpmem limit is 1000000" in report["warnings"][0]
+
+    feasible, report = sr_preflight_check(model, 1100000, model_loc="vmem")
+    assert feasible is True, f"Rejected {model}: {report['reasons']}"
+    assert "vmem limit is 1100000" in report["warnings"][0]
+
+    # Flash has no limit
+    feasible, report = sr_preflight_check(model, 1536000, model_loc="flash")
+    assert feasible is True, f"Rejected {model}: {report['reasons']}"
+    assert not report["warnings"]
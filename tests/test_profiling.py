@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Testing the stage profiling"""
+
+import pstats
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.profiling import profile_stage
+
+
+def test_profile_stage(tmp_path):
+    """A stage allocating a large buffer shows it as the top allocation"""
+
+    profile = {"dir": str(tmp_path), "cpu": True, "memory": True, "stages": []}
+    result = profile_stage(profile, "alloc", lambda: (bytearray(1 << 22), []))
+    assert len(result[0]) == 1 << 22
+
+    entry = profile["stages"][0]
+    assert entry["peak_memory"] >= 1 << 22
+    assert entry["top_allocation"] >= 1 << 22
+    assert "test_profiling.py" in (tmp_path / "alloc_memory.txt").read_text()
+    assert pstats.Stats(entry["pstats"]).total_calls > 0
+
+
+def test_profile_compile(tmp_path, capsys):
+    """Every compile stage that runs writes its profiles"""
+
+    sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path),
+        script=["model"],
+        profile=True,
+        profile_memory=True,
+    )
+    for stage in ["vela", "resolver", "model"]:
+        assert pstats.Stats(str(tmp_path / "profile" / f"{stage}.pstats"))
+        assert (tmp_path / "profile" / f"{stage}_memory.txt").exists()
+    assert "++ Stage profiles in" in capsys.readouterr().out
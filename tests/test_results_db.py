@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Testing the compile results database"""
+
+from sr_model_compiler import sr_model_compiler
+from sr_model_compiler.results_db import (
+    compare_runs,
+    get_runs,
+    get_top_regressions,
+    get_trend,
+    open_results_db,
+    record_run,
+)
+
+
+def test_results_db(tmp_path):
+    """Compiles are recorded and queried for trends and regressions"""
+
+    db_path = str(tmp_path / "results.db")
+    model = "tests/models/hello_world/hello_world.tflite"
+    sr_model_compiler(
+        model_file=model,
+        output_dir=str(tmp_path / "out"),
+        results_db=db_path,
+        results_tag="baseline",
+    )
+
+    connection = open_results_db(db_path)
+    (run,) = get_runs(connection)
+    assert run["source"] == "compiler"
+    assert run["tag"] == "baseline"
+    assert run["model"] == "hello_world"
+    assert run["success"] == 1
+    assert run["cycles_npu"] > 0
+    assert run["vela_version"]
+    assert "vela" in run["stage_timings"]
+    connection.close()
+
+    # A later run of the same model gets slower
+    results = {"system_config": run["system_config"]}
+    for cycles in [2 * run["cycles_npu"], 3 * run["cycles_npu"]]:
+        record_run(db_path, "compiler", model, results, (True, {"cycles_npu": cycles}))
+    record_run(
+        db_path,
+        "compiler",
+        "tests/models/hello_world/hello_world_float.tflite",
+        results,
+        (True, {"cycles_npu": 100}),
+    )
+
+    connection = open_results_db(db_path)
+    trend = get_trend(connection, "hello_world")
+    assert [t["value"] for t in trend] == [
+        run["cycles_npu"],
+        2 * run["cycles_npu"],
+        3 * run["cycles_npu"],
+    ]
+
+    _, _, comparison = compare_runs(connection, trend[0]["id"], trend[2]["id"])
+    cycles = [c for c in comparison if c["metric"] == "cycles_npu"][0]
+    assert cycles["percent"] == 200
+
+    (regression,) = get_top_regressions(connection)
+    assert regression["model"] == "hello_world"
+    assert regression["percent"] == 50
+    connection.close()
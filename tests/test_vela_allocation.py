@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Testing the vela tensor allocation report"""
+
+import csv
+from sr_model_compiler import sr_check_model, sr_model_compiler
+from sr_model_compiler.vela_allocation import (
+    analyze_allocation,
+    parse_vela_allocation,
+)
+
+
+def test_vela_allocation(tmp_path):
+    """The peaks match vela and the table and timeline are written"""
+
+    results = sr_model_compiler(
+        model_file="tests/models/uc_person_classification/"
+        "person_classification_256x448.tflite",
+        output_dir=str(tmp_path),
+        script=["model"],
+        allocation_report="svg",
+    )
+
+    sections = parse_vela_allocation(results["vela_log"])
+    assert sections
+    for section in sections:
+        allocation = analyze_allocation(section)
+        assert allocation["peak_live_bytes"] == section["peak_tensor_size"]
+        assert allocation["memory_used"] == section["peak_memory_usage"]
+
+    arena = results["allocation"][0]
+    assert arena["mem_area"] == "Sram"
+    assert 0 <= arena["fragmentation"] < 1
+    assert arena["peak_tensors"][0]["size"] >= arena["peak_tensors"][-1]["size"]
+
+    prefix = tmp_path / "person_classification_256x448_allocation"
+    with open(f"{prefix}.csv", newline="", encoding="utf-8") as fp:
+        rows = list(csv.DictReader(fp))
+    assert len(rows) == sum(len(s["tensors"]) for s in sections)
+    assert (tmp_path / f"{prefix.name}.svg").read_text().startswith("<svg")
+
+    _, perf_data = sr_check_model(results)
+    assert perf_data["allocation"][0]["memory_used"] == arena["memory_used"]
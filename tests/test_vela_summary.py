@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Testing the vela summary aggregation"""
+
+import csv
+import glob
+import pytest
+from sr_model_compiler import sr_check_model, sr_model_compiler
+from sr_model_compiler.vela_summary import get_vela_summary, read_vela_summary_rows
+
+
+def test_vela_summary(tmp_path):
+    """Two subgraph rows add up and multi row summaries can be checked"""
+
+    results = sr_model_compiler(
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path / "out"),
+        script=["model"],
+    )
+    summary_file = glob.glob(str(tmp_path / "out" / "*_summary_*.csv"))[0]
+    (row,) = read_vela_summary_rows(summary_file)
+    assert "subgraphs" not in get_vela_summary(summary_file)
+
+    # A second subgraph with double the cycles and half the SRAM
+    second = dict(row)
+    for key in ["cycles_npu", "cycles_total", "inference_time"]:
+        second[key] = str(float(row[key]) * 2)
+    second["sram_memory_used"] = str(float(row["sram_memory_used"]) / 2)
+    multi_file = tmp_path / "multi_summary.csv"
+    with open(multi_file, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.DictWriter(fp, fieldnames=list(row))
+        writer.writeheader()
+        writer.writerows([row, second])
+
+    summary = get_vela_summary(str(multi_file))
+    assert summary["cycles_total"] == pytest.approx(float(row["cycles_total"]) * 3)
+    assert summary["inferences_per_second"] == pytest.approx(
+        1 / (float(row["inference_time"]) * 3)
+    )
+    assert summary["sram_memory_used"] == float(row["sram_memory_used"])
+    assert summary["off_chip_flash_memory_used"] == pytest.approx(
+        float(row["off_chip_flash_memory_used"]) * 2
+    )
+    assert summary["system_config"] == row["system_config"]
+
+    success, perf_data = sr_check_model(dict(results, **summary))
+    assert success
+    assert perf_data["cycles_npu"] == int(float(row["cycles_npu"]) * 3)
+    assert len(perf_data["subgraphs"]) == 2
+    assert get_vela_summary(str(tmp_path / "missing.csv")) == {"cycles_npu": 0}
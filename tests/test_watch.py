@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Testing the watch mode"""
+
+import os
+import threading
+from sr_model_compiler.sr_model_compiler import (
+    check_compile,
+    compiler_main,
+    get_args_from_call,
+    get_compiler_argparser,
+)
+from sr_model_compiler.watch import (
+    get_file_states,
+    get_perf_delta,
+    wait_for_change,
+    watch_compiler,
+)
+
+
+def test_perf_delta():
+    """The delta has the change and percentage of each value"""
+
+    delta = get_perf_delta(
+        {"cycles_npu": 200, "vmem_size": 1000, "flash_size": 0},
+        {"cycles_npu": 150, "vmem_size": 1000, "flash_size": 64},
+    )
+    assert delta["cycles_npu"]["change"] == -50
+    assert delta["cycles_npu"]["percent"] == -25
+    assert delta["vmem_size"]["change"] == 0
+    assert delta["flash_size"]["percent"] is None
+
+
+def test_watch(tmp_path, capsys):
+    """A changed input reruns only the affected stage and reports the delta"""
+
+    input_file = tmp_path / "input.bin"
+    input_file.write_bytes(bytes([16]))
+    args = get_args_from_call(
+        get_compiler_argparser(),
+        model_file="tests/models/hello_world/hello_world.tflite",
+        output_dir=str(tmp_path / "out"),
+        script=["model", "inout"],
+        input=[str(input_file)],
+        cache_dir=str(tmp_path / "cache"),
+        watch_interval=0.05,
+        watch_debounce=0.2,
+    )
+
+    compiled = threading.Event()
+
+    def compile_model(run_args):
+        try:
+            return check_compile(run_args, compiler_main(run_args))[:2]
+        finally:
+            compiled.set()
+
+    thread = threading.Thread(
+        target=watch_compiler,
+        args=(args, [args.model_file, *args.input], compile_model, 2),
+    )
+    thread.start()
+    assert compiled.wait(120)
+    capsys.readouterr()
+    input_file.write_bytes(bytes([32]))
+    thread.join(120)
+    assert not thread.is_alive()
+
+    out = capsys.readouterr().out
+    assert "++ Changed input.bin" in out
+    assert "++ Stage vela is up to date, skipping" in out
+    assert "++ Stage inout is up to date" not in out
+    assert "++ Changes since the previous compile" in out
+    assert "cycles_npu = 217 (unchanged)" in out
+
+
+def test_watch_deleted_file(tmp_path):
+    """A deleted file ends the wait instead of blocking it"""
+
+    watched = [str(tmp_path / "model.tflite"), str(tmp_path / "input.npy")]
+    for file_path in watched:
+        with open(file_path, "wb") as fp:
+            fp.write(b"data")
+    states = get_file_states(watched)
+    os.remove(watched[1])
+
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(wait_for_change(watched, states, 0.01, 0.05)),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(10)
+    assert result, "The watch blocked on the missing file"
+    changed, current = result[0]
+    assert changed == [watched[1]] and current[watched[1]] is None
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Testing the cross variant weight sharing"""
+
+from sr_model_compiler.weight_dedup import expand_weight_package, sr_dedup_weights
+
+variants = [
+    "tests/models/uc_person_classification/person_classification_256x448.bin",
+    "tests/models/uc_person_classification/person_classification_448x640.bin",
+]
+
+
+def test_weight_dedup(tmp_path):
+    """Resolution variants share weight blocks and unpack exactly"""
+
+    package_file = tmp_path / "weights.pkg"
+    report = sr_dedup_weights(variants, str(package_file))
+
+    assert report["variants"][0]["shared_bytes"] == 0
+    vga = report["variants"][1]
+    assert vga["weights_shared_bytes"] > vga["weights_size"] // 2
+    assert report["storage_saved_bytes"] > 500000
+    assert report["load_size"] == max(report["variants"][i]["size"] for i in [0, 1])
+    assert report["package_size"] == package_file.stat().st_size
+
+    models = expand_weight_package(package_file.read_bytes())
+    for model, variant in zip(models, variants):
+        with open(variant, "rb") as fp:
+            assert model == fp.read(), f"{variant} does not unpack"